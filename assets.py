@@ -0,0 +1,126 @@
+import gzip
+import hashlib
+import json
+import os
+import sys
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.staticfiles import StaticFiles
+
+try:
+    import brotli
+except ImportError:  # Optional, assets are only precompressed with gzip without it
+    brotli = None
+
+# Built assets go here under the static directory, with their manifest
+BUILD_DIRECTORY = "dist"
+MANIFEST = "manifest.json"
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Tried in order of preference when the client accepts them
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+
+
+def fingerprinted_name(name: str, content: bytes) -> str:
+    stem, extension = os.path.splitext(name)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:12]}{extension}"
+
+
+def _write(path: str, content: bytes) -> None:
+    # Through a temporary file, so a running server never sees half an asset
+    with open(path + ".tmp", "wb") as file:
+        file.write(content)
+    os.replace(path + ".tmp", path)
+
+
+def build_assets(static_directory: str = "static") -> dict[str, str]:
+    """
+    Copy every file in `static_directory` into its build directory under a name with a
+    hash of its content, next to .gz (and .br, with brotli installed) versions, and
+    write the manifest mapping original names to built ones. Builds no longer in the
+    manifest are removed.
+    """
+    output = os.path.join(static_directory, BUILD_DIRECTORY)
+    os.makedirs(output, exist_ok=True)
+    manifest = {}
+    for name in sorted(os.listdir(static_directory)):
+        path = os.path.join(static_directory, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as file:
+            content = file.read()
+        built = fingerprinted_name(name, content)
+        manifest[name] = built
+        built_path = os.path.join(output, built)
+        if os.path.exists(built_path):
+            continue
+        _write(built_path, content)
+        compressed = {".gz": gzip.compress(content, compresslevel=9, mtime=0)}
+        if brotli:
+            compressed[".br"] = brotli.compress(content, quality=11)
+        for suffix, body in compressed.items():
+            # Not worth sending a sibling that isn't smaller
+            if len(body) < len(content):
+                _write(built_path + suffix, body)
+
+    _write(os.path.join(output, MANIFEST), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    keep = {MANIFEST, *manifest.values()}
+    for name in os.listdir(output):
+        base = name.removesuffix(".gz").removesuffix(".br")
+        if base not in keep:
+            os.remove(os.path.join(output, name))
+    return manifest
+
+
+class Assets:
+    """
+    Resolves asset names to their fingerprinted URLs from the build manifest, for the
+    `asset_url` template helper. Without a build, falls back to the plain files.
+    """
+
+    def __init__(self, static_directory: str = "static", url_prefix: str = "/static"):
+        self.url_prefix = url_prefix
+        try:
+            with open(os.path.join(static_directory, BUILD_DIRECTORY, MANIFEST)) as file:
+                self.manifest = json.load(file)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def url(self, name: str) -> str:
+        built = self.manifest.get(name)
+        if built is None:
+            return f"{self.url_prefix}/{name}"
+        return f"{self.url_prefix}/{BUILD_DIRECTORY}/{built}"
+
+
+class AssetFiles(StaticFiles):
+    """
+    StaticFiles that serves built assets as immutable, and picks their precompressed
+    version when the client accepts it.
+    """
+
+    async def get_response(self, path: str, scope):
+        if not path.startswith(BUILD_DIRECTORY + "/") or path.endswith(MANIFEST):
+            return await super().get_response(path, scope)
+
+        accepted = Headers(scope=scope).get("accept-encoding", "")
+        for encoding, suffix in ENCODINGS:
+            if encoding not in accepted:
+                continue
+            full_path, stat_result = await anyio.to_thread.run_sync(self.lookup_path, path + suffix)
+            if stat_result is not None:
+                response = self.file_response(full_path, stat_result, scope)
+                # The type is still guessed from the name before the .gz/.br
+                response.headers["Content-Encoding"] = encoding
+                break
+        else:
+            response = await super().get_response(path, scope)
+        response.headers["Cache-Control"] = IMMUTABLE
+        response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+
+if __name__ == "__main__":
+    from cli import main
+
+    main(["build-assets", *sys.argv[1:]])
@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Scale presets, each can be overridden with --restaurants, --categories and --clicks
+SCALES = {
+    "small": {"restaurants": 1_000, "categories": 50, "clicks": 100_000},
+    "large": {"restaurants": 100_000, "categories": 300, "clicks": 10_000_000},
+}
+SCENARIOS = ("home", "categories", "menu", "suggestion", "login_flood", "mixed")
+# login_flood: / is timed while attackers cycle through these accounts from distinct addresses
+FLOOD_USERS = 50
+FLOOD_ATTACKERS = 20
+# mixed: reads and writes interleaved, while another process writes to the database every few milliseconds
+MIXED_WEIGHTS = {"api": 5, "menu": 3, "suggestion": 2}
+EXTERNAL_WRITE_INTERVAL = 0.005
+NAME_WORDS = ("Blue", "Golden", "Rusty", "Little", "Smoky", "River", "Mountain", "Lucky", "Corner", "Old Town", "Green", "Copper")
+NAME_KINDS = ("Grill", "Kitchen", "Diner", "Bistro", "Cafe", "Taqueria", "Pizzeria", "Smokehouse", "Noodle Bar", "Tavern")
+STREETS = ("Market St", "Broad St", "Main St", "Frazier Ave", "McCallie Ave", "Brainerd Rd", "Hixson Pike", "Cherokee Blvd")
+
+
+def build_database(path, restaurants, categories, clicks, seed):
+    """
+    Create a synthetic database at `path`: restaurants with 1-3 categories each, and clicks
+    spread over the last 90 days with a long-tailed popularity, rolled up like the app does.
+    The same arguments always produce the same data.
+    """
+    from sqlalchemy import create_engine, insert
+    from models import Base, Restaurant, Category, restaurant_category
+
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as connection:
+        connection.execute(insert(Category), [{"id": i, "name": f"Category {i}"} for i in range(1, categories + 1)])
+        connection.execute(insert(Restaurant), [
+            {
+                "id": i,
+                "source_id": f"bench-{i}",
+                "name": f"{rng.choice(NAME_WORDS)} {rng.choice(NAME_KINDS)} {i}",
+                "city": "Chattanooga",
+                "location": f"{rng.randint(1, 9999)} {rng.choice(STREETS)}",
+                "website": f"https://example.com/restaurants/{i}",
+                "latitude": 35.0456 + rng.uniform(-0.2, 0.2),
+                "longitude": -85.3097 + rng.uniform(-0.2, 0.2),
+            }
+            for i in range(1, restaurants + 1)
+        ])
+        connection.execute(insert(restaurant_category), [
+            {"restaurant_id": i, "category_id": category_id}
+            for i in range(1, restaurants + 1)
+            for category_id in rng.sample(range(1, categories + 1), rng.randint(1, min(3, categories)))
+        ])
+    engine.dispose()
+
+    # Clicks are generated in SQL, millions of rows are too slow to send from Python.
+    # The multiplicative hash keeps them deterministic, cubing it skews clicks toward low ids.
+    now = datetime.utcnow().replace(microsecond=0)
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("""
+            WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < :clicks)
+            INSERT INTO clicks (restaurant_id, timestamp)
+            SELECT 1 + CAST(:restaurants * (((i * 2654435761) % 4294967296) / 4294967296.0) * (((i * 2654435761) % 4294967296) / 4294967296.0) * (((i * 2654435761) % 4294967296) / 4294967296.0) AS INTEGER),
+                   datetime(:now, '-' || ((i * 7919) % 7776000) || ' seconds') || '.000000'
+            FROM n
+        """, {"clicks": clicks, "restaurants": restaurants, "now": now.isoformat(" ")})
+        connection.execute("""
+            UPDATE restaurants SET click_count = counts.clicks
+            FROM (SELECT restaurant_id, count(*) AS clicks FROM clicks GROUP BY restaurant_id) AS counts
+            WHERE restaurants.id = counts.restaurant_id
+        """)
+        connection.execute("""
+            INSERT INTO click_rollups (restaurant_id, period, bucket, clicks)
+            SELECT restaurant_id, 'hour', strftime('%Y-%m-%d %H:00:00.000000', timestamp), count(*)
+            FROM clicks WHERE timestamp >= :cutoff GROUP BY 1, 3
+        """, {"cutoff": (now - timedelta(days=14)).isoformat(" ")})
+        connection.execute("""
+            INSERT INTO click_rollups (restaurant_id, period, bucket, clicks)
+            SELECT restaurant_id, 'day', strftime('%Y-%m-%d 00:00:00.000000', timestamp), count(*)
+            FROM clicks WHERE timestamp < :cutoff GROUP BY 1, 3
+        """, {"cutoff": (now - timedelta(days=14)).strftime("%Y-%m-%d 00:00:00")})
+        connection.execute("ANALYZE")
+    connection.close()
+
+
+def make_request(scenario, rng, config):
+    """
+    (method, url, form data) for one request of a scenario.
+    """
+    if scenario in ("home", "login_flood"):
+        return "GET", "/", None
+    if scenario == "mixed":
+        scenario = rng.choices(list(MIXED_WEIGHTS), weights=list(MIXED_WEIGHTS.values()))[0]
+    if scenario == "api":
+        return "GET", "/api/restaurants?limit=20", None
+    if scenario == "categories":
+        picked = rng.sample(range(1, config["categories"] + 1), min(2, config["categories"]))
+        query = "&".join(f"categories=Category+{category_id}" for category_id in picked)
+        return "GET", f"/?{query}", None
+    if scenario == "menu":
+        return "GET", f"/restaurants/{rng.randint(1, config['restaurants'])}/menu", None
+    if scenario == "suggestion":
+        return "POST", "/suggestion", {"suggestion": f"Benchmark suggestion {rng.randint(1, 1_000_000)}"}
+    raise ValueError(f"Unknown scenario {scenario}")
+
+
+def summarize(latencies, errors, elapsed):
+    latencies_ms = sorted(latency * 1000 for latency in latencies)
+    percentiles = statistics.quantiles(latencies_ms, n=100, method="inclusive")
+    return {
+        "requests": len(latencies_ms),
+        "errors": errors,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies_ms) / elapsed, 1),
+        "mean_ms": round(statistics.fmean(latencies_ms), 2),
+        "p50_ms": round(percentiles[49], 2),
+        "p99_ms": round(percentiles[98], 2),
+        "max_ms": round(latencies_ms[-1], 2),
+    }
+
+
+async def run_scenario(app, scenario, config, requests, concurrency, warmup, seed):
+    """
+    Send `requests` requests from `concurrency` simulated users, each with its own client
+    and cookies, after `warmup` untimed requests.
+    """
+    import httpx
+
+    # Failures are counted as errors rather than raised
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+    remaining = warmup + requests
+    timed_start = None
+
+    async def user():
+        nonlocal remaining, errors, timed_start
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            while remaining > 0:
+                remaining -= 1
+                timed = remaining < requests
+                method, url, data = make_request(scenario, rng, config)
+                start = time.perf_counter()
+                if timed and timed_start is None:
+                    timed_start = start
+                response = await client.request(method, url, data=data)
+                latency = time.perf_counter() - start
+                if timed:
+                    latencies.append(latency)
+                    # Every scenario answers with a page or a redirect
+                    if response.status_code >= 400:
+                        errors += 1
+
+    attempts = {}
+    flooding = scenario == "login_flood"
+
+    async def attacker(number):
+        attacker_rng = random.Random(seed + number)
+        while flooding:
+            address = f"10.{number}.{attacker_rng.randint(0, 255)}.{attacker_rng.randint(1, 254)}"
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app, raise_app_exceptions=False, client=(address, 4000)), base_url="http://bench") as client:
+                response = await client.post("/login", data={"username": f"flood-{attacker_rng.randrange(FLOOD_USERS)}", "password": "wrong"})
+            attempts[response.status_code] = attempts.get(response.status_code, 0) + 1
+
+    external = ExternalWriter(os.environ["DATABASE_URL"].removeprefix("sqlite:///")) if scenario == "mixed" else None
+    attackers = [asyncio.create_task(attacker(number)) for number in range(FLOOD_ATTACKERS)] if flooding else []
+    if external:
+        external.start()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - timed_start
+    flooding = False
+    await asyncio.gather(*attackers)
+    result = summarize(latencies, errors, elapsed)
+    if attempts:
+        result["login_attempts"] = {str(status): count for status, count in sorted(attempts.items())}
+    if external:
+        external.stop()
+        result["external_writes"] = external.writes
+        result["external_write_errors"] = external.errors
+    return result
+
+
+class ExternalWriter(threading.Thread):
+    """
+    Stands in for a script (an import, a category merge) writing from another process:
+    its own connection with default settings, committing a small write every interval.
+    """
+
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.writes = 0
+        self.errors = 0
+        self._stopping = threading.Event()
+
+    def run(self):
+        connection = sqlite3.connect(self.path)
+        while not self._stopping.wait(EXTERNAL_WRITE_INTERVAL):
+            try:
+                with connection:
+                    connection.execute("INSERT INTO suggested_changes (suggestion, handled) VALUES ('external write', 0)")
+                self.writes += 1
+            except sqlite3.OperationalError:
+                self.errors += 1
+        connection.close()
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+
+def create_flood_users():
+    """
+    Accounts for the login flood to guess at, sharing one hash since bcrypt is slow on purpose.
+    """
+    import main
+
+    with main.SessionLocal() as db:
+        if db.query(main.User).filter(main.User.username.like("flood-%")).count():
+            return
+        hashed_password = main.pwd_context.hash("correct horse battery staple")
+        db.add_all(main.User(username=f"flood-{number}", hashed_password=hashed_password) for number in range(FLOOD_USERS))
+        db.commit()
+
+
+async def run_benchmark(scenarios, config, requests, concurrency, warmup, seed):
+    import main
+
+    app = main.create_app()
+    if "login_flood" in scenarios:
+        create_flood_users()
+    results = {}
+    async with app.router.lifespan_context(app):
+        for scenario in scenarios:
+            results[scenario] = await run_scenario(app, scenario, config, requests, concurrency, warmup, seed)
+            print(f"{scenario}: {results[scenario]}", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Print how each scenario moved relative to a previous run.
+    """
+    print(f"\nCompared with {baseline.get('commit')}:", file=sys.stderr)
+    for scenario, current in results["scenarios"].items():
+        previous = baseline["scenarios"].get(scenario)
+        if not previous:
+            continue
+        changes = ", ".join(
+            f"{metric} {previous[metric]} -> {current[metric]} ({(current[metric] / previous[metric] - 1) * 100:+.0f}%)"
+            for metric in ("throughput_rps", "p50_ms", "p99_ms")
+            if previous[metric]
+        )
+        print(f"  {scenario}: {changes}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the hot routes in-process against a synthetic database. Needs requirements-dev.txt installed.")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--restaurants", type=int)
+    parser.add_argument("--categories", type=int)
+    parser.add_argument("--clicks", type=int)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="Timed requests per scenario.")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--database", help="Database file, built if missing. Defaults to one per scale in the temp directory.")
+    parser.add_argument("--output", help="Write the JSON results here instead of stdout.")
+    parser.add_argument("--compare", help="Previous results file to compare against.")
+    args = parser.parse_args()
+
+    config = dict(SCALES[args.scale])
+    for key in config:
+        if getattr(args, key) is not None:
+            config[key] = getattr(args, key)
+    database = args.database or os.path.join(
+        tempfile.gettempdir(), f"local_menu_bench_{config['restaurants']}_{config['categories']}_{config['clicks']}_{args.seed}.db"
+    )
+
+    # Scenarios write clicks and suggestions, so every run uses a copy of the built database.
+    # The app binds its engines on import, so point it at the copy before anything imports it.
+    with tempfile.TemporaryDirectory() as run_directory:
+        run_database = os.path.join(run_directory, "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{run_database}"
+        os.environ["SECRET_KEY"] = os.environ.get("SECRET_KEY") or "bench"
+
+        if not os.path.exists(database):
+            print(f"Building {database}...", file=sys.stderr)
+            start = time.perf_counter()
+            build_database(database, config["restaurants"], config["categories"], config["clicks"], args.seed)
+            print(f"Built in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+        source, target = sqlite3.connect(database), sqlite3.connect(run_database)
+        source.backup(target)
+        source.close()
+        target.close()
+        scenarios = asyncio.run(run_benchmark(args.scenarios, config, args.requests, args.concurrency, args.warmup, args.seed))
+
+    results = {
+        "commit": git_commit(),
+        "date": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "config": {**config, "requests": args.requests, "concurrency": args.concurrency, "warmup": args.warmup, "seed": args.seed},
+        "scenarios": scenarios,
+    }
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as file:
+            compare(results, json.load(file))
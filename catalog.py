@@ -0,0 +1,56 @@
+import asyncio
+import math
+import time
+
+from sqlalchemy import text
+
+_BUMP = text("""
+    INSERT INTO catalog_version (id, version) VALUES (1, 1)
+    ON CONFLICT (id) DO UPDATE SET version = version + 1
+    RETURNING version
+""")
+
+
+def bump_catalog_version(connection) -> int:
+    """
+    Count a restaurant or category edit, for the processes serving pages to notice. Call
+    it in the transaction making the edit, so the version moves if, and when, it commits.
+    Returns the new version.
+    """
+    return connection.execute(_BUMP).scalar_one()
+
+
+class CatalogWatcher:
+    """
+    Notices catalog edits committed by other processes, such as an import or a category
+    merge run from the command line. `check` awaits `load` for the shared version at most
+    once per `interval` seconds and calls `on_change` when it moved.
+    """
+
+    def __init__(self, load, on_change, interval: float = 1.0):
+        self.load = load
+        self.on_change = on_change
+        self.interval = interval
+        self.version: int | None = None
+        self._checked_at = -math.inf
+        self._lock = asyncio.Lock()
+
+    def seen(self, version: int) -> None:
+        """
+        This process committed `version` and has already acted on it. If that was the only
+        change since the last check, the next check has nothing to do.
+        """
+        if self.version == version - 1:
+            self.version = version
+
+    async def check(self) -> None:
+        if time.monotonic() - self._checked_at < self.interval:
+            return
+        async with self._lock:
+            if time.monotonic() - self._checked_at < self.interval:
+                return
+            self._checked_at = time.monotonic()
+            version = await self.load()
+            if self.version is not None and version != self.version:
+                self.on_change()
+            self.version = version
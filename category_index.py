@@ -0,0 +1,99 @@
+import asyncio
+import re
+import time
+from collections import defaultdict
+from functools import reduce
+from itertools import compress
+from operator import and_, or_
+
+# Translate between the characters of a binary string and 0/1 flag bytes
+_BITS = bytes.maketrans(b"01", b"\x00\x01")
+_DIGITS = bytes.maketrans(b"\x00\x01", b"01")
+_SET_BIT = re.compile("1")
+
+
+class CategoryIndex:
+    """
+    In-memory bitmap index from category name, and price level, to the restaurants in it.
+
+    Bit i of every bitset is the restaurant at position i of `order`, the
+    precomputed ranking by popularity or by score, so combining categories is a
+    handful of integer AND/OR operations and the matching ids come out already ranked.
+    """
+
+    def __init__(self, load, popularity_refresh: float = 60.0):
+        self.load = load
+        self.popularity_refresh = popularity_refresh
+        self.order: list[int] = []
+        self._bits: dict[str, int] = {}
+        self._price_bits: dict[int, int] = {}
+        self._catalog_stale = True
+        self._popularity_stale = False
+        self._built_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def mark_catalog_changed(self) -> None:
+        """
+        Restaurants or categories were edited, rebuild before the next lookup.
+        """
+        self._catalog_stale = True
+
+    def mark_popularity_changed(self) -> None:
+        """
+        Click counts moved, re-rank at most once every `popularity_refresh` seconds.
+        """
+        self._popularity_stale = True
+
+    @property
+    def needs_rebuild(self) -> bool:
+        if self._catalog_stale:
+            return True
+        return self._popularity_stale and time.monotonic() - self._built_at >= self.popularity_refresh
+
+    async def refresh(self) -> None:
+        """
+        Rebuild if stale. `load` is awaited for restaurant ids in ranking order,
+        (restaurant_id, category_name) pairs and (restaurant_id, price) pairs.
+        """
+        if not self.needs_rebuild:
+            return
+        async with self._lock:
+            if not self.needs_rebuild:
+                return
+            # Clear the flags before loading so edits made while loading trigger another rebuild
+            self._catalog_stale = self._popularity_stale = False
+            self.rebuild(*await self.load())
+
+    def rebuild(self, order: list[int], memberships, prices=()) -> None:
+        position = {restaurant_id: i for i, restaurant_id in enumerate(order)}
+        self._bits = self._bitsets(position, memberships)
+        self._price_bits = self._bitsets(position, prices)
+        self.order = order
+        self._built_at = time.monotonic()
+
+    @staticmethod
+    def _bitsets(position, memberships) -> dict:
+        flags = defaultdict(lambda: bytearray(len(position)))
+        for restaurant_id, name in memberships:
+            i = position.get(restaurant_id)
+            if i is not None:
+                flags[name][i] = 1
+        # Flag i becomes bit i: reverse the digits so the first restaurant is the low bit
+        return {name: int(f.translate(_DIGITS)[::-1], 2) for name, f in flags.items()}
+
+    def filter(self, categories: list[str], match_all: bool = False, prices=None) -> list[int]:
+        """
+        Restaurant ids in any (or, with match_all, every) one of `categories`, or all of them
+        when there are none, at one of the `prices` levels if given, in ranking order.
+        """
+        if categories:
+            mask = reduce(and_ if match_all else or_, (self._bits.get(name, 0) for name in categories))
+        else:
+            mask = (1 << len(self.order)) - 1
+        if prices is not None:
+            mask &= reduce(or_, (self._price_bits.get(level, 0) for level in prices), 0)
+        digits = bin(mask)[:1:-1]
+        # Sparse results are cheaper to find bit by bit, dense ones to sweep in a single pass
+        if mask.bit_count() < len(self.order) // 10:
+            return [self.order[match.start()] for match in _SET_BIT.finditer(digits)]
+        return list(compress(self.order, digits.encode().translate(_BITS)))
@@ -0,0 +1,84 @@
+import asyncio
+import re
+from collections import OrderedDict
+
+
+def city_slug(name: str) -> str:
+    """
+    The URL segment for a city, "St. Louis" becomes "st-louis".
+    """
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+class CityDirectory:
+    """
+    The cities that have restaurants, by slug, for resolving city URLs.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self.names: list[str] = []
+        self._by_slug: dict[str, str] = {}
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def mark_catalog_changed(self) -> None:
+        self._stale = True
+
+    async def refresh(self) -> None:
+        """
+        Reload if stale. `load` is awaited for the distinct city names.
+        """
+        if not self._stale:
+            return
+        async with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            self.rebuild(await self.load())
+
+    def rebuild(self, names) -> None:
+        self.names = sorted(name for name in names if name)
+        self._by_slug = {city_slug(name): name for name in self.names}
+
+    def resolve(self, slug: str) -> str | None:
+        return self._by_slug.get(slug)
+
+    def __contains__(self, name: str) -> bool:
+        return self._by_slug.get(city_slug(name)) == name
+
+
+class CityRegistry:
+    """
+    Per-city in-memory structures, made by `factory(city)` the first time a city is
+    used. Past `max_cities`, the least recently used city is dropped and rebuilt from
+    scratch if it comes back, so cities are loaded and evicted independently and each
+    one's structures only ever hold its own restaurants.
+    """
+
+    def __init__(self, factory, max_cities: int = 32):
+        self.factory = factory
+        self.max_cities = max_cities
+        self._cities: OrderedDict[str | None, object] = OrderedDict()
+
+    def get(self, city: str | None):
+        entry = self._cities.get(city)
+        if entry is None:
+            entry = self._cities[city] = self.factory(city)
+            while len(self._cities) > self.max_cities:
+                self._cities.popitem(last=False)
+        else:
+            self._cities.move_to_end(city)
+        return entry
+
+    def loaded(self, city: str | None):
+        """
+        A city's structures if they are loaded, without loading them.
+        """
+        return self._cities.get(city)
+
+    def items(self) -> list[tuple[str | None, object]]:
+        return list(self._cities.items())
+
+    def __len__(self) -> int:
+        return len(self._cities)
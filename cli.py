@@ -0,0 +1,113 @@
+import argparse
+import sys
+
+
+# Each command imports what it needs when it runs, so `--help` or a cron job only
+# pays for its own dependencies and never loads the web app.
+
+def seed(args):
+    from seed_db import seed_database
+
+    seed_database(args.json_file_path, city=args.city, skip_duplicates=not args.keep_duplicates)
+
+
+def merge_categories(args):
+    from merge_cats import merge_categories
+
+    merge_categories(dry_run=args.dry_run)
+
+
+def verify_urls(args):
+    from verify_urls import verify_restaurant_websites
+
+    verify_restaurant_websites()
+
+
+def make_user(args):
+    from make_user import promote_user_to_admin
+    from db import SessionLocal
+
+    with SessionLocal() as session:
+        promote_user_to_admin(args.username, args.password, session)
+
+
+def find_duplicates(args):
+    from find_duplicates import find_duplicate_restaurants
+
+    find_duplicate_restaurants(city=args.city, merge=args.merge)
+
+
+def prune_clicks(args):
+    from prune_clicks import prune_clicks
+
+    prune_clicks()
+
+
+def rescore(args):
+    from scoring import rescore
+    from catalog import bump_catalog_version
+    from db import engine
+
+    with engine.begin() as connection:
+        print(f"Rescored {rescore(connection)} restaurants.")
+        bump_catalog_version(connection)
+
+
+def build_assets(args):
+    from assets import BUILD_DIRECTORY, build_assets
+
+    for name, built in build_assets(args.static_directory).items():
+        print(f"{name} -> {BUILD_DIRECTORY}/{built}")
+
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Maintenance commands for the restaurant list.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("seed", help="Import restaurants from a listing feed.")
+    command.add_argument("json_file_path", nargs="?", default="restaurants.json", help="Feed to import, .json listing or .jsonl.")
+    command.add_argument("--city", required=True, help="City the feed's restaurants are in, e.g. Chattanooga.")
+    command.add_argument("--keep-duplicates", action="store_true", help="Insert new restaurants even if they look like one already imported.")
+    command.set_defaults(run=seed)
+
+    command = commands.add_parser("merge-categories", help="Merge categories into their merged groups.")
+    command.add_argument("--dry-run", action="store_true", help="Report row counts without changing anything.")
+    command.set_defaults(run=merge_categories)
+
+    command = commands.add_parser("verify-urls", help="Check restaurant websites that haven't been verified recently.")
+    command.set_defaults(run=verify_urls)
+
+    command = commands.add_parser("make-user", help="Promote or create an admin user.")
+    command.add_argument("username", type=str, help="The username of the admin user.")
+    command.add_argument("password", type=str, help="The password for the admin user.")
+    command.set_defaults(run=make_user)
+
+    command = commands.add_parser("find-duplicates", help="Report restaurants listed more than once, and optionally merge them.")
+    command.add_argument("--city", help="Only look in this city.")
+    command.add_argument("--merge", action="store_true", help="Merge each group into its most clicked restaurant.")
+    command.set_defaults(run=find_duplicates)
+
+    command = commands.add_parser("prune-clicks", help="Fold old click rollups into days and drop expired clicks.")
+    command.set_defaults(run=prune_clicks)
+
+    command = commands.add_parser("rescore", help="Recompute every restaurant's score, after changing the SCORE_ weights.")
+    command.set_defaults(run=rescore)
+
+    command = commands.add_parser("build-assets", help="Fingerprint and precompress static assets.")
+    command.add_argument("static_directory", nargs="?", default="static")
+    command.set_defaults(run=build_assets, uses_database=False)
+    return parser
+
+
+def main(argv=None):
+    args = parser().parse_args(argv)
+    if getattr(args, "uses_database", True):
+        from db import create_tables
+
+        # A fresh database gets its tables here rather than whenever a script is imported
+        create_tables()
+    args.run(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,107 @@
+import asyncio
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+class ClickBuffer:
+    """
+    Write-behind buffer for menu clicks.
+
+    Routes push clicks onto a bounded in-process queue and return immediately.
+    A background task hands them to `flush` in batches, either once `max_batch`
+    clicks are pending or every `flush_interval` seconds, so the database write
+    lock is taken once per batch instead of once per click. `flush` is a
+    coroutine function awaited with each batch, and must write all of it or
+    nothing: a batch that fails is kept and retried, backing off from
+    `retry_delay` up to `max_retry_delay` seconds.
+    """
+
+    def __init__(self, flush, max_batch: int = 500, flush_interval: float = 1.0, max_pending: int = 10_000,
+                 retry_delay: float = 1.0, max_retry_delay: float = 60.0):
+        self.flush = flush
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        # Clicks turned away because the queue was full, while writes are failing or stalled
+        self.dropped = 0
+        self._failed: list = []
+        self._backoff = 0.0
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_pending)
+        self._full = asyncio.Event()
+        self._stopping = False
+        self._task: asyncio.Task | None = None
+
+    async def record(self, restaurant_id: int) -> bool:
+        """
+        Queue a click, never waiting. When the queue is full the click is counted
+        in `dropped` and False returned, so a stalled writer can't hold up requests.
+        """
+        try:
+            self._queue.put_nowait((restaurant_id, datetime.utcnow()))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        if self._queue.qsize() >= self.max_batch:
+            self._full.set()
+        return True
+
+    def pending(self) -> int:
+        return self._queue.qsize() + len(self._failed)
+
+    def start(self) -> None:
+        if self._task is None:
+            # Bind fresh primitives to the running loop, the app may be restarted on a new one
+            self._queue = asyncio.Queue(maxsize=self.max_pending)
+            self._full = asyncio.Event()
+            self._stopping = False
+            self._backoff = 0.0
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the flusher after writing out everything still queued.
+        """
+        if self._task is None:
+            return
+        self._stopping = True
+        self._full.set()
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        while not self._stopping:
+            try:
+                # While writes are failing, wait out the backoff before trying again
+                await asyncio.wait_for(self._full.wait(), max(self.flush_interval, self._backoff))
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            await self._drain()
+        if not await self._drain():
+            logger.error("Dropping %d clicks that could not be written before stopping", self.pending())
+            self._failed = []
+
+    async def _drain(self) -> bool:
+        """
+        Flush everything queued, starting with a batch that failed before. Stops at
+        the first failure, keeping that batch for the next attempt. Returns whether
+        everything was written.
+        """
+        while self._failed or not self._queue.empty():
+            batch, self._failed = self._failed, []
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self.flush(batch)
+            except Exception:
+                self._failed = batch
+                self._backoff = min(self.max_retry_delay, self._backoff * 2 or self.retry_delay)
+                logger.exception("Failed to write %d clicks, retrying in %.0fs", len(batch), self._backoff)
+                return False
+            self._failed = []
+            self._backoff = 0.0
+        return True
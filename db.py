@@ -0,0 +1,28 @@
+import os
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+from models import Base
+from scoring import register_score_function
+from storage import StorageProfile, configure_sqlite
+
+load_dotenv()
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./restaurants.db")
+storage_profile = StorageProfile.from_env()
+# The sync engine is the writer: one connection, shared by the app's admin and serial writer, or by a script
+engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, pool_size=1, max_overflow=0)
+configure_sqlite(engine, storage_profile)
+if engine.dialect.name == "sqlite":
+    # Writes keep restaurants.score current with restaurant_score() in SQL
+    event.listen(engine, "connect", register_score_function)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def create_tables():
+    """
+    Create any missing tables, and the search index with them.
+    """
+    Base.metadata.create_all(bind=engine)
@@ -0,0 +1,221 @@
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+
+from sqlalchemy import text
+
+from geo import chord_to_km, to_unit_vector
+from scoring import SCORE
+
+# Words that say nothing about which restaurant a name is
+NAME_STOP_WORDS = {"the", "and", "restaurant", "llc", "inc"}
+ADDRESS_ABBREVIATIONS = {
+    "street": "st", "avenue": "ave", "road": "rd", "boulevard": "blvd", "drive": "dr", "lane": "ln",
+    "highway": "hwy", "parkway": "pkwy", "place": "pl", "court": "ct", "circle": "cir", "pike": "pk",
+    "north": "n", "south": "s", "east": "e", "west": "w", "suite": "ste", "unit": "ste",
+}
+# Grid cells of about 100m, restaurants are only compared with those in the same or a neighbouring cell
+CELL_DEGREES = 0.001
+# Restaurants closer than this with similar names are the same place
+SAME_PLACE_KM = 0.15
+NAME_SIMILARITY = 0.8
+# A block stops growing past this, so a food court or a placeholder coordinate
+# shared by many restaurants doesn't turn into an all-pairs comparison
+MAX_BLOCK = 100
+
+
+def _words(value: str | None) -> list[str]:
+    value = unicodedata.normalize("NFKD", value or "").encode("ascii", "ignore").decode().lower()
+    return re.findall(r"[a-z0-9]+", value.replace("'", ""))
+
+
+def normalize_name(name: str | None) -> str:
+    return " ".join(word for word in _words(name) if word not in NAME_STOP_WORDS)
+
+
+def normalize_address(location: str | None) -> str:
+    """
+    The street address with common words abbreviated and any suite dropped,
+    "123 Main Street, Suite 4" becomes "123 main st".
+    """
+    words = [ADDRESS_ABBREVIATIONS.get(word, word) for word in _words(location)]
+    if "ste" in words:
+        words = words[:words.index("ste")]
+    return " ".join(words)
+
+
+class DuplicateIndex:
+    """
+    Restaurants added so far, blocked by grid cell and by house number and street, so
+    `match` only compares a restaurant with the few that could be the same place.
+    """
+
+    def __init__(self):
+        self._blocks: dict[tuple, list] = defaultdict(list)
+
+    def _prepare(self, name, location, latitude, longitude):
+        address = normalize_address(location)
+        words = address.split()
+        street = ("address", *words[:2]) if len(words) >= 2 and words[0].isdigit() else None
+        has_point = latitude is not None and longitude is not None
+        cell = (math.floor(latitude / CELL_DEGREES), math.floor(longitude / CELL_DEGREES)) if has_point else None
+        point = to_unit_vector(latitude, longitude) if has_point else None
+        normalized = normalize_name(name)
+        return normalized, re.findall(r"\d+", normalized), address, street, cell, point
+
+    def add(self, key, name, location, latitude, longitude) -> None:
+        self._add(key, self._prepare(name, location, latitude, longitude))
+
+    def _add(self, key, prepared) -> None:
+        normalized, _, _, street, cell, _ = prepared
+        if not normalized:
+            return
+        for block in ([("cell", *cell)] if cell else []) + ([street] if street else []):
+            if len(self._blocks[block]) < MAX_BLOCK:
+                self._blocks[block].append((key, *prepared))
+
+    def match(self, name, location, latitude, longitude):
+        """
+        Key of the added restaurant most likely to be this one, or None if none is.
+        """
+        return self._match(self._prepare(name, location, latitude, longitude))
+
+    def match_or_add(self, key, name, location, latitude, longitude):
+        """
+        Like match, but a restaurant that matches nothing is added under `key`.
+        """
+        prepared = self._prepare(name, location, latitude, longitude)
+        match = self._match(prepared)
+        if match is None:
+            self._add(key, prepared)
+        return match
+
+    def _match(self, prepared):
+        normalized, numbers, address, street, cell, point = prepared
+        if not normalized:
+            return None
+        candidates = {}
+        if cell:
+            for dx in (-1, 0, 1):
+                for dy in (-1, 0, 1):
+                    for entry in self._blocks.get(("cell", cell[0] + dx, cell[1] + dy), ()):
+                        candidates[id(entry)] = entry
+        if street:
+            for entry in self._blocks.get(street, ()):
+                candidates[id(entry)] = entry
+
+        best, best_similarity = None, NAME_SIMILARITY
+        # Compared with each candidate in turn, the cheap upper bounds rule most of them out
+        matcher = SequenceMatcher(None, b=normalized, autojunk=False)
+        for key, other_name, other_numbers, other_address, other_street, _, other_point in candidates.values():
+            # "Station 2" and "Station 12" are spelled alike but are different restaurants
+            if numbers != other_numbers:
+                continue
+            # Branches can be listed with the same coordinates, but not the same house number
+            if street and other_street and street[1] != other_street[1]:
+                continue
+            if point and other_point:
+                same_place = chord_to_km(math.dist(point, other_point)) <= SAME_PLACE_KM
+            else:
+                same_place = address == other_address
+            if not same_place:
+                continue
+            matcher.set_seq1(other_name)
+            if matcher.real_quick_ratio() < best_similarity or matcher.quick_ratio() < best_similarity:
+                continue
+            similarity = matcher.ratio()
+            if similarity >= best_similarity:
+                best, best_similarity = key, similarity
+        return best
+
+
+def find_duplicates(places) -> list[list]:
+    """
+    Groups of keys of the same restaurant, from (key, name, location, latitude, longitude)
+    rows. Each place is matched against the ones before it that matched nothing, so a group
+    keeps the order of `places` and the first key of each group is the one to keep.
+    """
+    index = DuplicateIndex()
+    groups: dict = {}
+    for key, name, location, latitude, longitude in places:
+        match = index.match_or_add(key, name, location, latitude, longitude)
+        if match is not None:
+            groups.setdefault(match, [match]).append(key)
+    return list(groups.values())
+
+
+def load_places(connection, city: str | None = None):
+    """
+    (id, name, location, latitude, longitude, city) of every restaurant, or one city's,
+    the most clicked first so they are the ones kept.
+    """
+    return connection.execute(text("""
+        SELECT id, name, location, latitude, longitude, city FROM restaurants
+        WHERE :city IS NULL OR city = :city
+        ORDER BY click_count DESC, id
+    """), {"city": city}).all()
+
+
+def group_duplicates(places) -> list[list]:
+    """
+    Groups of load_places rows of the same restaurant, each the most clicked first.
+    Restaurants are only compared within their city.
+    """
+    by_city = defaultdict(list)
+    for place in places:
+        by_city[place.city].append((place, place.name, place.location, place.latitude, place.longitude))
+    return [group for places in by_city.values() for group in find_duplicates(places)]
+
+
+def find_restaurant_duplicates(connection, city: str | None = None) -> list[list]:
+    return group_duplicates(load_places(connection, city))
+
+
+def merge_duplicates(connection, groups: list[list[int]]) -> dict[str, int]:
+    """
+    Merge each group of restaurant ids into its first with a fixed number of set-based
+    statements: categories are unioned, clicks, rollups and click counts moved over (and
+    scores updated), and the rest deleted. Returns row counts.
+    """
+    merges = [{"duplicate_id": duplicate_id, "restaurant_id": group[0]} for group in groups for duplicate_id in group[1:]]
+    if not merges:
+        return {"restaurants_merged": 0, "clicks_moved": 0}
+
+    connection.execute(text("CREATE TEMP TABLE duplicate_map (duplicate_id INTEGER PRIMARY KEY, restaurant_id INTEGER NOT NULL)"))
+    connection.execute(text("INSERT INTO duplicate_map (duplicate_id, restaurant_id) VALUES (:duplicate_id, :restaurant_id)"), merges)
+
+    connection.execute(text("""
+        INSERT OR IGNORE INTO restaurant_category (restaurant_id, category_id)
+        SELECT duplicate_map.restaurant_id, restaurant_category.category_id FROM restaurant_category
+        JOIN duplicate_map ON duplicate_map.duplicate_id = restaurant_category.restaurant_id
+    """))
+    counts = {}
+    counts["clicks_moved"] = connection.execute(text("""
+        UPDATE clicks SET restaurant_id = (SELECT restaurant_id FROM duplicate_map WHERE duplicate_id = clicks.restaurant_id)
+        WHERE restaurant_id IN (SELECT duplicate_id FROM duplicate_map)
+    """)).rowcount
+    connection.execute(text("""
+        INSERT INTO click_rollups (restaurant_id, period, bucket, clicks)
+        SELECT duplicate_map.restaurant_id, period, bucket, sum(clicks) FROM click_rollups
+        JOIN duplicate_map ON duplicate_map.duplicate_id = click_rollups.restaurant_id
+        GROUP BY duplicate_map.restaurant_id, period, bucket
+        ON CONFLICT (restaurant_id, period, bucket) DO UPDATE SET clicks = clicks + excluded.clicks
+    """))
+    connection.execute(text("""
+        UPDATE restaurants SET click_count = click_count + (
+            SELECT sum(duplicate.click_count) FROM duplicate_map
+            JOIN restaurants AS duplicate ON duplicate.id = duplicate_map.duplicate_id
+            WHERE duplicate_map.restaurant_id = restaurants.id
+        )
+        WHERE id IN (SELECT restaurant_id FROM duplicate_map)
+    """))
+    connection.execute(text(f"UPDATE restaurants SET score = {SCORE} WHERE id IN (SELECT restaurant_id FROM duplicate_map)"))
+    connection.execute(text("DELETE FROM click_rollups WHERE restaurant_id IN (SELECT duplicate_id FROM duplicate_map)"))
+    connection.execute(text("DELETE FROM restaurant_category WHERE restaurant_id IN (SELECT duplicate_id FROM duplicate_map)"))
+    counts["restaurants_merged"] = connection.execute(
+        text("DELETE FROM restaurants WHERE id IN (SELECT duplicate_id FROM duplicate_map)")
+    ).rowcount
+    connection.execute(text("DROP TABLE duplicate_map"))
+    return counts
@@ -0,0 +1,29 @@
+from catalog import bump_catalog_version
+from db import engine
+from duplicates import find_restaurant_duplicates, merge_duplicates
+
+
+def find_duplicate_restaurants(city: str | None = None, merge: bool = False):
+    """
+    Report groups of restaurants that are the same place. With merge, fold each group into
+    its most clicked restaurant, along with their clicks and categories.
+    """
+    with engine.begin() as connection:
+        groups = find_restaurant_duplicates(connection, city)
+        for keep, *duplicates in groups:
+            print(f"{keep.name} ({keep.location}, {keep.city}) #{keep.id}")
+            for duplicate in duplicates:
+                print(f"  #{duplicate.id} {duplicate.name} ({duplicate.location})")
+        print(f"Found {len(groups)} restaurants listed more than once.")
+        if merge:
+            counts = merge_duplicates(connection, [[place.id for place in group] for group in groups])
+            bump_catalog_version(connection)
+            print(f"Restaurants merged: {counts['restaurants_merged']}")
+            print(f"Clicks moved: {counts['clicks_moved']}")
+
+
+if __name__ == "__main__":
+    import sys
+    from cli import main
+
+    main(["find-duplicates", *sys.argv[1:]])
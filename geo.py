@@ -0,0 +1,117 @@
+import asyncio
+import heapq
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(latitude: float, longitude: float) -> tuple[float, float, float]:
+    lat, lon = math.radians(latitude), math.radians(longitude)
+    return (math.cos(lat) * math.cos(lon), math.cos(lat) * math.sin(lon), math.sin(lat))
+
+
+def chord_to_km(chord: float) -> float:
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def km_to_chord(km: float) -> float:
+    return 2 * math.sin(min(math.pi, km / EARTH_RADIUS_KM) / 2)
+
+
+class GeoIndex:
+    """
+    KD-tree of restaurant locations for nearest-neighbour and radius lookups.
+
+    Points are stored as unit vectors, where straight-line (chord) distance grows
+    with great-circle distance, so the tree can prune with plain coordinate
+    comparisons and only the results are converted back to kilometres.
+    """
+
+    def __init__(self, load):
+        self.load = load
+        self._root = None
+        self._points: dict[int, tuple[float, float, float]] = {}
+        self._stale = True
+        self._lock = asyncio.Lock()
+
+    def mark_catalog_changed(self) -> None:
+        self._stale = True
+
+    async def refresh(self) -> None:
+        """
+        Rebuild if stale. `load` is awaited for (restaurant_id, latitude, longitude) rows.
+        """
+        if not self._stale:
+            return
+        async with self._lock:
+            if not self._stale:
+                return
+            self._stale = False
+            self.rebuild(await self.load())
+
+    def rebuild(self, locations) -> None:
+        points = [
+            (to_unit_vector(latitude, longitude), restaurant_id)
+            for restaurant_id, latitude, longitude in locations
+            if latitude is not None and longitude is not None
+        ]
+        self._points = {restaurant_id: point for point, restaurant_id in points}
+        self._root = self._build(points, 0)
+
+    def _build(self, points, axis):
+        if not points:
+            return None
+        points.sort(key=lambda point: point[0][axis])
+        middle = len(points) // 2
+        next_axis = (axis + 1) % 3
+        return (points[middle], axis, self._build(points[:middle], next_axis), self._build(points[middle + 1:], next_axis))
+
+    def nearest(self, latitude: float, longitude: float, k: int = 10, radius_km: float | None = None) -> list[tuple[int, float]]:
+        """
+        Up to k (restaurant_id, distance_km) pairs closest to the given point, nearest first,
+        optionally only those within radius_km.
+        """
+        target = to_unit_vector(latitude, longitude)
+        limit = km_to_chord(radius_km) ** 2 if radius_km is not None else math.inf
+        # Max-heap of the best k so far, as (-squared chord, restaurant_id)
+        best: list[tuple[float, int]] = []
+
+        def visit(node):
+            if node is None:
+                return
+            (point, restaurant_id), axis, left, right = node
+            distance = sum((a - b) ** 2 for a, b in zip(point, target))
+            if distance <= limit:
+                if len(best) < k:
+                    heapq.heappush(best, (-distance, restaurant_id))
+                elif distance < -best[0][0]:
+                    heapq.heapreplace(best, (-distance, restaurant_id))
+            offset = target[axis] - point[axis]
+            near, far = (left, right) if offset < 0 else (right, left)
+            visit(near)
+            bound = -best[0][0] if len(best) == k else limit
+            if offset * offset <= bound:
+                visit(far)
+
+        visit(self._root)
+        return [(restaurant_id, chord_to_km(math.sqrt(-distance))) for distance, restaurant_id in sorted(best, reverse=True)]
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> list[tuple[int, float]]:
+        """
+        Every (restaurant_id, distance_km) within radius_km of the given point, nearest first.
+        """
+        return self.nearest(latitude, longitude, k=math.inf, radius_km=radius_km)
+
+    def sort_by_distance(self, latitude: float, longitude: float, restaurant_ids) -> list[tuple[int, float]]:
+        """
+        (restaurant_id, distance_km) for an already filtered set of restaurants, nearest first.
+        Restaurants without a location are left out.
+        """
+        target = to_unit_vector(latitude, longitude)
+        distances = [
+            (math.dist(self._points[restaurant_id], target), restaurant_id)
+            for restaurant_id in restaurant_ids
+            if restaurant_id in self._points
+        ]
+        distances.sort()
+        return [(restaurant_id, chord_to_km(distance)) for distance, restaurant_id in distances]
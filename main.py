@@ -1,147 +1,710 @@
-from fastapi import FastAPI, Depends, HTTPException, Request, Query, Form
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Request, Query, Form
+from fastapi.responses import HTMLResponse, RedirectResponse, PlainTextResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime, Table, Boolean
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session, relationship
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from sqlalchemy import create_engine, insert, update, bindparam, select, event, inspect, func, tuple_, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, undefer
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from sqlalchemy.exc import NoResultFound
-from datetime import datetime
-from sqladmin import Admin, ModelView
+from datetime import date, datetime, timedelta
+from collections import Counter, defaultdict
+from functools import partial
+from dataclasses import dataclass, asdict
+from sqladmin import Admin, BaseView, ModelView, expose
+from sqladmin._queries import Query as AdminQuery
 from sqladmin.authentication import AuthenticationBackend
-from sqlalchemy import func
-from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
 import os
+import copy
+import json
+import base64
+import binascii
 from dotenv import load_dotenv
 from passlib.context import CryptContext
+from contextlib import asynccontextmanager
+from click_buffer import ClickBuffer
+from category_index import CategoryIndex
+from catalog import CatalogWatcher, bump_catalog_version
+from search import search_restaurant_ids
+from duplicates import group_duplicates, load_places, merge_duplicates, find_restaurant_duplicates
+from geo import GeoIndex
+from cities import CityDirectory, CityRegistry, city_slug
+from rollups import TrendingRanking, hour_bucket
+from passwords import PasswordHasher, PasswordHasherBusy, LoginThrottle, LoginThrottled
+from storage import SerialWriter, configure_sqlite
+from sessions import MemorySessionStore, RedisSessionStore, ServerSessionMiddleware
+from streaming import FlushSignal, stream_template
+from page_cache import PageCache, PERSONAL_MARKER, page_response
+from assets import AssetFiles, Assets
+from metrics import Metrics, MetricsMiddleware, instrument_engine, timed_template_class
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from models import User, Restaurant, Category, Click, ClickRollup, CatalogVersion, SuggestedChanges, restaurant_category
+from db import DATABASE_URL, storage_profile, engine, SessionLocal, create_tables
 
 
 
 load_dotenv()
 
-app = FastAPI()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    click_buffer.start()
+    yield
+    # Write out any clicks still waiting in the buffer before exiting
+    await click_buffer.stop()
+    await async_engine.dispose()
+    admin_engine.dispose()
 
 
-SECRET_KEY = os.environ["SECRET_KEY"]
-assert SECRET_KEY, "need to have a secret key env var set"
+metrics = Metrics()
+# Requests slower than this many milliseconds are logged with their SQL, unset to disable
+SLOW_REQUEST_MS = os.environ.get("SLOW_REQUEST_MS")
 
 templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
-app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY)
-
-DATABASE_URL = "sqlite:///./restaurants.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-restaurant_category = Table(
-    "restaurant_category",
-    Base.metadata,
-    Column("restaurant_id", Integer, ForeignKey("restaurants.id"), primary_key=True),
-    Column("category_id", Integer, ForeignKey("categories.id"), primary_key=True)
+templates.env.template_class = timed_template_class(metrics)
+# Same templates rendered incrementally, for pages that stream their rows
+streaming_templates = Jinja2Templates(directory="templates", enable_async=True)
+streaming_templates.env.template_class = templates.env.template_class
+# Stream the restaurant list as it renders instead of building the whole page first
+STREAM_RESTAURANT_LIST = os.environ.get("STREAM_RESTAURANT_LIST", "1") == "1"
+STREAM_FIRST_BATCH = 50
+# Built by `python assets.py`, which fingerprints and precompresses everything in static/
+assets = Assets("static")
+for environment in (templates.env, streaming_templates.env):
+    environment.globals["asset_url"] = assets.url
+# Sessions are kept server side, the cookie only carries their id
+SESSION_TTL = int(os.environ.get("SESSION_TTL", 14 * 24 * 60 * 60))
+
+writer = SerialWriter(SessionLocal)
+# Same database through aiosqlite, used by the async routes so queries don't block the event loop.
+# Its connections are read only, routes write through `writer`.
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=AsyncAdaptedQueuePool, pool_size=storage_profile.read_pool_size)
+configure_sqlite(async_engine.sync_engine, storage_profile, read_only=True)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+# The admin's pages read through their own connections, so listing restaurants neither waits
+# for nor holds up the writer. Its edits go through the writer's sessions (see AdminModelView).
+admin_engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, pool_size=storage_profile.read_pool_size)
+configure_sqlite(admin_engine, storage_profile, read_only=True)
+AdminSessionLocal = sessionmaker(admin_engine)
+instrument_engine(engine)
+instrument_engine(async_engine.sync_engine)
+instrument_engine(admin_engine)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt runs on this pool rather than the event loop, with a cap on queued checks
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=int(os.environ.get("PASSWORD_HASH_WORKERS", 2)),
+    max_pending=int(os.environ.get("PASSWORD_HASH_QUEUE", 16)),
+)
+# Attempts per username from one client, so nobody elsewhere can lock an account out
+login_throttle = LoginThrottle(
+    max_attempts=int(os.environ.get("LOGIN_MAX_ATTEMPTS", 5)),
+    window=float(os.environ.get("LOGIN_ATTEMPT_WINDOW", 300)),
+)
+# Attempts per client across usernames. The client address only comes from X-Forwarded-For
+# when the request came through a proxy in FORWARDED_ALLOW_IPS (see start.sh).
+client_login_throttle = LoginThrottle(
+    max_attempts=int(os.environ.get("LOGIN_MAX_CLIENT_ATTEMPTS", 20)),
+    window=float(os.environ.get("LOGIN_ATTEMPT_WINDOW", 300)),
 )
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
-class User(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, nullable=False)
-    hashed_password = Column(String, nullable=False)
-    is_admin = Column(Boolean, default=False) 
+SEARCH_POPULARITY_WEIGHT = float(os.environ.get("SEARCH_POPULARITY_WEIGHT", 1.0))
+NEAR_ME_LIMIT = int(os.environ.get("NEAR_ME_LIMIT", 100))
+
+# Dependency to get the database session
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def write_clicks(db: Session, batch: list[tuple[int, datetime]]):
+    """
+    Bulk insert a batch of buffered (restaurant_id, timestamp) clicks, bump each
+    restaurant's click_count, score and hourly rollups, all in one transaction.
+    """
+    counts = Counter(restaurant_id for restaurant_id, _ in batch)
+    hourly = Counter((restaurant_id, hour_bucket(timestamp)) for restaurant_id, timestamp in batch)
+    rollup = sqlite_insert(ClickRollup)
+    increment_rollups = rollup.on_conflict_do_update(
+        index_elements=[ClickRollup.restaurant_id, ClickRollup.period, ClickRollup.bucket],
+        set_={"clicks": ClickRollup.clicks + rollup.excluded.clicks},
+    )
+    restaurants = Restaurant.__table__
+    new_click_count = restaurants.c.click_count + bindparam("clicks")
+    increment_click_count = (
+        update(restaurants)
+        .where(restaurants.c.id == bindparam("restaurant_id"))
+        .values(
+            click_count=new_click_count,
+            # Only the clicked restaurants are rescored
+            score=func.restaurant_score(new_click_count, restaurants.c.yelp_rating, restaurants.c.yelp_review_count, restaurants.c.quality_score),
+        )
+    )
+    db.execute(insert(Click), [{"restaurant_id": restaurant_id, "timestamp": timestamp} for restaurant_id, timestamp in batch])
+    db.execute(increment_click_count, [{"restaurant_id": restaurant_id, "clicks": n} for restaurant_id, n in counts.items()])
+    db.execute(increment_rollups, [
+        {"restaurant_id": restaurant_id, "period": "hour", "bucket": bucket, "clicks": n}
+        for (restaurant_id, bucket), n in hourly.items()
+    ])
+
+
+async def flush_clicks(batch: list[tuple[int, datetime]]):
+    await writer.run(write_clicks, batch)
+    for _, indexes in city_indexes.items():
+        indexes.category_index.mark_popularity_changed()
+        indexes.score_index.mark_popularity_changed()
+    page_cache.mark_popularity_changed()
+
+
+click_buffer = ClickBuffer(
+    flush_clicks,
+    max_batch=int(os.environ.get("CLICK_BATCH_SIZE", 500)),
+    flush_interval=float(os.environ.get("CLICK_FLUSH_INTERVAL", 1.0)),
+)
+metrics.gauge("click_buffer_pending", "Clicks waiting to be written.", click_buffer.pending)
+metrics.gauge("click_buffer_dropped", "Clicks dropped because the buffer was full.", lambda: click_buffer.dropped)
+metrics.gauge("db_writes_pending", "Writes waiting for the serial writer.", writer.pending)
+metrics.gauge("password_hash_pending", "Password checks running or queued.", password_hasher.pending)
+
+
+@dataclass(slots=True, frozen=True)
+class RestaurantRow:
+    """
+    Read-only view of a restaurant for templates, so pages don't build ORM identities
+    or trigger lazy loads while rendering.
+    """
+    id: int
+    name: str
+    location: str
+    website: str
+    click_count: int
+    price: int | None
+    rating: float | None
+    categories: tuple[str, ...]
+
 
-    def verify_password(self, password: str) -> bool:
-        return pwd_context.verify(password, self.hashed_password)
+RESTAURANT_ROW_COLUMNS = (Restaurant.id, Restaurant.name, Restaurant.location, Restaurant.website, Restaurant.click_count, Restaurant.price, Restaurant.yelp_rating)
+# Most clicked first. Ties go to the newest restaurant so the order is exactly a reverse scan of ix_restaurants_click_count
+POPULARITY_ORDER = (Restaurant.click_count.desc(), Restaurant.id.desc())
+# Best composite score first, likewise a reverse scan of ix_restaurants_score
+SCORE_ORDER = (Restaurant.score.desc(), Restaurant.id.desc())
 
-class Restaurant(Base):
-    __tablename__ = "restaurants"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, index=True)
-    location = Column(String, index=True)
-    city = Column(String, index=True, nullable=True)
-    website = Column(String)
-    url_verified_at = Column(DateTime, nullable=True)
-    clicks = relationship("Click", back_populates="restaurant")
-    categories = relationship("Category", secondary=restaurant_category, back_populates="restaurants")
 
-    def __str__(self):
-        return self.name
+async def load_restaurant_rows(db: AsyncSession, query) -> list[RestaurantRow]:
+    """
+    Run a select of RESTAURANT_ROW_COLUMNS and attach category names with one
+    extra query, regardless of how many rows come back.
+    """
+    return await attach_categories(db, (await db.execute(query)).all())
 
-    def __repr__(self):
-        return f"<Restaurant(name={self.name})>"
 
-class Category(Base):
-    __tablename__ = "categories"
-    id = Column(Integer, primary_key=True, index=True)
-    name = Column(String, unique=True, index=True)
-    restaurants = relationship("Restaurant", secondary=restaurant_category, back_populates="categories")
+async def attach_categories(db: AsyncSession, rows) -> list[RestaurantRow]:
+    """
+    RestaurantRows for rows of RESTAURANT_ROW_COLUMNS, with category names from one query.
+    """
+    if not rows:
+        return []
+    categories_by_restaurant = defaultdict(list)
+    category_names = await db.execute(
+        select(restaurant_category.c.restaurant_id, Category.name)
+        .join(Category, Category.id == restaurant_category.c.category_id)
+        .where(restaurant_category.c.restaurant_id.in_([row.id for row in rows]))
+        .order_by(Category.name)
+    )
+    for restaurant_id, name in category_names:
+        categories_by_restaurant[restaurant_id].append(name)
+    return [
+        RestaurantRow(row.id, row.name, row.location, row.website, row.click_count, row.price, row.yelp_rating, tuple(categories_by_restaurant[row.id]))
+        for row in rows
+    ]
 
-    def __str__(self):
-        return self.name
 
-    def __repr__(self):
-        return f"<Category(name={self.name})>"
+async def load_ranked_rows(db: AsyncSession, ranked_ids: list[int]) -> list[RestaurantRow]:
+    """
+    Load the rows for `ranked_ids`, in that order.
+    """
+    rank = {restaurant_id: i for i, restaurant_id in enumerate(ranked_ids)}
+    rows = await load_restaurant_rows(db, select(*RESTAURANT_ROW_COLUMNS).where(Restaurant.id.in_(ranked_ids)))
+    rows.sort(key=lambda row: rank[row.id])
+    return rows
 
-class Click(Base):
-    __tablename__ = "clicks"
-    id = Column(Integer, primary_key=True, index=True)
-    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
-    timestamp = Column(DateTime, default=datetime.utcnow)
-    restaurant = relationship("Restaurant", back_populates="clicks")
 
-    def __str__(self):
-        return self.restaurant.name
+def paced_rows(rows: list[RestaurantRow], signal: FlushSignal):
+    """
+    The already loaded rows for a streamed page, raising `signal` after the first
+    STREAM_FIRST_BATCH so the top of the page goes out before the rest has rendered.
+    """
+    for i, row in enumerate(rows):
+        if i == STREAM_FIRST_BATCH:
+            signal.set()
+        yield row
 
-    def __repr__(self):
-        return f"<Click on link for(name={self.restaurant.name})>"
 
+def in_city(query, city: str | None):
+    """
+    Restrict a query over restaurants to one city, None meaning every city.
+    """
+    return query if city is None else query.where(Restaurant.city == city)
 
 
+async def load_category_index(city: str | None, ranking=POPULARITY_ORDER):
+    async with AsyncSessionLocal() as db:
+        order = await db.scalars(in_city(select(Restaurant.id), city).order_by(*ranking))
+        prices = (await db.execute(in_city(select(Restaurant.id, Restaurant.price).where(Restaurant.price.is_not(None)), city))).all()
+        memberships = (
+            select(restaurant_category.c.restaurant_id, Category.name)
+            .join(Category, Category.id == restaurant_category.c.category_id)
+        )
+        if city is not None:
+            memberships = in_city(memberships.join(Restaurant, Restaurant.id == restaurant_category.c.restaurant_id), city)
+        return order.all(), (await db.execute(memberships)).all(), prices
 
-class SuggestedChanges(Base):
-    __tablename__ = "suggested_changes"
-    id = Column(Integer, primary_key=True, index=True)
-    suggestion = Column(String, nullable=False)
-    handled = Column(Boolean, nullable=False, default=False)
 
-# Create the database tables
-Base.metadata.create_all(bind=engine)
+async def load_geo_index(city: str | None):
+    async with AsyncSessionLocal() as db:
+        return (await db.execute(in_city(select(Restaurant.id, Restaurant.latitude, Restaurant.longitude), city))).all()
 
-# Dependency to get the database session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+async def load_trending(city: str | None, since: datetime):
+    async with AsyncSessionLocal() as db:
+        query = (
+            select(ClickRollup.restaurant_id, ClickRollup.bucket, ClickRollup.clicks)
+            .where(ClickRollup.period == "hour", ClickRollup.bucket >= since)
+        )
+        if city is not None:
+            query = in_city(query.join(Restaurant, Restaurant.id == ClickRollup.restaurant_id), city)
+        return (await db.execute(query)).all()
 
 
-class RestaurantAdmin(ModelView, model=Restaurant):
-    column_list = [Restaurant.id, Restaurant.name, Restaurant.location, Restaurant.city, Restaurant.categories, Restaurant.website, Restaurant.url_verified_at]
-    form_include_relationships = True
+async def load_cities():
+    async with AsyncSessionLocal() as db:
+        return (await db.scalars(select(Restaurant.city).distinct())).all()
 
 
+async def load_catalog_version() -> int:
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(CatalogVersion.version)) or 0
 
-class CategoryAdmin(ModelView, model=Category):
-    column_list = [Category.id, Category.name, Category.restaurants]
 
-class ClickAdmin(ModelView, model=Click):
-    column_list = [Click.id, Click.restaurant]
+CATEGORY_INDEX_REFRESH = float(os.environ.get("CATEGORY_INDEX_REFRESH", 60))
 
-class SuggestionAdmin(ModelView, model=SuggestedChanges):
+
+@dataclass(slots=True)
+class CityIndexes:
+    """
+    In-memory ranking, category and location structures over one city's restaurants,
+    or over every restaurant for the None city.
+    """
+    category_index: CategoryIndex
+    # The same filters, ranked by score
+    score_index: CategoryIndex
+    geo_index: GeoIndex
+    trending: TrendingRanking
+
+
+def create_city_indexes(city: str | None) -> CityIndexes:
+    return CityIndexes(
+        category_index=CategoryIndex(partial(load_category_index, city), popularity_refresh=CATEGORY_INDEX_REFRESH),
+        score_index=CategoryIndex(partial(load_category_index, city, SCORE_ORDER), popularity_refresh=CATEGORY_INDEX_REFRESH),
+        geo_index=GeoIndex(partial(load_geo_index, city)),
+        trending=TrendingRanking(
+            partial(load_trending, city),
+            half_life_hours=float(os.environ.get("TRENDING_HALF_LIFE_HOURS", 24)),
+            refresh=float(os.environ.get("TRENDING_REFRESH", 300)),
+        ),
+    )
+
+
+# Each city's indexes are built on its first request, least recently used cities are dropped past the limit
+city_indexes = CityRegistry(create_city_indexes, max_cities=int(os.environ.get("MAX_LOADED_CITIES", 32)))
+city_directory = CityDirectory(load_cities)
+metrics.gauge("cities_loaded", "Cities with indexes in memory.", lambda: len(city_indexes))
+# Rendered list pages, re-rendered after catalog edits or at most once per popularity refresh
+# Pages bigger than PAGE_CACHE_MAX_PAGE_BYTES are streamed instead, PAGE_CACHE_BYTES=0 disables it
+page_cache = PageCache(
+    max_bytes=int(os.environ.get("PAGE_CACHE_BYTES", 32 << 20)),
+    max_page_bytes=int(os.environ.get("PAGE_CACHE_MAX_PAGE_BYTES", 2 << 20)),
+    popularity_refresh=CATEGORY_INDEX_REFRESH,
+)
+metrics.gauge("page_cache_bytes", "Bytes held by cached pages.", lambda: page_cache.size)
+# Noted for a category edit, which can change the pages of every city
+EVERY_CITY = object()
+
+
+def invalidate_cities(cities) -> None:
+    """
+    Rebuild the city directory, the in-memory indexes of `cities`, and the all-cities
+    ones, and drop the cached pages.
+    """
+    city_directory.mark_catalog_changed()
+    for city, indexes in city_indexes.items():
+        if city is None or city in cities or EVERY_CITY in cities:
+            indexes.category_index.mark_catalog_changed()
+            indexes.score_index.mark_catalog_changed()
+            indexes.geo_index.mark_catalog_changed()
+    page_cache.clear()
+
+
+# Edits committed by other processes bump the shared catalog version. Routes that read the
+# indexes check it first, at most once per CATALOG_CHECK_INTERVAL seconds, and rebuild everything when it moved.
+catalog_watcher = CatalogWatcher(
+    load_catalog_version,
+    partial(invalidate_cities, {EVERY_CITY}),
+    interval=float(os.environ.get("CATALOG_CHECK_INTERVAL", 1.0)),
+)
+
+
+def note_catalog_change(session, cities) -> None:
+    """
+    Remember that this transaction touches `cities`, and bump the catalog version in it once.
+    """
+    if "catalog_version" not in session.info:
+        session.info["catalog_version"] = bump_catalog_version(session.connection())
+    session.info.setdefault("catalog_changed", set()).update(cities)
+
+
+@event.listens_for(Session, "after_flush")
+def note_catalog_changes(session, flush_context):
+    """
+    Remember which cities the restaurant and category edits in this flush touch.
+    """
+    cities = set()
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, Restaurant):
+            # Both the city it is in and, if it moved, the one it left
+            cities.add(obj.city)
+            cities.update(inspect(obj).attrs.city.history.deleted)
+        elif isinstance(obj, Category):
+            cities.add(EVERY_CITY)
+    if cities:
+        note_catalog_change(session, cities)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_catalog_indexes(session):
+    """
+    Any restaurant or category edit, including through the admin, rebuilds the in-memory
+    indexes of the cities it touched, and the all-cities ones, and the cached pages.
+    Done on commit, so nothing is rebuilt from uncommitted data.
+    """
+    cities = session.info.pop("catalog_changed", None)
+    version = session.info.pop("catalog_version", None)
+    if not cities:
+        return
+    invalidate_cities(cities)
+    if version is not None:
+        catalog_watcher.seen(version)
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_catalog_changes(session):
+    session.info.pop("catalog_changed", None)
+    session.info.pop("catalog_version", None)
+
+
+class AdminModelView(ModelView):
+    """
+    Reads through the admin's read-only engine, while inserts, edits and deletes run in
+    the writer's sessions, so they take the write lock up front and the catalog hooks see them.
+    """
+
+    def _writing(self) -> "AdminModelView":
+        view = copy.copy(self)
+        view.session_maker = SessionLocal
+        return view
+
+    async def insert_model(self, request: Request, data: dict):
+        return await AdminQuery(self._writing()).insert(data, request)
+
+    async def update_model(self, request: Request, pk: str, data: dict):
+        return await AdminQuery(self._writing()).update(pk, data, request)
+
+    async def delete_model(self, request: Request, pk) -> None:
+        await AdminQuery(self._writing()).delete(pk, request)
+
+
+class RestaurantAdmin(AdminModelView, model=Restaurant):
+    column_list = [Restaurant.id, Restaurant.name, Restaurant.location, Restaurant.city, Restaurant.categories, Restaurant.website, Restaurant.url_verified_at]
+    form_include_relationships = True
+    # A restaurant's clicks are reported by the views under Reports, not loaded into its pages.
+    # click_count and score are kept up to date by the click buffer and rescoring, a form
+    # saving the values it loaded with would undo those writes.
+    form_excluded_columns = [Restaurant.clicks, Restaurant.click_count, Restaurant.score]
+    # Imports match the feed's restaurants on it
+    form_widget_args = {"source_id": {"readonly": True}}
+    column_details_exclude_list = [Restaurant.clicks]
+
+
+
+class CategoryAdmin(AdminModelView, model=Category):
+    column_list = [Category.id, Category.name, Category.restaurant_count]
+    column_labels = {Category.restaurant_count: "Restaurants"}
+    column_sortable_list = [Category.id, Category.name, Category.restaurant_count]
+    form_excluded_columns = [Category.restaurant_count]
+    column_details_exclude_list = [Category.restaurants]
+    # Restaurants are looked up as you type instead of rendering every one into the form
+    form_ajax_refs = {"restaurants": {"fields": ("name",), "order_by": "name"}}
+
+    def list_query(self, request: Request):
+        return select(Category).options(undefer(Category.restaurant_count))
+
+class ClickAdmin(AdminModelView, model=Click):
+    column_list = [Click.id, Click.restaurant, Click.timestamp]
+    column_sortable_list = [Click.id, Click.timestamp]
+    column_default_sort = [(Click.id, True)]
+    form_ajax_refs = {"restaurant": {"fields": ("name",), "order_by": "name"}}
+    # Clicks are only appended, and pruned by compact_click_history oldest id first
+    can_delete = False
+
+    def count_query(self, request: Request):
+        # Without deletes in between their ids are contiguous, so the span of the primary
+        # key counts them without scanning the table
+        first, last = select(func.min(Click.id)).scalar_subquery(), select(func.max(Click.id)).scalar_subquery()
+        return select(func.coalesce(last - first + 1, 0))
+
+class SuggestionAdmin(AdminModelView, model=SuggestedChanges):
     column_list = [SuggestedChanges.id, SuggestedChanges.handled, SuggestedChanges.suggestion]
 
 
+class ClickCountsAdmin(BaseView):
+    """
+    Clicks per restaurant, all time from click_count and the last week from the rollups of
+    the restaurants on the page. Pages continue after the last row of the previous one
+    instead of skipping an offset, so every page costs the same.
+    """
+    name = "Clicks by restaurant"
+    identity = "click-counts"
+    icon = "fa-solid fa-chart-bar"
+    category = "Reports"
+    page_size = 50
+    recent_days = 7
+    sort_columns = {"clicks": Restaurant.click_count, "name": Restaurant.name}
+
+    @expose("/click-counts", methods=["GET"], identity="click-counts")
+    async def click_counts(self, request: Request):
+        params = request.query_params
+        sort = params.get("sort") if params.get("sort") in self.sort_columns else "clicks"
+        descending = params.get("order", "desc" if sort == "clicks" else "asc") == "desc"
+        city = params.get("city") or None
+        column = self.sort_columns[sort]
+
+        query = in_city(select(Restaurant.id, Restaurant.name, Restaurant.city, Restaurant.click_count), city)
+        if "after_id" in params:
+            try:
+                after = (int(params["after"]) if sort == "clicks" else params["after"], int(params["after_id"]))
+            except (KeyError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid page cursor")
+            key = tuple_(column, Restaurant.id)
+            query = query.where(key < tuple_(*after) if descending else key > tuple_(*after))
+        direction = "desc" if descending else "asc"
+        query = query.order_by(getattr(column, direction)(), getattr(Restaurant.id, direction)())
+
+        since = datetime.utcnow() - timedelta(days=self.recent_days)
+        async with AsyncSessionLocal() as db:
+            rows = (await db.execute(query.limit(self.page_size + 1))).all()
+            page = rows[:self.page_size]
+            recent = dict((await db.execute(
+                select(ClickRollup.restaurant_id, func.sum(ClickRollup.clicks))
+                .where(
+                    ClickRollup.restaurant_id.in_([row.id for row in page]),
+                    ClickRollup.period.in_(("hour", "day")),
+                    ClickRollup.bucket >= since,
+                )
+                .group_by(ClickRollup.restaurant_id)
+            )).all())
+        await catalog_watcher.check()
+        await city_directory.refresh()
+
+        first_page = request.url.remove_query_params(["after", "after_id"])
+        links = []
+        if "after_id" in params:
+            links.append(("First page", first_page))
+        if len(rows) > self.page_size:
+            last = page[-1]
+            links.append(("Next page", first_page.include_query_params(after=getattr(last, column.key), after_id=last.id)))
+
+        def heading(label, name):
+            order = "asc" if sort == name and descending else "desc" if sort == name else "desc" if name == "clicks" else "asc"
+            arrow = (" ↓" if descending else " ↑") if sort == name else ""
+            return (label + arrow, first_page.include_query_params(sort=name, order=order))
+
+        return await self.templates.TemplateResponse(request, "admin/report.html", {
+            "title": self.name,
+            "subtitle": city or "All cities",
+            "filters": [("All cities", first_page.remove_query_params("city"), city is None)] + [
+                (name, first_page.include_query_params(city=name), name == city) for name in city_directory.names
+            ],
+            "columns": [heading("Restaurant", "name"), ("City", None), heading("Clicks", "clicks"), (f"Last {self.recent_days} days", None)],
+            "rows": [
+                [(row.name, request.url_for("admin:details", identity="restaurant", pk=row.id)), row.city or "", row.click_count, recent.get(row.id, 0)]
+                for row in page
+            ],
+            "links": links,
+        })
+
+
+class DailyClicksAdmin(BaseView):
+    """
+    Clicks per day from the rollups, a window of days at a time. The window is a range of
+    the rollups' (period, bucket) index, whatever the size of the clicks table.
+    """
+    name = "Clicks by day"
+    identity = "daily-clicks"
+    icon = "fa-solid fa-calendar-day"
+    category = "Reports"
+    page_days = 30
+
+    @expose("/daily-clicks", methods=["GET"], identity="daily-clicks")
+    async def daily_clicks(self, request: Request):
+        params = request.query_params
+        today = datetime.utcnow().date()
+        try:
+            before = date.fromisoformat(params["before"]) if "before" in params else today + timedelta(days=1)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid date")
+        start = before - timedelta(days=self.page_days)
+        sort = "clicks" if params.get("sort") == "clicks" else "day"
+        descending = params.get("order", "desc") == "desc"
+
+        day = func.date(ClickRollup.bucket)
+        async with AsyncSessionLocal() as db:
+            counts = dict((await db.execute(
+                select(day, func.sum(ClickRollup.clicks))
+                .where(
+                    ClickRollup.period.in_(("hour", "day")),
+                    ClickRollup.bucket >= datetime.combine(start, datetime.min.time()),
+                    ClickRollup.bucket < datetime.combine(before, datetime.min.time()),
+                )
+                .group_by(day)
+            )).all())
+        days = [(start + timedelta(days=i)).isoformat() for i in range(self.page_days)]
+        totals = [(name, counts.get(name, 0)) for name in days if name <= today.isoformat()]
+        # Sorting by clicks orders the days of the window shown
+        totals.sort(key=(lambda total: total[1]) if sort == "clicks" else (lambda total: total[0]), reverse=descending)
+
+        window = request.url.remove_query_params("before")
+        links = [("Earlier", window.include_query_params(before=start.isoformat()))]
+        if before <= today:
+            links.append(("Later", window.include_query_params(before=(before + timedelta(days=self.page_days)).isoformat())))
+
+        def heading(label, name):
+            order = "asc" if sort == name and descending else "desc"
+            arrow = (" ↓" if descending else " ↑") if sort == name else ""
+            return (label + arrow, request.url.include_query_params(sort=name, order=order))
+
+        return await self.templates.TemplateResponse(request, "admin/report.html", {
+            "title": self.name,
+            "subtitle": f"{start.isoformat()} to {min(before - timedelta(days=1), today).isoformat()}",
+            "filters": [],
+            "columns": [heading("Day", "day"), heading("Clicks", "clicks")],
+            "rows": [[name, clicks] for name, clicks in totals],
+            "links": links,
+        })
+
+
+def merge_restaurant_duplicates(db: Session, groups: list[list[int]] | None, city: str | None) -> dict[str, int]:
+    """
+    Merge the given groups of restaurant ids, or with None every group find_restaurant_duplicates
+    finds in the city, each into its most clicked restaurant.
+    """
+    if groups is None:
+        groups = [[place.id for place in group] for group in find_restaurant_duplicates(db.connection(), city)]
+    ids = [restaurant_id for group in groups for restaurant_id in group]
+    rows = db.execute(select(Restaurant.id, Restaurant.city).where(Restaurant.id.in_(ids)).order_by(*POPULARITY_ORDER)).all()
+    rank = {row.id: position for position, row in enumerate(rows)}
+    counts = merge_duplicates(db.connection(), [sorted((i for i in group if i in rank), key=rank.get) for group in groups])
+    # Merged with plain statements, which note_catalog_changes doesn't see
+    note_catalog_change(db, {row.city for row in rows})
+    return counts
+
+
+class DuplicatesAdmin(BaseView):
+    """
+    Restaurants listed more than once, found by duplicates.find_duplicates and merged on request.
+    """
+    name = "Possible duplicates"
+    identity = "duplicates"
+    icon = "fa-solid fa-clone"
+    category = "Reports"
+    page_size = 100
+    # Groups by city, with the catalog version they were found at. Matching is only redone
+    # after restaurants were added, edited or merged, not on every view.
+    candidates: dict[str | None, tuple[int, list[list]]] = {}
+
+    @expose("/duplicates", methods=["GET", "POST"], identity="duplicates")
+    async def duplicates(self, request: Request):
+        city = request.query_params.get("city") or None
+        if request.method == "POST":
+            form = await request.form()
+            groups = None if "all" in form else [[int(i) for i in group.split(",") if i.isdigit()] for group in form.getlist("group")]
+            counts = await writer.run(merge_restaurant_duplicates, groups, city)
+            return RedirectResponse(
+                request.url.include_query_params(merged=counts["restaurants_merged"]),
+                status_code=303,
+            )
+
+        async with async_engine.connect() as connection:
+            # Read in the same transaction as the places, so the version matches them
+            version = await connection.scalar(select(CatalogVersion.version)) or 0
+            cached = self.candidates.get(city)
+            if cached is not None and cached[0] == version:
+                groups = cached[1]
+            else:
+                places = await connection.run_sync(load_places, city)
+                # Matching is CPU bound, keep it off the event loop
+                groups = await run_in_threadpool(group_duplicates, places)
+                self.candidates[city] = (version, groups)
+        await catalog_watcher.check()
+        await city_directory.refresh()
+
+        base = request.url.remove_query_params(["city", "merged"])
+        return await self.templates.TemplateResponse(request, "admin/duplicates.html", {
+            "title": self.name,
+            "subtitle": city or "All cities",
+            "filters": [("All cities", base, city is None)] + [
+                (name, base.include_query_params(city=name), name == city) for name in city_directory.names
+            ],
+            "groups": [
+                (",".join(str(place.id) for place in group), [
+                    (place.name, place.location, request.url_for("admin:details", identity="restaurant", pk=place.id))
+                    for place in group
+                ])
+                for group in groups[:self.page_size]
+            ],
+            "total": len(groups),
+            "merged": request.query_params.get("merged"),
+        })
+
+
+async def check_login(db: AsyncSession, request: Request, username: str, password: str) -> User | None:
+    """
+    The user if the credentials are valid. Attempts over the limit for the username from
+    this client, or for the client, raise LoginThrottled before the database or bcrypt are
+    touched, and PasswordHasherBusy is raised when too many checks are already queued.
+    """
+    client = f"client:{request.client.host if request.client else ''}"
+    client_login_throttle.attempt(client)
+    login_throttle.attempt(f"user:{username}|{client}")
+    user = (await db.execute(select(User).where(User.username == username))).scalar_one_or_none()
+    if not user or not await password_hasher.verify(password, user.hashed_password):
+        return None
+    login_throttle.reset(f"user:{username}|{client}")
+    return user
+
+
 class AdminAuth(AuthenticationBackend):
     async def login(self, request: Request) -> bool:
         form = await request.form()
         username, password = form["username"], form["password"]
-        db = next(get_db())
-        user = db.query(User).filter(User.username == username).first()
-        if not user or not user.verify_password(password):
-            print("login failed")
+        try:
+            async with AsyncSessionLocal() as db:
+                user = await check_login(db, request, username, password)
+        except (LoginThrottled, PasswordHasherBusy):
+            return False
+        if not user:
             return templates.TemplateResponse(
                 "login.html",
                 {"request": request, "error": "Invalid username or password"},
@@ -150,7 +713,6 @@ class AdminAuth(AuthenticationBackend):
 
         request.session["user_id"] = user.id
         request.session["is_admin"] = user.is_admin
-        print(user.is_admin)
         return True
 
     async def logout(self, request: Request) -> bool:
@@ -158,65 +720,224 @@ class AdminAuth(AuthenticationBackend):
         return True
 
     async def authenticate(self, request: Request) -> bool:
-        print(request.session)
         return request.session.get("is_admin") == True
 
 
 
-admin_auth = AdminAuth(secret_key=SECRET_KEY) 
-admin = Admin(app, engine, authentication_backend=admin_auth)
+router = APIRouter()
+
+
+def popular_rows(city: str | None):
+    """
+    Every restaurant in `city` by popularity, read through ix_restaurants_city_click_count.
+    """
+    return in_city(select(*RESTAURANT_ROW_COLUMNS), city).order_by(*POPULARITY_ORDER)
+
+
+def listed_rows(city: str | None, sort: str):
+    """
+    Every restaurant in `city`, best scored first for sort=score through ix_restaurants_city_score,
+    otherwise by popularity.
+    """
+    if sort == "score":
+        return in_city(select(*RESTAURANT_ROW_COLUMNS), city).order_by(*SCORE_ORDER)
+    return popular_rows(city)
+
 
+def price_levels(price_min: int | None, price_max: int | None) -> tuple[int, ...] | None:
+    """
+    The price levels, 1 to 4, of a price range, or None when it isn't limited.
+    """
+    if price_min is None and price_max is None:
+        return None
+    return tuple(range(price_min or 1, (price_max or 4) + 1))
 
-admin.add_view(RestaurantAdmin)
-admin.add_view(CategoryAdmin)
-admin.add_view(ClickAdmin)
-admin.add_view(SuggestionAdmin)
 
+async def rank_restaurants(db: AsyncSession, city, categories, match, q, sort, lat, lon, prices=None) -> tuple[list[int] | None, dict[int, float]]:
+    """
+    Ids of the restaurants the list page shows, in order, and their distances when sorting
+    by location. None stands for every restaurant in the city in listed_rows order.
+    """
+    # Only ever a city from city_directory, or None, so requests can't fill city_indexes with made up names
+    indexes = city_indexes.get(city)
+    filters = indexes.score_index if sort == "score" else indexes.category_index
+    distances = {}
+    near_me = lat is not None and lon is not None
+    ranked_ids = None
+    if q:
+        ranked_ids = await search_restaurant_ids(db, q, limit=100, popularity_weight=SEARCH_POPULARITY_WEIGHT, city=city)
+    elif sort == "trending":
+        await indexes.category_index.refresh()
+        await indexes.trending.update()
+        ranked_ids = indexes.trending.rank(indexes.category_index.order)
+    if categories or prices is not None:
+        await filters.refresh()
+        in_categories = filters.filter(categories, match_all=match == "all", prices=prices)
+        if ranked_ids is None:
+            ranked_ids = in_categories
+        else:
+            in_categories = set(in_categories)
+            ranked_ids = [restaurant_id for restaurant_id in ranked_ids if restaurant_id in in_categories]
+    if near_me:
+        await indexes.geo_index.refresh()
+        if ranked_ids is None:
+            distances = dict(indexes.geo_index.nearest(lat, lon, k=NEAR_ME_LIMIT))
+        else:
+            distances = dict(indexes.geo_index.sort_by_distance(lat, lon, ranked_ids))
+        ranked_ids = list(distances)
+    return ranked_ids, distances
+
+
+async def restaurant_page_context(db: AsyncSession, city, categories, q, sort, distances, prices=None) -> dict:
+    """
+    Template context for the list page that is the same for every visitor, apart from the restaurants.
+    """
+    category_names = select(Category.id, Category.name).order_by(Category.name)
+    if city is not None:
+        # Only the categories this city has restaurants in
+        in_use = select(restaurant_category.c.category_id).join(Restaurant, Restaurant.id == restaurant_category.c.restaurant_id)
+        category_names = category_names.where(Category.id.in_(in_city(in_use, city)))
+    await city_directory.refresh()
+    return {
+        "city": city,
+        "base_url": f"/{city_slug(city)}/" if city else "/",
+        "cities": [{"name": name, "url": f"/{city_slug(name)}/"} for name in city_directory.names],
+        "categories": (await db.execute(category_names)).all(),
+        "selected_categories": categories or [],
+        "q": q,
+        "sort": sort,
+        "prices": prices,
+        "distances": distances,
+    }
+
+
+def recently_viewed(request: Request) -> list[dict]:
+    """
+    Restaurants whose menus this visitor opened, most recent first.
+    """
+    # Stored oldest first as [id, name], older sessions only have ids and are skipped
+    return [
+        {"id": entry[0], "name": entry[1]}
+        for entry in reversed(request.session.get("recently_viewed", []))
+        if isinstance(entry, list)
+    ]
+
+
+async def render_restaurant_page(city, categories, match, sort, prices) -> str:
+    """
+    The list page for the page cache, with PERSONAL_MARKER where the personal part goes.
+    """
+    async with AsyncSessionLocal() as db:
+        ranked_ids, distances = await rank_restaurants(db, city, categories, match, None, sort, None, None, prices)
+        context = await restaurant_page_context(db, city, categories, None, sort, distances, prices)
+        context["restaurants"] = await load_ranked_rows(db, ranked_ids) if ranked_ids is not None else await load_restaurant_rows(db, listed_rows(city, sort))
+    context["personal_marker"] = PERSONAL_MARKER
+    return templates.get_template("restaurants.html").render(context)
+
+
+async def restaurant_list_page(request: Request, db: AsyncSession, city, categories, match, q, sort, lat, lon, message, prices=None):
+    await catalog_watcher.check()
+    near_me = lat is not None and lon is not None
+    personal = {"message": message, "recently_viewed": recently_viewed(request)}
+    if page_cache.max_bytes and not q and not near_me:
+        # Everyone gets the same page for a filter, only the personal part is rendered per request
+        categories = sorted(set(categories or []))
+        sort = sort if sort in ("trending", "score") else "popular"
+        match = match if len(categories) > 1 else "any"
+        key = (city, tuple(categories), match, sort, prices)
+        # Too big to keep, so it is streamed below rather than built whole every time
+        if page_cache.cacheable(key):
+            page = await page_cache.get(key, lambda: render_restaurant_page(city, categories, match, sort, prices))
+            # Left out for anonymous visitors, so they get the shared page as it was compressed
+            personal_html = templates.get_template("personal.html").render(personal).strip() if any(personal.values()) else ""
+            return page_response(request, page, personal_html)
+
+    ranked_ids, distances = await rank_restaurants(db, city, categories, match, q, sort, lat, lon, prices)
+    context = {"request": request, **personal, **await restaurant_page_context(db, city, categories, q, sort, distances, prices)}
+    context["restaurants"] = await load_ranked_rows(db, ranked_ids) if ranked_ids is not None else await load_restaurant_rows(db, listed_rows(city, sort))
+    if STREAM_RESTAURANT_LIST:
+        # Only the rendering is streamed, the rows are already loaded and the session is
+        # closed before the body is sent, so a slow client never holds a read connection
+        signal = FlushSignal()
+        context["restaurants"] = paced_rows(context["restaurants"], signal)
+        template = streaming_templates.get_template("restaurants.html")
+        return StreamingResponse(stream_template(template, context, signal), media_type="text/html")
+
+    return templates.TemplateResponse("restaurants.html", context)
+
+
+def trailing_slash_redirect(request: Request) -> RedirectResponse | None:
+    """
+    A redirect to the request's path without its trailing slash if another route serves
+    that, as Starlette's redirect_slashes would send.
+    """
+    scope = {**request.scope, "path": request.scope["path"].rstrip("/")}
+    if any(route.matches(scope)[0] != Match.NONE for route in request.app.router.routes):
+        return RedirectResponse(request.url.replace(path=request.url.path.rstrip("/")), status_code=307)
+    return None
 
 
 # Routes
-@app.head("/")
-@app.get("/", response_class=HTMLResponse)
-async def list_restaurants(request: Request, db: Session = Depends(get_db), categories: list[str] = Query(default=None), message: str = Query(default=None)):
+@router.head("/")
+@router.get("/", response_class=HTMLResponse)
+async def list_restaurants(request: Request, db: AsyncSession = Depends(get_async_db), categories: list[str] = Query(default=None), match: str = Query(default="any"), q: str = Query(default=None), sort: str = Query(default="popular"), lat: float = Query(default=None), lon: float = Query(default=None), message: str = Query(default=None), price_min: int = Query(default=None, ge=1, le=4), price_max: int = Query(default=None, ge=1, le=4)):
     """
     Render the list of restaurants as an HTML page, optionally filtered by categories.
+    Restaurants in any of the categories are shown, or in all of them with match=all.
+    With q, only search results are shown, best match first.
+    With sort=trending, restaurants clicked most this week come first, recent clicks counting more.
+    With sort=score, the best rated come first, by the stored composite score.
+    With price_min and/or price_max, from 1 ($) to 4 ($$$$), only restaurants in that price range are shown.
+    With lat and lon, the restaurants closest to that point are shown, nearest first.
     """
-    query = db.query(Restaurant)
-    if categories:
-        query = query.join(Restaurant.categories).filter(Category.name.in_(categories))
-    restaurants = query.join(Click, Click.restaurant_id == Restaurant.id, isouter=True).group_by(Restaurant.id).order_by(func.count().desc()).all()
-    all_categories = db.query(Category).order_by(Category.name).all()
-    recently_viewed_ids = request.session.get("recently_viewed", [])
-    recently_viewed_restaurants = (
-       db.query(Restaurant).filter(Restaurant.id.in_(recently_viewed_ids)).all()
-    )
-
+    return await restaurant_list_page(request, db, None, categories, match, q, sort, lat, lon, message, price_levels(price_min, price_max))
 
-    return templates.TemplateResponse(
-        "restaurants.html",
-        {
-            "request": request,
-            "message": message,
-            "restaurants": restaurants,
-            "categories": all_categories,
-            "selected_categories": categories or [],
-            "recently_viewed": recently_viewed_restaurants
-        }
-    )
 
-@app.get("/login", response_class=HTMLResponse)
+@router.head("/{city}/")
+@router.get("/{city}/", response_class=HTMLResponse)
+async def list_city_restaurants(request: Request, city: str, db: AsyncSession = Depends(get_async_db), categories: list[str] = Query(default=None), match: str = Query(default="any"), q: str = Query(default=None), sort: str = Query(default="popular"), lat: float = Query(default=None), lon: float = Query(default=None), message: str = Query(default=None), price_min: int = Query(default=None, ge=1, le=4), price_max: int = Query(default=None, ge=1, le=4)):
+    """
+    The list page for one city, by its slug, with the same options as the list of every restaurant.
+    """
+    await catalog_watcher.check()
+    await city_directory.refresh()
+    name = city_directory.resolve(city)
+    if name is None:
+        # /login/ and the like, which redirect_slashes used to send on before this route caught them
+        redirect = trailing_slash_redirect(request)
+        if redirect is not None:
+            return redirect
+        raise HTTPException(status_code=404, detail="City not found")
+    return await restaurant_list_page(request, db, name, categories, match, q, sort, lat, lon, message, price_levels(price_min, price_max))
+
+@router.get("/login", response_class=HTMLResponse)
 async def login_page(request: Request):
     return templates.TemplateResponse("login.html", {"request": request})
 
-@app.post("/login")
+@router.post("/login")
 async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = db.query(User).filter(User.username == username).first()
-    if not user or not user.verify_password(password):
+    try:
+        user = await check_login(db, request, username, password)
+    except LoginThrottled as throttled:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": "Too many login attempts, try again later"},
+            status_code=429,
+            headers={"Retry-After": str(int(throttled.retry_after) + 1)},
+        )
+    except PasswordHasherBusy:
+        return templates.TemplateResponse(
+            "login.html",
+            {"request": request, "error": "Login is busy, try again in a moment"},
+            status_code=503,
+            headers={"Retry-After": "1"},
+        )
+    if not user:
         return templates.TemplateResponse(
             "login.html",
             {"request": request, "error": "Invalid username or password"},
@@ -229,24 +950,22 @@ async def login(
 
 
 
-@app.get("/logout")
+@router.get("/logout")
 async def logout(request: Request):
     request.session.clear()
     return RedirectResponse(url="/login", status_code=303)
 
 
-@app.post("/suggestion")
-async def submit_suggestion(suggestion: str = Form(...),db: Session = Depends(get_db)):
+@router.post("/suggestion")
+async def submit_suggestion(suggestion: str = Form(...)):
     """
     Submit a suggestion form
     """
-    suggestion = SuggestedChanges(suggestion=suggestion)
-    db.add(suggestion)
-    db.commit()
+    await writer.run(lambda db: db.add(SuggestedChanges(suggestion=suggestion)))
     return RedirectResponse(url="/?message=Thanks+for+the+suggestion!", status_code=303)
 
 
-@app.get("/suggestion")
+@router.get("/suggestion")
 async def get_suggestion_form(request: Request):
 
     """
@@ -255,24 +974,147 @@ async def get_suggestion_form(request: Request):
     return templates.TemplateResponse("suggestions.html", {"request": request})
 
 
-@app.get("/restaurants/{restaurant_id}/menu")
-async def redirect_to_menu(request: Request, restaurant_id: int, db: Session = Depends(get_db)):
+@router.get("/restaurants/{restaurant_id}/menu")
+async def redirect_to_menu(request: Request, restaurant_id: int, db: AsyncSession = Depends(get_async_db)):
     """
     Redirect to the menu link while incrementing the menu click count.
+    The click is buffered and written in the background with other clicks.
     """
     try:
-        restaurant = db.query(Restaurant).filter(Restaurant.id == restaurant_id).one()
-        click = Click(restaurant_id=restaurant.id)
-        db.add(click)
-        db.commit()
+        restaurant = (await db.execute(select(Restaurant.id, Restaurant.name, Restaurant.website).where(Restaurant.id == restaurant_id))).one()
+        await click_buffer.record(restaurant.id)
 
-        recently_viewed = request.session.get("recently_viewed", [])
-        if restaurant_id not in recently_viewed:
-            recently_viewed.append(restaurant_id)
-            request.session["recently_viewed"] = recently_viewed[-10:]
+        viewed = [entry for entry in request.session.get("recently_viewed", []) if isinstance(entry, list) and entry[0] != restaurant_id]
+        request.session["recently_viewed"] = [*viewed, [restaurant.id, restaurant.name]][-10:]
 
 
 
         return RedirectResponse(url=restaurant.website)
     except NoResultFound:
         raise HTTPException(status_code=404, detail="Restaurant not found")
+
+
+@router.get("/api/search")
+async def search(q: str = Query(...), limit: int = Query(default=20, ge=1, le=100), city: str = Query(default=None), db: AsyncSession = Depends(get_async_db)):
+    """
+    Search restaurants by name, location, city and category, for search-as-you-type.
+    With city, only that city's restaurants are searched.
+    """
+    ranked_ids = await search_restaurant_ids(db, q, limit=limit, popularity_weight=SEARCH_POPULARITY_WEIGHT, city=city)
+    return [asdict(row) for row in await load_ranked_rows(db, ranked_ids)]
+
+
+@router.get("/api/restaurants/near")
+async def restaurants_near(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    k: int = Query(default=10, ge=1, le=100),
+    radius_km: float = Query(default=None, gt=0),
+    city: str = Query(default=None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    The k restaurants closest to a point, optionally only those within radius_km or in city, nearest first.
+    """
+    await catalog_watcher.check()
+    if city is not None:
+        # Unknown names would each take a slot in city_indexes, pushing out real cities
+        await city_directory.refresh()
+        if city not in city_directory:
+            raise HTTPException(status_code=404, detail="City not found")
+    geo_index = city_indexes.get(city).geo_index
+    await geo_index.refresh()
+    distances = dict(geo_index.nearest(lat, lon, k=k, radius_km=radius_km))
+    rows = await load_ranked_rows(db, list(distances))
+    return [{**asdict(row), "distance_km": round(distances[row.id], 3)} for row in rows]
+
+
+def encode_cursor(click_count: int, restaurant_id: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps([click_count, restaurant_id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[int, int]:
+    try:
+        click_count, restaurant_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return int(click_count), int(restaurant_id)
+    except (ValueError, TypeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+@router.get("/api/restaurants")
+async def list_restaurants_api(
+    cursor: str = Query(default=None),
+    limit: int = Query(default=50, ge=1, le=100),
+    categories: list[str] = Query(default=None),
+    match: str = Query(default="any"),
+    city: str = Query(default=None),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Restaurants by popularity, one page at a time. Pass the returned next_cursor to get
+    the following page. Pages are found by seeking to the cursor's (click_count, id)
+    instead of an OFFSET, so every page costs the same as the first.
+    """
+    query = popular_rows(city).limit(limit + 1)
+    if cursor:
+        query = query.where(tuple_(Restaurant.click_count, Restaurant.id) < tuple_(*decode_cursor(cursor)))
+    if categories:
+        in_category = [Restaurant.categories.any(Category.name == name) for name in categories]
+        query = query.where(and_(*in_category) if match == "all" else or_(*in_category))
+
+    rows = await load_restaurant_rows(db, query)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last.click_count, last.id)
+    return {"restaurants": [asdict(row) for row in rows], "next_cursor": next_cursor}
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """
+    Request, SQL and template timings in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+def create_session_store():
+    if os.environ.get("SESSION_BACKEND", "memory") == "redis":
+        import redis.asyncio
+
+        return RedisSessionStore(redis.asyncio.from_url(os.environ["REDIS_URL"]), ttl=SESSION_TTL)
+    return MemorySessionStore(ttl=SESSION_TTL, max_sessions=int(os.environ.get("SESSION_MAX_ENTRIES", 100_000)))
+
+
+def create_app() -> FastAPI:
+    """
+    Build the web app: routes, static files, middleware and the admin. Run with
+    `uvicorn main:create_app --factory`.
+    """
+    secret_key = os.environ.get("SECRET_KEY")
+    assert secret_key, "need to have a secret key env var set"
+
+    # Create the database tables
+    create_tables()
+
+    app = FastAPI(lifespan=lifespan)
+    # Mounted before the routes, so /static/ and /admin/ aren't taken for city slugs by /{city}/
+    app.mount("/static", AssetFiles(directory="static"), name="static")
+    app.add_middleware(ServerSessionMiddleware, store=create_session_store(), max_age=SESSION_TTL, https_only=os.environ.get("SESSION_HTTPS_ONLY") == "1")
+    app.add_middleware(MetricsMiddleware, metrics=metrics, slow_request_ms=float(SLOW_REQUEST_MS) if SLOW_REQUEST_MS else None)
+
+    admin_auth = AdminAuth(secret_key=secret_key)
+    # The admin shares the app's server-side session instead of adding its own cookie session
+    admin_auth.middlewares = []
+    admin = Admin(app, session_maker=AdminSessionLocal, authentication_backend=admin_auth)
+    admin.add_view(RestaurantAdmin)
+    admin.add_view(CategoryAdmin)
+    admin.add_view(ClickAdmin)
+    admin.add_view(SuggestionAdmin)
+    admin.add_view(ClickCountsAdmin)
+    admin.add_view(DailyClicksAdmin)
+    admin.add_view(DuplicatesAdmin)
+
+    app.include_router(router)
+    return app
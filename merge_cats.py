@@ -1,14 +1,6 @@
-import json
-from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
-from main import Base, Restaurant, Category, restaurant_category
-import os
-
-# Database setup
-
-DATABASE_URL =  os.environ["DATABASE_URL"]
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-Base.metadata.create_all(bind=engine)
+from sqlalchemy import text
+from catalog import bump_catalog_version
+from db import engine
 
 # Mapping of categories to their merged group
 CATEGORY_MERGE_MAP = {
@@ -46,37 +38,63 @@ CATEGORY_MERGE_MAP = {
     "Specialty Shops": "Shopping"
 }
 
-def merge_categories():
-    with Session(engine) as session:
-        # Get all categories
-        all_categories = session.query(Category).all()
+def merge_categories(dry_run: bool = False):
+    """
+    Merge categories per CATEGORY_MERGE_MAP with a fixed number of set-based statements
+    in one transaction, however many restaurants and categories there are.
+    With dry_run, report what would change and roll back.
+    """
+    merges = [{"old_name": old, "new_name": new} for old, new in CATEGORY_MERGE_MAP.items() if old != new]
+
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        connection.execute(text("CREATE TEMP TABLE category_merge_map (old_name TEXT PRIMARY KEY, new_name TEXT NOT NULL)"))
+        connection.execute(text("INSERT INTO category_merge_map (old_name, new_name) VALUES (:old_name, :new_name)"), merges)
 
-        # Create or fetch merged categories
-        merged_categories = {}
-        for original_category in all_categories:
-            merged_name = CATEGORY_MERGE_MAP.get(original_category.name, original_category.name)
-            if merged_name not in merged_categories:
-                # Create the merged category if it doesn't exist
-                merged_category = session.query(Category).filter_by(name=merged_name).first()
-                if not merged_category:
-                    merged_category = Category(name=merged_name)
-                    session.add(merged_category)
-                    session.flush()  # Save to get the ID
-                merged_categories[merged_name] = merged_category
-            else:
-                merged_category = merged_categories[merged_name]
+        # Create merged categories that something will be merged into and don't exist yet
+        created = connection.execute(text("""
+            INSERT INTO categories (name)
+            SELECT DISTINCT category_merge_map.new_name FROM category_merge_map
+            JOIN categories AS original ON original.name = category_merge_map.old_name
+            WHERE category_merge_map.new_name NOT IN (SELECT name FROM categories)
+        """)).rowcount
 
-            # Update restaurants associated with the original category
-            for restaurant in original_category.restaurants:
-                if merged_category not in restaurant.categories:
-                    restaurant.categories.append(merged_category)
+        # Link restaurants to the merged category, skipping links they already have
+        linked = connection.execute(text("""
+            INSERT OR IGNORE INTO restaurant_category (restaurant_id, category_id)
+            SELECT restaurant_category.restaurant_id, merged.id FROM restaurant_category
+            JOIN categories AS original ON original.id = restaurant_category.category_id
+            JOIN category_merge_map ON category_merge_map.old_name = original.name
+            JOIN categories AS merged ON merged.name = category_merge_map.new_name
+        """)).rowcount
 
-            # Remove the original category if it is being merged
-            if original_category.name != merged_name:
-                session.delete(original_category)
+        # Drop the original categories and their links
+        unlinked = connection.execute(text("""
+            DELETE FROM restaurant_category WHERE category_id IN (
+                SELECT categories.id FROM categories JOIN category_merge_map ON category_merge_map.old_name = categories.name
+            )
+        """)).rowcount
+        removed = connection.execute(text("""
+            DELETE FROM categories WHERE name IN (SELECT old_name FROM category_merge_map)
+        """)).rowcount
+        bump_catalog_version(connection)
 
-        session.commit()
-        print("Categories have been successfully merged and updated.")
+        print(f"Categories created: {created}")
+        print(f"Restaurant links added to merged categories: {linked}")
+        print(f"Restaurant links removed from original categories: {unlinked}")
+        print(f"Categories removed: {removed}")
+
+        if dry_run:
+            transaction.rollback()
+            print("Dry run, no changes were made.")
+        else:
+            transaction.commit()
+            print("Categories have been successfully merged and updated.")
+        connection.execute(text("DROP TABLE IF EXISTS temp.category_merge_map"))
+        connection.commit()
 
 if __name__ == "__main__":
-    merge_categories()
+    import sys
+    from cli import main
+
+    main(["merge-categories", *sys.argv[1:]])
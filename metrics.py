@@ -0,0 +1,215 @@
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from http.cookies import SimpleCookie
+
+import jinja2
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+SIZE_BUCKETS = (0, 64, 128, 256, 512, 1024, 2048, 4096)
+
+
+@dataclass
+class RequestStats:
+    """
+    What one request spent its time on, collected while it runs.
+    """
+    sql_count: int = 0
+    sql_seconds: float = 0.0
+    template_seconds: float = 0.0
+    # Only captured when slow requests are logged
+    statements: list[tuple[str, float]] | None = None
+
+
+current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...], **extra) -> str:
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+@dataclass
+class Histogram:
+    name: str
+    help: str
+    buckets: tuple[float, ...]
+    # labels -> [per bucket counts, count, sum]
+    series: dict = field(default_factory=dict)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series.setdefault(key, [[0] * len(self.buckets), 0, 0.0])
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = sorted((key, list(buckets), count, total) for key, (buckets, count, total) in self.series.items())
+        for key, buckets, count, total in snapshot:
+            for bound, bucket_count in zip(self.buckets, buckets):
+                lines.append(f"{self.name}_bucket{_format_labels(key, le=bound)} {bucket_count}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, le='+Inf')} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class Metrics:
+    """
+    Per-route request metrics, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.request_seconds = Histogram("http_request_duration_seconds", "Request latency by route.", LATENCY_BUCKETS)
+        self.sql_statements = Histogram("http_request_sql_statements", "SQL statements executed per request.", COUNT_BUCKETS)
+        self.sql_seconds = Histogram("http_request_sql_duration_seconds", "Time spent in SQL per request.", LATENCY_BUCKETS)
+        self.template_seconds = Histogram("template_render_duration_seconds", "Jinja template render time.", LATENCY_BUCKETS)
+        self.session_cookie_bytes = Histogram("http_request_session_cookie_bytes", "Size of the session cookie sent with each request.", SIZE_BUCKETS)
+        self.gauges = {}
+
+    def gauge(self, name: str, help: str, read) -> None:
+        """
+        Report `read()` as a gauge at scrape time.
+        """
+        self.gauges[name] = (help, read)
+
+    def render(self) -> str:
+        lines = []
+        for histogram in (self.request_seconds, self.sql_statements, self.sql_seconds, self.template_seconds, self.session_cookie_bytes):
+            lines.extend(histogram.render())
+        for name, (help, read) in self.gauges.items():
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {read()}"])
+        return "\n".join(lines) + "\n"
+
+
+def instrument_engine(engine) -> None:
+    """
+    Count and time every statement the engine runs against the current request.
+    For an AsyncEngine, pass its sync_engine.
+    """
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        stats = current_request.get()
+        if stats is not None:
+            stats.sql_count += 1
+            stats.sql_seconds += elapsed
+            if stats.statements is not None:
+                stats.statements.append((statement, elapsed))
+
+
+def timed_template_class(metrics: Metrics):
+    """
+    Template class that records render time, for `Environment.template_class`.
+    Streamed templates are timed over their whole `generate_async`.
+    """
+    def observe(name: str, elapsed: float) -> None:
+        metrics.template_seconds.observe(elapsed, template=name)
+        stats = current_request.get()
+        if stats is not None:
+            stats.template_seconds += elapsed
+
+    class TimedTemplate(jinja2.Template):
+        def render(self, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return super().render(*args, **kwargs)
+            finally:
+                observe(self.name, time.perf_counter() - start)
+
+        async def generate_async(self, *args, **kwargs):
+            # Only time spent producing output counts, not waiting for the client to take it
+            elapsed = 0.0
+            pieces = super().generate_async(*args, **kwargs)
+            try:
+                while True:
+                    start = time.perf_counter()
+                    try:
+                        piece = await pieces.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                    yield piece
+            finally:
+                await pieces.aclose()
+                observe(self.name, elapsed)
+
+    return TimedTemplate
+
+
+def _session_cookie_size(scope, cookie_name: str) -> int:
+    for name, value in scope.get("headers", ()):
+        if name == b"cookie":
+            morsel = SimpleCookie(value.decode("latin-1")).get(cookie_name)
+            return len(morsel.value) if morsel else 0
+    return 0
+
+
+class MetricsMiddleware:
+    """
+    Records latency, SQL and session cookie size per route. With slow_request_ms set,
+    requests slower than that are logged along with the SQL they ran.
+    """
+
+    def __init__(self, app, metrics: Metrics, slow_request_ms: float | None = None, session_cookie: str = "session"):
+        self.app = app
+        self.metrics = metrics
+        self.slow_request_ms = slow_request_ms
+        self.session_cookie = session_cookie
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(statements=[] if self.slow_request_ms is not None else None)
+        token = current_request.set(stats)
+        status = 500
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            current_request.reset(token)
+            # FastAPI leaves the matched route in the scope, group by its template rather than the raw path.
+            # Mounted apps (static files, admin) are grouped by their mount point.
+            route = getattr(scope.get("route"), "path", None) or scope.get("root_path") or "unmatched"
+            labels = {"method": scope["method"], "route": route}
+            self.metrics.request_seconds.observe(elapsed, status=status, **labels)
+            self.metrics.sql_statements.observe(stats.sql_count, **labels)
+            self.metrics.sql_seconds.observe(stats.sql_seconds, **labels)
+            self.metrics.session_cookie_bytes.observe(_session_cookie_size(scope, self.session_cookie), **labels)
+            if self.slow_request_ms is not None and elapsed * 1000 >= self.slow_request_ms:
+                logger.warning(
+                    "Slow request %s %s: %.1f ms, %d SQL statements in %.1f ms, templates %.1f ms\n%s",
+                    scope["method"], scope["path"], elapsed * 1000, stats.sql_count, stats.sql_seconds * 1000,
+                    stats.template_seconds * 1000,
+                    "\n".join(f"  [{duration * 1000:.1f} ms] {statement}" for statement, duration in stats.statements),
+                )
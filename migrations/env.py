@@ -1,15 +1,21 @@
 from logging.config import fileConfig
 
 from sqlalchemy import engine_from_config
+from sqlalchemy import inspect
 from sqlalchemy import pool
 
 from alembic import context
-from main import Base
+from db import DATABASE_URL
+from models import Base
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config
 
+# Migrate the database the app uses, DATABASE_URL or its default, not a path of alembic.ini's own.
+# configparser reads % as interpolation, hence the escaping.
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
 if config.config_file_name is not None:
@@ -21,6 +27,17 @@ if config.config_file_name is not None:
 # target_metadata = mymodel.Base.metadata
 target_metadata = Base.metadata
 
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """
+    Leave the search index out of autogenerate. restaurants_fts and the shadow tables
+    FTS5 keeps beside it are created by search.py, not the models, so they'd otherwise
+    show up as tables to drop.
+    """
+    return not (type_ == "table" and name.startswith("restaurants_fts"))
+
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -45,6 +62,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        include_object=include_object,
     )
 
     with context.begin_transaction():
@@ -66,9 +84,17 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata, include_object=include_object
         )
 
+        if not inspect(connection).has_table("restaurants"):
+            # A new database: the migrations only alter existing tables, so create the
+            # current schema from the models and record it as up to date instead
+            Base.metadata.create_all(connection)
+            context.get_context().stamp(context.script, "heads")
+            connection.commit()
+            return
+
         with context.begin_transaction():
             context.run_migrations()
 
@@ -0,0 +1,34 @@
+"""add a denormalized click_count to restaurants
+
+Revision ID: 3c1d9a7e52b4
+Revises: ff66ee192fd6
+Create Date: 2026-10-18 09:12:41.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1d9a7e52b4'
+down_revision: Union[str, None] = 'ff66ee192fd6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add 'click_count' to 'restaurants' and backfill it from the 'clicks' table"""
+    op.add_column('restaurants', sa.Column('click_count', sa.Integer, nullable=False, server_default='0'))
+    op.create_index('ix_restaurants_click_count', 'restaurants', ['click_count'])
+    op.execute(
+        "UPDATE restaurants SET click_count = "
+        "(SELECT count(*) FROM clicks WHERE clicks.restaurant_id = restaurants.id)"
+    )
+
+
+def downgrade() -> None:
+    """Drop the 'click_count' column from the 'restaurants' table"""
+    op.drop_index('ix_restaurants_click_count', 'restaurants')
+    op.drop_column('restaurants', 'click_count')
@@ -0,0 +1,30 @@
+"""add latitude and longitude to restaurants
+
+Revision ID: 5a7f3e19d2c8
+Revises: 8e4b21f07c6a
+Create Date: 2026-10-18 10:41:09.204117
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5a7f3e19d2c8'
+down_revision: Union[str, None] = '8e4b21f07c6a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add 'latitude' and 'longitude' columns to the 'restaurants' table"""
+    op.add_column('restaurants', sa.Column('latitude', sa.Float, nullable=True))
+    op.add_column('restaurants', sa.Column('longitude', sa.Float, nullable=True))
+
+
+def downgrade() -> None:
+    """Drop the 'latitude' and 'longitude' columns from the 'restaurants' table"""
+    op.drop_column('restaurants', 'longitude')
+    op.drop_column('restaurants', 'latitude')
@@ -0,0 +1,46 @@
+"""add hourly/daily click rollups
+
+Revision ID: 6f0a8c2d4e17
+Revises: d41e7b6a9c35
+Create Date: 2026-10-18 12:47:15.602381
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '6f0a8c2d4e17'
+down_revision: Union[str, None] = 'd41e7b6a9c35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create 'click_rollups', backfill hourly rollups from 'clicks' and index clicks by timestamp"""
+    # create_app() and the cli.py commands run create_all, which adds the new table to a
+    # database that hasn't been upgraded yet if one of them ran first
+    if not sa.inspect(op.get_bind()).has_table('click_rollups'):
+        op.create_table(
+            'click_rollups',
+            sa.Column('restaurant_id', sa.Integer, sa.ForeignKey('restaurants.id'), primary_key=True),
+            sa.Column('period', sa.String, primary_key=True),
+            sa.Column('bucket', sa.DateTime, primary_key=True),
+            sa.Column('clicks', sa.Integer, nullable=False),
+        )
+        op.create_index('ix_click_rollups_period_bucket', 'click_rollups', ['period', 'bucket'])
+    op.create_index('ix_clicks_timestamp', 'clicks', ['timestamp'])
+    op.execute("""
+        INSERT INTO click_rollups (restaurant_id, period, bucket, clicks)
+        SELECT restaurant_id, 'hour', strftime('%Y-%m-%d %H:00:00.000000', timestamp), count(*)
+        FROM clicks WHERE timestamp IS NOT NULL
+        GROUP BY restaurant_id, strftime('%Y-%m-%d %H', timestamp)
+    """)
+
+
+def downgrade() -> None:
+    """Drop 'click_rollups' and the clicks timestamp index"""
+    op.drop_index('ix_clicks_timestamp', 'clicks')
+    op.drop_table('click_rollups')
@@ -0,0 +1,78 @@
+"""add an fts5 search index over restaurants
+
+Revision ID: 8e4b21f07c6a
+Revises: 3c1d9a7e52b4
+Create Date: 2026-10-18 10:03:27.551872
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8e4b21f07c6a'
+down_revision: Union[str, None] = '3c1d9a7e52b4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def category_names(restaurant_id: str) -> str:
+    return f"""(
+        SELECT group_concat(categories.name, ' ') FROM restaurant_category
+        JOIN categories ON categories.id = restaurant_category.category_id
+        WHERE restaurant_category.restaurant_id = {restaurant_id}
+    )"""
+
+
+def upgrade() -> None:
+    """Create the 'restaurants_fts' table, the triggers that keep it in sync, and backfill it"""
+    op.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS restaurants_fts USING fts5(
+            name, location, city, categories, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+        )
+    """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS restaurants_fts_insert AFTER INSERT ON restaurants BEGIN
+            INSERT INTO restaurants_fts (rowid, name, location, city, categories)
+            VALUES (new.id, new.name, new.location, new.city, {category_names("new.id")});
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS restaurants_fts_update AFTER UPDATE OF name, location, city ON restaurants BEGIN
+            UPDATE restaurants_fts SET name = new.name, location = new.location, city = new.city WHERE rowid = new.id;
+        END
+    """)
+    op.execute("""
+        CREATE TRIGGER IF NOT EXISTS restaurants_fts_delete AFTER DELETE ON restaurants BEGIN
+            DELETE FROM restaurants_fts WHERE rowid = old.id;
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS restaurants_fts_category_insert AFTER INSERT ON restaurant_category BEGIN
+            UPDATE restaurants_fts SET categories = {category_names("new.restaurant_id")} WHERE rowid = new.restaurant_id;
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS restaurants_fts_category_delete AFTER DELETE ON restaurant_category BEGIN
+            UPDATE restaurants_fts SET categories = {category_names("old.restaurant_id")} WHERE rowid = old.restaurant_id;
+        END
+    """)
+    op.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS restaurants_fts_category_rename AFTER UPDATE OF name ON categories BEGIN
+            UPDATE restaurants_fts SET categories = {category_names("restaurants_fts.rowid")}
+            WHERE rowid IN (SELECT restaurant_id FROM restaurant_category WHERE category_id = new.id);
+        END
+    """)
+    op.execute(f"""
+        INSERT INTO restaurants_fts (rowid, name, location, city, categories)
+        SELECT restaurants.id, restaurants.name, restaurants.location, restaurants.city, {category_names("restaurants.id")}
+        FROM restaurants WHERE restaurants.id NOT IN (SELECT rowid FROM restaurants_fts)
+    """)
+
+
+def downgrade() -> None:
+    """Drop the 'restaurants_fts' table and its triggers"""
+    for trigger in ("insert", "update", "delete", "category_insert", "category_delete", "category_rename"):
+        op.execute(f"DROP TRIGGER IF EXISTS restaurants_fts_{trigger}")
+    op.execute("DROP TABLE IF EXISTS restaurants_fts")
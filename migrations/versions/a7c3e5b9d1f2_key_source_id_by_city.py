@@ -0,0 +1,29 @@
+"""key restaurant source ids by city
+
+Revision ID: a7c3e5b9d1f2
+Revises: 6f0a8c2d4e17
+Create Date: 2026-10-18 14:21:06.318204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e5b9d1f2'
+down_revision: Union[str, None] = '6f0a8c2d4e17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Make 'source_id' unique per city instead of across 'restaurants', since each city has its own feed"""
+    op.drop_index('ix_restaurants_source_id', 'restaurants')
+    op.create_index('ix_restaurants_city_source_id', 'restaurants', ['city', 'source_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Make 'source_id' unique across 'restaurants' again"""
+    op.drop_index('ix_restaurants_city_source_id', 'restaurants')
+    op.create_index('ix_restaurants_source_id', 'restaurants', ['source_id'], unique=True)
@@ -0,0 +1,30 @@
+"""add the feed recid to restaurants as source_id
+
+Revision ID: b9d2c4e8f013
+Revises: 5a7f3e19d2c8
+Create Date: 2026-10-18 11:26:52.770431
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b9d2c4e8f013'
+down_revision: Union[str, None] = '5a7f3e19d2c8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add a unique 'source_id' column to the 'restaurants' table"""
+    op.add_column('restaurants', sa.Column('source_id', sa.Integer, nullable=True))
+    op.create_index('ix_restaurants_source_id', 'restaurants', ['source_id'], unique=True)
+
+
+def downgrade() -> None:
+    """Drop the 'source_id' column from the 'restaurants' table"""
+    op.drop_index('ix_restaurants_source_id', 'restaurants')
+    op.drop_column('restaurants', 'source_id')
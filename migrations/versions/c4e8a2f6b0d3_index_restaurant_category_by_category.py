@@ -0,0 +1,27 @@
+"""index restaurant_category by category
+
+Revision ID: c4e8a2f6b0d3
+Revises: a7c3e5b9d1f2
+Create Date: 2026-10-18 15:02:44.781930
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8a2f6b0d3'
+down_revision: Union[str, None] = 'a7c3e5b9d1f2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Index 'restaurant_category' by category_id, for counting a category's restaurants"""
+    op.create_index('ix_restaurant_category_category_id', 'restaurant_category', ['category_id'])
+
+
+def downgrade() -> None:
+    """Drop the category_id index from 'restaurant_category'"""
+    op.drop_index('ix_restaurant_category_category_id', 'restaurant_category')
@@ -0,0 +1,27 @@
+"""index restaurants by city and click_count
+
+Revision ID: d41e7b6a9c35
+Revises: b9d2c4e8f013
+Create Date: 2026-10-18 12:08:33.915440
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd41e7b6a9c35'
+down_revision: Union[str, None] = 'b9d2c4e8f013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add a (city, click_count) index to 'restaurants' for paging through a city by popularity"""
+    op.create_index('ix_restaurants_city_click_count', 'restaurants', ['city', 'click_count'])
+
+
+def downgrade() -> None:
+    """Drop the (city, click_count) index from 'restaurants'"""
+    op.drop_index('ix_restaurants_city_click_count', 'restaurants')
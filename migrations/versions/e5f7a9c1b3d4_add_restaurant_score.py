@@ -0,0 +1,45 @@
+"""add yelp fields and composite score to restaurants
+
+Revision ID: e5f7a9c1b3d4
+Revises: c4e8a2f6b0d3
+Create Date: 2026-10-18 16:02:41.527310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from scoring import SCORE, register_score_function
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f7a9c1b3d4'
+down_revision: Union[str, None] = 'c4e8a2f6b0d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Add the yelp rating, review count, price and quality score to 'restaurants', and the 'score' they make up with click_count"""
+    op.add_column('restaurants', sa.Column('yelp_rating', sa.Float, nullable=True))
+    op.add_column('restaurants', sa.Column('yelp_review_count', sa.Integer, nullable=True))
+    op.add_column('restaurants', sa.Column('price', sa.Integer, nullable=True))
+    op.add_column('restaurants', sa.Column('quality_score', sa.Float, nullable=True))
+    op.add_column('restaurants', sa.Column('score', sa.Float, nullable=False, server_default='0'))
+    op.create_index('ix_restaurants_score', 'restaurants', ['score'])
+    op.create_index('ix_restaurants_city_score', 'restaurants', ['city', 'score'])
+    # The yelp fields are filled in by the next import, until then this scores clicks only
+    register_score_function(op.get_bind().connection.driver_connection)
+    op.execute(f"UPDATE restaurants SET score = {SCORE}")
+
+
+def downgrade() -> None:
+    """Drop the yelp fields and 'score' from 'restaurants'"""
+    op.drop_index('ix_restaurants_city_score', 'restaurants')
+    op.drop_index('ix_restaurants_score', 'restaurants')
+    op.drop_column('restaurants', 'score')
+    op.drop_column('restaurants', 'quality_score')
+    op.drop_column('restaurants', 'price')
+    op.drop_column('restaurants', 'yelp_review_count')
+    op.drop_column('restaurants', 'yelp_rating')
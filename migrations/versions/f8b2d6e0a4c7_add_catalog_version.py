@@ -0,0 +1,35 @@
+"""add catalog version
+
+Revision ID: f8b2d6e0a4c7
+Revises: e5f7a9c1b3d4
+Create Date: 2026-10-18 19:12:05.418236
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f8b2d6e0a4c7'
+down_revision: Union[str, None] = 'e5f7a9c1b3d4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Create 'catalog_version', counting catalog edits for the app's processes"""
+    # create_app() and the cli.py commands run create_all, which adds the new table to a
+    # database that hasn't been upgraded yet if one of them ran first
+    if not sa.inspect(op.get_bind()).has_table('catalog_version'):
+        op.create_table(
+            'catalog_version',
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('version', sa.Integer, nullable=False),
+        )
+
+
+def downgrade() -> None:
+    """Drop 'catalog_version'"""
+    op.drop_table('catalog_version')
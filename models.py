@@ -0,0 +1,138 @@
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Table, Boolean, Index, event, func, select
+from sqlalchemy.orm import column_property, declarative_base, relationship
+
+from scoring import restaurant_score
+
+
+Base = declarative_base()
+
+restaurant_category = Table(
+    "restaurant_category",
+    Base.metadata,
+    Column("restaurant_id", Integer, ForeignKey("restaurants.id"), primary_key=True),
+    Column("category_id", Integer, ForeignKey("categories.id"), primary_key=True),
+    # The primary key leads with the restaurant, this finds a category's restaurants
+    Index("ix_restaurant_category_category_id", "category_id"),
+)
+
+class User(Base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, nullable=False)
+    hashed_password = Column(String, nullable=False)
+    is_admin = Column(Boolean, default=False) 
+
+class Restaurant(Base):
+    __tablename__ = "restaurants"
+    __table_args__ = (
+        # Popularity order within a city, for the paginated API
+        Index("ix_restaurants_city_click_count", "city", "click_count"),
+        # Each city is imported from its own feed, whose recids may overlap another city's
+        Index("ix_restaurants_city_source_id", "city", "source_id", unique=True),
+        # Best scored first within a city
+        Index("ix_restaurants_city_score", "city", "score"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    # recid of the listing feed the restaurant was imported from
+    source_id = Column(Integer, nullable=True)
+    name = Column(String, index=True)
+    location = Column(String, index=True)
+    city = Column(String, index=True, nullable=True)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    website = Column(String)
+    url_verified_at = Column(DateTime, nullable=True)
+    # Denormalized count of clicks, maintained by flush_clicks so ranking doesn't scan the clicks table
+    click_count = Column(Integer, nullable=False, default=0, server_default="0", index=True)
+    # From the feed's yelp block and qualityScore
+    yelp_rating = Column(Float, nullable=True)
+    yelp_review_count = Column(Integer, nullable=True)
+    price = Column(Integer, nullable=True)  # 1 to 4 for Yelp's $ to $$$$
+    quality_score = Column(Float, nullable=True)
+    # scoring.restaurant_score of the columns above and click_count, updated by whatever changes them
+    score = Column(Float, nullable=False, default=0, server_default="0", index=True)
+    clicks = relationship("Click", back_populates="restaurant")
+    categories = relationship("Category", secondary=restaurant_category, back_populates="restaurants")
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<Restaurant(name={self.name})>"
+
+@event.listens_for(Restaurant, "before_insert")
+@event.listens_for(Restaurant, "before_update")
+def update_restaurant_score(mapper, connection, target):
+    # Edits through the ORM, like the admin's. Bulk writes update the score in their own statements.
+    target.score = restaurant_score(target.click_count, target.yelp_rating, target.yelp_review_count, target.quality_score)
+
+class Category(Base):
+    __tablename__ = "categories"
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, unique=True, index=True)
+    restaurants = relationship("Restaurant", secondary=restaurant_category, back_populates="categories")
+    # Counted from ix_restaurant_category_category_id, only loaded where asked for with undefer
+    restaurant_count = column_property(
+        select(func.count()).where(restaurant_category.c.category_id == id).scalar_subquery(),
+        deferred=True,
+    )
+
+    def __str__(self):
+        return self.name
+
+    def __repr__(self):
+        return f"<Category(name={self.name})>"
+
+class Click(Base):
+    __tablename__ = "clicks"
+    id = Column(Integer, primary_key=True, index=True)
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), nullable=False)
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+    restaurant = relationship("Restaurant", back_populates="clicks")
+
+    # Without touching self.restaurant, so listing clicks doesn't load a restaurant per row
+    def __str__(self):
+        return f"Click on restaurant {self.restaurant_id} at {self.timestamp}"
+
+    def __repr__(self):
+        return f"<Click(restaurant_id={self.restaurant_id})>"
+
+
+class ClickRollup(Base):
+    """
+    Clicks per restaurant per hour, folded into days as they age (see rollups.compact_click_history).
+    """
+    __tablename__ = "click_rollups"
+    __table_args__ = (Index("ix_click_rollups_period_bucket", "period", "bucket"),)
+    restaurant_id = Column(Integer, ForeignKey("restaurants.id"), primary_key=True)
+    period = Column(String, primary_key=True)  # "hour" or "day"
+    bucket = Column(DateTime, primary_key=True)  # start of the hour or day, UTC
+    clicks = Column(Integer, nullable=False, default=0)
+
+
+
+
+class CatalogVersion(Base):
+    """
+    One row counting committed restaurant and category edits, so every process serving
+    pages can tell when another one changed the catalog (see catalog.py).
+    """
+    __tablename__ = "catalog_version"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+
+class SuggestedChanges(Base):
+    __tablename__ = "suggested_changes"
+    id = Column(Integer, primary_key=True, index=True)
+    suggestion = Column(String, nullable=False)
+    handled = Column(Boolean, nullable=False, default=False)
+
+@event.listens_for(Base.metadata, "after_create")
+def create_restaurant_search_index(target, connection, **kw):
+    # search pulls in the async extension, which scripts importing the models don't need
+    from search import create_search_index
+
+    create_search_index(connection)
@@ -0,0 +1,237 @@
+import asyncio
+import hashlib
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # Optional, pages are only precompressed with gzip without it
+    brotli = None
+
+# Where the per-visitor part of a cached page goes
+PERSONAL_MARKER = "<!-- personal -->"
+
+
+_GZIP_HEADER = bytes([0x1F, 0x8B, 8, 0, 0, 0, 0, 0, 0, 255])
+
+
+def _deflate(data: bytes, final: bool) -> bytes:
+    """
+    Raw deflate for one part of a gzip body. Parts other than the last end on a sync
+    flush, so independently compressed parts can follow them in the same stream.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+def _gzip_stream(parts: list[bytes], crc: int, size: int) -> bytes:
+    return b"".join([_GZIP_HEADER, *parts, struct.pack("<II", crc, size & 0xFFFFFFFF)])
+
+
+def _crc32_shift(length: int) -> list[int]:
+    """
+    The linear map taking crc32(a) to crc32(a + b) ^ crc32(b) for any `length` bytes b,
+    one column per bit, so a checksum can be extended past the tail without rereading it.
+    """
+    zeros = bytes(length)
+    base = zlib.crc32(zeros, 0)
+    return [zlib.crc32(zeros, 1 << bit) ^ base for bit in range(32)]
+
+
+def _apply_shift(shift: list[int], crc: int) -> int:
+    result = 0
+    for column in shift:
+        if crc & 1:
+            result ^= column
+        crc >>= 1
+    return result
+
+
+@dataclass(slots=True, frozen=True)
+class CachedPage:
+    """
+    A rendered page split around PERSONAL_MARKER, with each half precompressed. A
+    personalised page is sent as a single gzip stream of the cached head, a freshly
+    compressed personal part and the cached tail.
+    """
+    etag: str
+    head: bytes
+    tail: bytes
+    head_deflate: bytes
+    tail_deflate: bytes
+    head_crc: int
+    tail_crc: int
+    tail_shift: list[int]
+    # The whole page without a personal part
+    gzip: bytes
+    # Likewise, when brotli is installed
+    brotli: bytes | None
+
+    @classmethod
+    def build(cls, html: str) -> "CachedPage":
+        head, _, tail = html.partition(PERSONAL_MARKER)
+        head, tail = head.encode(), tail.encode()
+        head_deflate, tail_deflate = _deflate(head, final=False), _deflate(tail, final=True)
+        head_crc, tail_crc, tail_shift = zlib.crc32(head), zlib.crc32(tail), _crc32_shift(len(tail))
+        return cls(
+            etag=hashlib.blake2b(head + tail, digest_size=16).hexdigest(),
+            head=head,
+            tail=tail,
+            head_deflate=head_deflate,
+            tail_deflate=tail_deflate,
+            head_crc=head_crc,
+            tail_crc=tail_crc,
+            tail_shift=tail_shift,
+            gzip=_gzip_stream(
+                [head_deflate, tail_deflate], _apply_shift(tail_shift, head_crc) ^ tail_crc, len(head) + len(tail)
+            ),
+            brotli=brotli.compress(head + tail, quality=5) if brotli else None,
+        )
+
+    @property
+    def size(self) -> int:
+        """
+        Roughly the bytes this page holds in memory.
+        """
+        return (
+            len(self.head) + len(self.tail) + len(self.head_deflate) + len(self.tail_deflate)
+            + len(self.gzip) + len(self.brotli or b"") + 32 * 8
+        )
+
+    def gzip_with(self, personal: bytes) -> bytes:
+        crc = _apply_shift(self.tail_shift, zlib.crc32(personal, self.head_crc)) ^ self.tail_crc
+        size = len(self.head) + len(personal) + len(self.tail)
+        return _gzip_stream([self.head_deflate, _deflate(personal, final=False), self.tail_deflate], crc, size)
+
+
+class PageCache:
+    """
+    Rendered pages by key, least recently used evicted past `max_bytes` in total. `clear`
+    drops everything, for catalog edits. Popularity changes only drop pages once per
+    `popularity_refresh` seconds, so a steady stream of clicks doesn't defeat the cache.
+
+    A page bigger than `max_page_bytes` isn't kept, and its key stops being `cacheable`
+    until the next clear, so the caller can stream it instead of building it whole.
+
+    `clear` is also called from commit hooks on the writer and admin threads, so the
+    pages and their sizes are only touched under a lock, never held across an await.
+    """
+
+    def __init__(self, max_bytes: int = 32 << 20, max_page_bytes: int = 2 << 20, popularity_refresh: float = 60.0,
+                 max_oversize_keys: int = 1024):
+        self.max_bytes = max_bytes
+        self.max_page_bytes = max_page_bytes
+        self.popularity_refresh = popularity_refresh
+        self.max_oversize_keys = max_oversize_keys
+        self.size = 0
+        self._pages: OrderedDict[tuple, CachedPage] = OrderedDict()
+        self._oversize: OrderedDict[tuple, None] = OrderedDict()
+        self._rendering: dict[tuple, asyncio.Future] = {}
+        self._popularity_stale = False
+        self._epoch_started = time.monotonic()
+        # Bumped on clear, so a render that raced an edit isn't stored
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pages.clear()
+            self._oversize.clear()
+            self.size = 0
+            self._generation += 1
+            self._epoch_started = time.monotonic()
+
+    def mark_popularity_changed(self) -> None:
+        self._popularity_stale = True
+
+    def cacheable(self, key: tuple) -> bool:
+        """
+        Whether `get` is worth calling for `key`, False once its page proved too big to keep.
+        """
+        return self.max_bytes > 0 and key not in self._oversize
+
+    async def get(self, key: tuple, render) -> CachedPage:
+        """
+        The cached page for `key`, or the result of awaiting `render()` for its HTML.
+        Concurrent misses for the same key share one render.
+        """
+        if self._popularity_stale and time.monotonic() - self._epoch_started >= self.popularity_refresh:
+            self._popularity_stale = False
+            self.clear()
+        with self._lock:
+            page = self._pages.get(key)
+            if page is not None:
+                self._pages.move_to_end(key)
+                return page
+        if key in self._rendering:
+            return await asyncio.shield(self._rendering[key])
+
+        generation = self._generation
+        future = asyncio.get_running_loop().create_future()
+        self._rendering[key] = future
+        try:
+            html = await render()
+            page = await asyncio.to_thread(CachedPage.build, html)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as error:
+            future.set_exception(error)
+            # Nobody else may be waiting, don't warn about an unretrieved exception
+            future.exception()
+            raise
+        finally:
+            del self._rendering[key]
+        future.set_result(page)
+        with self._lock:
+            if generation != self._generation:
+                return page
+            if page.size > self.max_page_bytes:
+                self._oversize[key] = None
+                while len(self._oversize) > self.max_oversize_keys:
+                    self._oversize.popitem(last=False)
+                return page
+            replaced = self._pages.pop(key, None)
+            if replaced is not None:
+                self.size -= replaced.size
+            self._pages[key] = page
+            self.size += page.size
+            while self.size > self.max_bytes and self._pages:
+                self.size -= self._pages.popitem(last=False)[1].size
+        return page
+
+
+def page_response(request, page: CachedPage, personal: str = "", media_type: str = "text/html; charset=utf-8") -> Response:
+    """
+    Serve a cached page with `personal` HTML composed in, in the best encoding the
+    client accepts, with a strong ETag per encoding, or 304 if the client has it.
+    """
+    accepted = request.headers.get("accept-encoding", "")
+    personal = personal.encode()
+    etag = page.etag
+    if personal:
+        etag = hashlib.blake2b(etag.encode() + personal, digest_size=16).hexdigest()
+
+    if page.brotli is not None and not personal and "br" in accepted:
+        encoding, body = "br", lambda: page.brotli
+    elif "gzip" in accepted:
+        encoding, body = "gzip", lambda: page.gzip_with(personal) if personal else page.gzip
+    else:
+        encoding, body = None, lambda: page.head + personal + page.tail
+
+    headers = {
+        "ETag": f'"{etag}-{encoding}"' if encoding else f'"{etag}"',
+        "Vary": "Accept-Encoding, Cookie",
+        "Cache-Control": "private, no-cache" if personal else "public, no-cache",
+    }
+    if headers["ETag"] in (tag.strip() for tag in request.headers.get("if-none-match", "").split(",")):
+        return Response(status_code=304, headers=headers)
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return Response(body(), headers=headers, media_type=media_type)
@@ -0,0 +1,125 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from passlib.context import CryptContext
+
+# Worker processes run at this lower priority, so hashing gets whatever CPU the web process leaves over
+WORKER_NICENESS = 10
+
+_context: CryptContext | None = None
+
+
+def _start_worker(config: str) -> None:
+    global _context
+    _context = CryptContext.from_string(config)
+    os.nice(WORKER_NICENESS)
+
+
+def _verify(password: str, hashed_password: str) -> bool:
+    return _context.verify(password, hashed_password)
+
+
+def _hash(password: str) -> str:
+    return _context.hash(password)
+
+
+class PasswordHasherBusy(Exception):
+    """
+    Too many password checks are already queued.
+    """
+
+
+class LoginThrottled(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"Too many login attempts, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class PasswordHasher:
+    """
+    Runs passlib hashing and verification in a small pool of low priority processes,
+    so bcrypt's CPU time is neither spent on the event loop nor competing with it.
+    At most `max_pending` checks may be running or queued, further ones are rejected
+    with PasswordHasherBusy instead of piling up behind a flood of attempts.
+    The pool is started on first use.
+    """
+
+    def __init__(self, context: CryptContext, max_workers: int = 2, max_pending: int = 16):
+        self.config = context.to_string()
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._pending = 0
+        self._executor: ProcessPoolExecutor | None = None
+
+    async def _run(self, function, *args):
+        if self._pending >= self.max_pending:
+            raise PasswordHasherBusy()
+        if self._executor is None:
+            # Spawned rather than forked, the web process has threads that must not be copied mid-flight
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_start_worker,
+                initargs=(self.config,),
+            )
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+        finally:
+            self._pending -= 1
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(_verify, password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    def pending(self) -> int:
+        return self._pending
+
+
+class LoginThrottle:
+    """
+    Sliding window limit of `max_attempts` login attempts per key (a username from one
+    client, or a client address) every `window` seconds. Checked before any password
+    hashing, so rejected attempts cost almost nothing. Only the `max_keys` most recently
+    seen keys are tracked.
+    """
+
+    def __init__(self, max_attempts: int = 5, window: float = 300.0, max_keys: int = 100_000):
+        self.max_attempts = max_attempts
+        self.window = window
+        self.max_keys = max_keys
+        self._attempts: OrderedDict[str, deque[float]] = OrderedDict()
+
+    def attempt(self, *keys: str) -> None:
+        """
+        Record an attempt against every key, or raise LoginThrottled without recording
+        it if any of them is over the limit.
+        """
+        now = time.monotonic()
+        retry_after = None
+        for key in keys:
+            attempts = self._attempts.get(key)
+            if attempts is None:
+                continue
+            while attempts and attempts[0] <= now - self.window:
+                attempts.popleft()
+            if len(attempts) >= self.max_attempts:
+                retry_after = max(retry_after or 0.0, attempts[0] + self.window - now)
+        if retry_after is not None:
+            raise LoginThrottled(retry_after)
+
+        for key in keys:
+            attempts = self._attempts.setdefault(key, deque())
+            attempts.append(now)
+            self._attempts.move_to_end(key)
+        while len(self._attempts) > self.max_keys:
+            self._attempts.popitem(last=False)
+
+    def reset(self, key: str) -> None:
+        self._attempts.pop(key, None)
@@ -0,0 +1,22 @@
+import datetime
+from db import engine
+from rollups import compact_click_history
+
+
+def prune_clicks():
+    """
+    Compact click history: fold old hourly rollups into days and drop rows past retention.
+    Meant to run daily from cron.
+    """
+    with engine.begin() as connection:
+        counts = compact_click_history(connection, datetime.datetime.utcnow())
+
+    print(f"Hourly rollups folded into days: {counts['hours_folded']}")
+    print(f"Daily rollups pruned: {counts['days_pruned']}")
+    print(f"Raw clicks pruned: {counts['clicks_pruned']}")
+
+
+if __name__ == "__main__":
+    from cli import main
+
+    main(["prune-clicks"])
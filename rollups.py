@@ -0,0 +1,102 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+# Raw clicks, hourly and daily rollups are kept this long. All-time totals live in restaurants.click_count.
+CLICK_RETENTION = timedelta(days=90)
+HOURLY_RETENTION = timedelta(days=14)
+DAILY_RETENTION = timedelta(days=730)
+
+# Timestamp format SQLAlchemy uses for DateTime columns on SQLite
+_SQLITE_DATETIME = "%Y-%m-%d %H:%M:%S.%f"
+
+
+def hour_bucket(timestamp: datetime) -> datetime:
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def compact_click_history(connection, now: datetime) -> dict[str, int]:
+    """
+    Fold hourly rollups older than HOURLY_RETENTION into daily ones and drop raw clicks
+    and daily rollups past their retention, so storage stays bounded. Raw clicks are only
+    ever dropped oldest id first. Returns row counts.
+    """
+    hourly_cutoff = (now - HOURLY_RETENTION).strftime(_SQLITE_DATETIME)
+    counts = {}
+    counts["hours_folded"] = connection.execute(text("""
+        INSERT INTO click_rollups (restaurant_id, period, bucket, clicks)
+        SELECT restaurant_id, 'day', strftime('%Y-%m-%d 00:00:00.000000', bucket), sum(clicks)
+        FROM click_rollups WHERE period = 'hour' AND bucket < :cutoff
+        GROUP BY restaurant_id, strftime('%Y-%m-%d', bucket)
+        ON CONFLICT (restaurant_id, period, bucket) DO UPDATE SET clicks = clicks + excluded.clicks
+    """), {"cutoff": hourly_cutoff}).rowcount
+    connection.execute(text("DELETE FROM click_rollups WHERE period = 'hour' AND bucket < :cutoff"), {"cutoff": hourly_cutoff})
+    counts["days_pruned"] = connection.execute(
+        text("DELETE FROM click_rollups WHERE period = 'day' AND bucket < :cutoff"),
+        {"cutoff": (now - DAILY_RETENTION).strftime(_SQLITE_DATETIME)},
+    ).rowcount
+    # Everything before the first click still kept, rather than every click past the cutoff,
+    # so the remaining ids stay contiguous for the admin's click count. Clicks flushed out of
+    # order by different workers are kept a little longer instead of leaving holes.
+    counts["clicks_pruned"] = connection.execute(text("""
+        DELETE FROM clicks WHERE id < coalesce(
+            (SELECT min(id) FROM clicks WHERE timestamp >= :cutoff),
+            (SELECT max(id) + 1 FROM clicks)
+        )
+    """), {"cutoff": (now - CLICK_RETENTION).strftime(_SQLITE_DATETIME)}).rowcount
+    return counts
+
+
+def decayed_scores(rollups, now: datetime, half_life_hours: float) -> dict[int, float]:
+    """
+    Sum (restaurant_id, bucket, clicks) rollups per restaurant, halving the weight
+    of a click every `half_life_hours`.
+    """
+    scores = {}
+    for restaurant_id, bucket, clicks in rollups:
+        age_hours = (now - bucket).total_seconds() / 3600
+        scores[restaurant_id] = scores.get(restaurant_id, 0.0) + clicks * 0.5 ** (age_hours / half_life_hours)
+    return scores
+
+
+class TrendingRanking:
+    """
+    Restaurants ranked by exponentially decayed clicks over a recent window, computed
+    from hourly rollups and cached for `refresh` seconds.
+    """
+
+    def __init__(self, load, window: timedelta = timedelta(days=7), half_life_hours: float = 24.0, refresh: float = 300.0):
+        self.load = load
+        self.window = window
+        self.half_life_hours = half_life_hours
+        self.refresh = refresh
+        self.scores: dict[int, float] = {}
+        self._built_at = None
+        self._ranked: tuple[list[int], list[int]] | None = None
+        self._lock = asyncio.Lock()
+
+    async def update(self) -> None:
+        """
+        Reload scores if they are older than `refresh`. `load` is awaited with the start
+        of the window for (restaurant_id, bucket, clicks) hourly rollups.
+        """
+        if self._built_at is not None and time.monotonic() - self._built_at < self.refresh:
+            return
+        async with self._lock:
+            if self._built_at is not None and time.monotonic() - self._built_at < self.refresh:
+                return
+            now = datetime.utcnow()
+            self.scores = decayed_scores(await self.load(now - self.window), now, self.half_life_hours)
+            self._built_at = time.monotonic()
+            self._ranked = None
+
+    def rank(self, popularity_order: list[int]) -> list[int]:
+        """
+        Every restaurant in `popularity_order`, trending ones first. Ties keep popularity order.
+        """
+        if self._ranked is None or self._ranked[0] is not popularity_order:
+            scores = self.scores
+            self._ranked = (popularity_order, sorted(popularity_order, key=lambda restaurant_id: -scores.get(restaurant_id, 0.0)))
+        return self._ranked[1]
@@ -0,0 +1,47 @@
+import math
+import os
+
+from sqlalchemy import bindparam, text
+
+# Weights of the composite score. Stored scores only pick up a change after `cli.py rescore`.
+PRIOR_RATING = float(os.environ.get("SCORE_PRIOR_RATING", 3.5))
+PRIOR_REVIEWS = float(os.environ.get("SCORE_PRIOR_REVIEWS", 25))
+CLICK_WEIGHT = float(os.environ.get("SCORE_CLICK_WEIGHT", 0.25))
+QUALITY_WEIGHT = float(os.environ.get("SCORE_QUALITY_WEIGHT", 0.02))
+
+PRICE_LEVELS = {"$": 1, "$$": 2, "$$$": 3, "$$$$": 4}
+
+
+def restaurant_score(click_count, rating, review_count, quality_score) -> float:
+    """
+    The Yelp rating averaged with PRIOR_REVIEWS reviews of PRIOR_RATING, so a 5.0 from
+    three reviews doesn't outrank a 4.6 from four hundred and an unrated restaurant sits
+    at the prior, plus log-scaled clicks and the feed's qualityScore.
+    """
+    reviews = review_count or 0 if rating is not None else 0
+    rating = (PRIOR_RATING * PRIOR_REVIEWS + (rating or 0) * reviews) / (PRIOR_REVIEWS + reviews) if PRIOR_REVIEWS + reviews else PRIOR_RATING
+    return rating + CLICK_WEIGHT * math.log1p(max(click_count or 0, 0)) + QUALITY_WEIGHT * (quality_score or 0)
+
+
+def register_score_function(dbapi_connection, connection_record=None) -> None:
+    """
+    Make restaurant_score callable from SQL on a sqlite3 connection, so scores are
+    updated in the same statements that change their inputs. A "connect" listener.
+    """
+    dbapi_connection.create_function("restaurant_score", 4, restaurant_score, deterministic=True)
+
+
+# The score of each row, from its own columns
+SCORE = "restaurant_score(click_count, yelp_rating, yelp_review_count, quality_score)"
+
+
+def rescore(connection, ids=None) -> int:
+    """
+    Recompute the stored score of the restaurants with `ids`, or of every one. Returns the row count.
+    """
+    if ids is None:
+        return connection.execute(text(f"UPDATE restaurants SET score = {SCORE}")).rowcount
+    return connection.execute(
+        text(f"UPDATE restaurants SET score = {SCORE} WHERE id IN :ids").bindparams(bindparam("ids", expanding=True)),
+        {"ids": list(ids)},
+    ).rowcount
@@ -0,0 +1,135 @@
+import math
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _category_names(restaurant_id: str) -> str:
+    """
+    Subquery for the space separated category names of a restaurant, for the fts 'categories' column.
+    """
+    return f"""(
+        SELECT group_concat(categories.name, ' ') FROM restaurant_category
+        JOIN categories ON categories.id = restaurant_category.category_id
+        WHERE restaurant_category.restaurant_id = {restaurant_id}
+    )"""
+
+
+# FTS5 index over restaurant name, location, city and category names, kept in sync by triggers
+# so that writes from the app, the admin and the scripts are all picked up.
+FTS_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS restaurants_fts USING fts5(
+        name, location, city, categories, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS restaurants_fts_insert AFTER INSERT ON restaurants BEGIN
+        INSERT INTO restaurants_fts (rowid, name, location, city, categories)
+        VALUES (new.id, new.name, new.location, new.city, {_category_names("new.id")});
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS restaurants_fts_update AFTER UPDATE OF name, location, city ON restaurants BEGIN
+        UPDATE restaurants_fts SET name = new.name, location = new.location, city = new.city WHERE rowid = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS restaurants_fts_delete AFTER DELETE ON restaurants BEGIN
+        DELETE FROM restaurants_fts WHERE rowid = old.id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS restaurants_fts_category_insert AFTER INSERT ON restaurant_category BEGIN
+        UPDATE restaurants_fts SET categories = {_category_names("new.restaurant_id")} WHERE rowid = new.restaurant_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS restaurants_fts_category_delete AFTER DELETE ON restaurant_category BEGIN
+        UPDATE restaurants_fts SET categories = {_category_names("old.restaurant_id")} WHERE rowid = old.restaurant_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS restaurants_fts_category_rename AFTER UPDATE OF name ON categories BEGIN
+        UPDATE restaurants_fts SET categories = {_category_names("restaurants_fts.rowid")}
+        WHERE rowid IN (SELECT restaurant_id FROM restaurant_category WHERE category_id = new.id);
+    END
+    """,
+]
+
+# Index any restaurant missing from the fts table, a no-op once it is in sync
+FTS_BACKFILL = f"""
+    INSERT INTO restaurants_fts (rowid, name, location, city, categories)
+    SELECT restaurants.id, restaurants.name, restaurants.location, restaurants.city, {_category_names("restaurants.id")}
+    FROM restaurants WHERE restaurants.id NOT IN (SELECT rowid FROM restaurants_fts)
+"""
+
+# bm25 weights for name, location, city and categories
+_SEARCH = text("""
+    SELECT restaurants.id, bm25(restaurants_fts, 10.0, 2.0, 1.0, 4.0) AS relevance, restaurants.click_count
+    FROM restaurants_fts JOIN restaurants ON restaurants.id = restaurants_fts.rowid
+    WHERE restaurants_fts MATCH :match AND (:city IS NULL OR restaurants.city = :city)
+    ORDER BY relevance
+    LIMIT :candidates
+""")
+
+
+def create_search_index(connection) -> None:
+    """
+    Create the fts table and triggers if needed and index any restaurants missing from it.
+    """
+    for statement in FTS_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql(FTS_BACKFILL)
+
+
+# Every trigger in FTS_DDL, dropped by a bulk import while it runs
+FTS_TRIGGERS = (
+    "restaurants_fts_insert", "restaurants_fts_update", "restaurants_fts_delete",
+    "restaurants_fts_category_insert", "restaurants_fts_category_delete", "restaurants_fts_category_rename",
+)
+
+
+def drop_search_triggers(connection) -> None:
+    """
+    Stop keeping the fts table in sync, for a bulk import that calls rebuild_search_index
+    once at the end instead of updating the index row by row as it writes.
+    """
+    for name in FTS_TRIGGERS:
+        connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {name}")
+
+
+def rebuild_search_index(connection) -> None:
+    """
+    Recreate the triggers and index every restaurant from scratch, which also picks up
+    writes made by others while the triggers were dropped.
+    """
+    connection.exec_driver_sql("DELETE FROM restaurants_fts")
+    create_search_index(connection)
+
+
+def match_expression(query: str) -> str | None:
+    """
+    Turn free text into an fts5 query where every word is a prefix, so partial words match while typing.
+    """
+    words = re.findall(r"\w+", query.lower())
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+async def search_restaurant_ids(db: AsyncSession, query: str, limit: int = 50, popularity_weight: float = 1.0, city: str | None = None) -> list[int]:
+    """
+    Ids of restaurants matching `query`, best first, only in `city` if given.
+
+    The best `4 * limit` matches by bm25 are re-ranked by relevance plus
+    `popularity_weight * log(1 + clicks)`, so well-known places win close calls.
+    """
+    match = match_expression(query)
+    if match is None:
+        return []
+    rows = (await db.execute(_SEARCH, {"match": match, "city": city, "candidates": 4 * limit})).all()
+    # bm25 is negative, more negative is more relevant
+    ranked = sorted(rows, key=lambda row: row.relevance - popularity_weight * math.log1p(row.click_count))
+    return [row.id for row in ranked[:limit]]
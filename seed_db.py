@@ -1,43 +1,195 @@
 import json
+import re
+from itertools import islice
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
-from main import Base, Restaurant, Category
-import os
+from sqlalchemy import insert, select, update, or_
+from models import Restaurant, Category, restaurant_category
+from db import engine
+from duplicates import DuplicateIndex
+from catalog import bump_catalog_version
+from scoring import PRICE_LEVELS, rescore
+from search import drop_search_triggers, rebuild_search_index
 
-# Database setup
-DATABASE_URL = os.environ["DATABASE_URL"]
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-Base.metadata.create_all(bind=engine)
+CHUNK_SIZE = 1000
+# Columns compared against the feed to decide whether a restaurant changed
+SYNCED_COLUMNS = ("name", "city", "location", "website", "latitude", "longitude", "yelp_rating", "yelp_review_count", "price", "quality_score")
 
-def seed_database(json_file_path):
+
+def iter_records(json_file_path, chunk_size=1 << 16):
+    """
+    Yield restaurant records one at a time without loading the whole feed.
+
+    Reads either JSON lines, or the listing format where records are in the
+    innermost "docs" array ({"docs": {"docs": [...]}}), decoding one object at a time.
+    """
     with open(json_file_path, "r") as file:
-        data = json.load(file)
+        if json_file_path.endswith(".jsonl"):
+            for line in file:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer = ""
+        array_start = re.compile(r'"docs"\s*:\s*\[')
+        match = None
+        while match is None:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                return
+            buffer += chunk
+            match = array_start.search(buffer)
+        buffer = buffer[match.end():]
+
+        while True:
+            buffer = buffer.lstrip().lstrip(",").lstrip()
+            if buffer.startswith("]"):
+                return
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                # Incomplete object, read more of the file
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            buffer = buffer[end:]
+            yield record
+
+
+def chunks(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def restaurant_values(record, city):
+    yelp = record.get("yelp") or {}
+    return {
+        "source_id": record["recid"],
+        "name": record.get("title"),
+        "city": city,
+        "location": record.get("address1", "Unknown"),
+        "website": record.get("weburl", ""),
+        "latitude": record.get("latitude"),
+        "longitude": record.get("longitude"),
+        "yelp_rating": yelp.get("rating"),
+        "yelp_review_count": yelp.get("review_count"),
+        "price": PRICE_LEVELS.get(yelp.get("price")),
+        "quality_score": record.get("qualityScore"),
+    }
+
+
+def seed_database(json_file_path, city, chunk_size=CHUNK_SIZE, skip_duplicates=True):
+    """
+    Import the feed of `city`'s restaurants, keyed on its recid. New restaurants are inserted
+    with their primary category, changed ones are updated and unchanged ones are skipped, so
+    re-running the import only writes the difference. Work is committed every `chunk_size` records.
+
+    With skip_duplicates, a new restaurant that looks like one already in the city, or earlier
+    in the feed, under another recid is reported and not inserted.
+
+    Categories of existing restaurants are left alone, they may have been merged or
+    edited in the admin since they were imported.
+
+    The search index triggers are dropped once the import first writes, and the index is
+    rebuilt in one pass at the end, even if the import fails part way.
+    """
+    inserted = updated = unchanged = 0
+    reindex = False
+    duplicates = DuplicateIndex()
+    skipped = []
 
-    restaurants_data = data.get("docs", []).get("docs")
     with Session(engine) as session:
-        for restaurant in restaurants_data:
-            # Handle categories
-            category_name = restaurant.get("primary_category", {}).get("subcatname", "Unknown")
-            category = session.query(Category).filter_by(name=category_name).first()
-            if not category:
-                category = Category(name=category_name)
-                session.add(category)
-                session.flush()  # Flush to get the category ID
-
-            # Handle restaurant
-            new_restaurant = Restaurant(
-                name=restaurant.get("title"),
-                city="Chattanooga"
-                location=restaurant.get("address1", "Unknown"),
-                website=restaurant.get("weburl", ""),
-            )
-            new_restaurant.categories.append(category)
-            session.add(new_restaurant)
-
-        session.commit()
-        print(f"Seeded {len(restaurants_data)} restaurants into the database.")
+        category_ids = dict(session.execute(select(Category.name, Category.id)).all())
+        existing = {}
+        # Restaurants seeded before recids were stored are adopted by name and location
+        unsourced = {}
+        # recids are only unique within a city's feed. Restaurants from before cities were recorded are adopted too.
+        in_city = or_(Restaurant.city == city, Restaurant.city.is_(None))
+        for row in session.execute(select(Restaurant.id, Restaurant.source_id, *(getattr(Restaurant, column) for column in SYNCED_COLUMNS)).where(in_city)):
+            values = tuple(getattr(row, column) for column in SYNCED_COLUMNS)
+            duplicates.add((row.name, row.location), row.name, row.location, row.latitude, row.longitude)
+            if row.source_id is None:
+                unsourced[(row.name, row.location)] = row.id
+            else:
+                existing[row.source_id] = (row.id, values)
+
+        try:
+            for records in chunks(iter_records(json_file_path), chunk_size):
+                new_restaurants, new_categories, changes = [], [], []
+                # Position in new_restaurants by recid, so a recid repeated within a chunk is only inserted once
+                pending = {}
+                for record in records:
+                    values = restaurant_values(record, city)
+                    source_id = values["source_id"]
+                    synced = tuple(values[column] for column in SYNCED_COLUMNS)
+                    if source_id in pending:
+                        new_restaurants[pending[source_id]] = values
+                    elif source_id in existing:
+                        restaurant_id, current = existing[source_id]
+                        if current == synced:
+                            unchanged += 1
+                            continue
+                        changes.append({"id": restaurant_id, **values})
+                        existing[source_id] = (restaurant_id, synced)
+                    elif (values["name"], values["location"]) in unsourced:
+                        restaurant_id = unsourced.pop((values["name"], values["location"]))
+                        changes.append({"id": restaurant_id, **values})
+                        existing[source_id] = (restaurant_id, synced)
+                    elif skip_duplicates and (match := duplicates.match_or_add(
+                        (values["name"], values["location"]), values["name"], values["location"], values["latitude"], values["longitude"],
+                    )):
+                        skipped.append((source_id, values["name"], values["location"], match))
+                    else:
+                        pending[source_id] = len(new_restaurants)
+                        new_restaurants.append(values)
+                        new_categories.append(record.get("primary_category", {}).get("subcatname", "Unknown"))
+
+                if (new_restaurants or changes) and not reindex:
+                    drop_search_triggers(session.connection())
+                    reindex = True
+
+                for name in set(new_categories) - category_ids.keys():
+                    category_ids[name] = session.scalar(insert(Category).values(name=name).returning(Category.id))
+
+                ids = []
+                if new_restaurants:
+                    ids = session.scalars(insert(Restaurant).returning(Restaurant.id, sort_by_parameter_order=True), new_restaurants).all()
+                    session.execute(
+                        insert(restaurant_category),
+                        [{"restaurant_id": restaurant_id, "category_id": category_ids[name]} for restaurant_id, name in zip(ids, new_categories)],
+                    )
+                    for restaurant_id, values in zip(ids, new_restaurants):
+                        existing[values["source_id"]] = (restaurant_id, tuple(values[column] for column in SYNCED_COLUMNS))
+                if changes:
+                    session.execute(update(Restaurant), changes)
+                # Only the restaurants written, a re-import that changes nothing rescores nothing
+                rescore(session.connection(), [*ids, *(change["id"] for change in changes)])
+                if new_restaurants or changes:
+                    # Running app processes reload the city's restaurants
+                    bump_catalog_version(session.connection())
+
+                session.commit()
+                inserted += len(new_restaurants)
+                updated += len(changes)
+        finally:
+            if reindex:
+                # Drops the chunk that failed, if any, so the rebuild commits on its own
+                session.rollback()
+                rebuild_search_index(session.connection())
+                session.commit()
+
+        print(f"Imported {inserted + updated + unchanged} restaurants: {inserted} new, {updated} updated, {unchanged} unchanged.")
+        if skipped:
+            print(f"Skipped {len(skipped)} duplicates:")
+            for source_id, name, location, (duplicate_name, duplicate_location) in skipped:
+                print(f"  recid {source_id}: {name} ({location}) is {duplicate_name} ({duplicate_location})")
+
 
 if __name__ == "__main__":
-    # Replace with your JSON file path
-    json_file_path = "restaurants.json"
-    seed_database(json_file_path)
+    import sys
+    from cli import main
+
+    main(["seed", *sys.argv[1:]])
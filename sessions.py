@@ -0,0 +1,123 @@
+import json
+import secrets
+import time
+from collections import OrderedDict
+from http.cookies import SimpleCookie
+
+
+class MemorySessionStore:
+    """
+    Sessions held in process, least recently used evicted past `max_sessions`.
+    Sessions expire `ttl` seconds after they were last used.
+    """
+
+    def __init__(self, ttl: float, max_sessions: int = 100_000):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+
+    async def load(self, session_id: str) -> dict | None:
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        expires_at, data = entry
+        if expires_at < time.monotonic():
+            del self._sessions[session_id]
+            return None
+        self._sessions[session_id] = (time.monotonic() + self.ttl, data)
+        self._sessions.move_to_end(session_id)
+        # A copy, so changes are only kept once saved
+        return json.loads(json.dumps(data))
+
+    async def save(self, session_id: str, data: dict) -> None:
+        self._sessions[session_id] = (time.monotonic() + self.ttl, data)
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    async def delete(self, session_id: str) -> None:
+        self._sessions.pop(session_id, None)
+
+
+class RedisSessionStore:
+    """
+    Sessions kept in Redis as JSON, shared between processes. Takes a `redis.asyncio`
+    client, or anything with the same getex/set/delete methods.
+    """
+
+    def __init__(self, client, ttl: float, prefix: str = "session:"):
+        self.client = client
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    async def load(self, session_id: str) -> dict | None:
+        # Reading a session extends its expiry, like the in-memory store
+        value = await self.client.getex(self.prefix + session_id, ex=self.ttl)
+        return json.loads(value) if value is not None else None
+
+    async def save(self, session_id: str, data: dict) -> None:
+        await self.client.set(self.prefix + session_id, json.dumps(data), ex=self.ttl)
+
+    async def delete(self, session_id: str) -> None:
+        await self.client.delete(self.prefix + session_id)
+
+
+class ServerSessionMiddleware:
+    """
+    Drop-in replacement for Starlette's SessionMiddleware that keeps `request.session`
+    in a store and only sends an opaque random id in the cookie. The store is only
+    written when the session changed. When any of `rotate_keys` changes, as on login,
+    the session moves to a new id and the old one is deleted, so an id planted in a
+    browser before login (session fixation) never becomes an authenticated session.
+    """
+
+    def __init__(self, app, store, session_cookie: str = "session", max_age: int = 14 * 24 * 60 * 60,
+                 path: str = "/", same_site: str = "lax", https_only: bool = False,
+                 rotate_keys: tuple[str, ...] = ("user_id", "is_admin")):
+        self.app = app
+        self.store = store
+        self.session_cookie = session_cookie
+        self.max_age = max_age
+        self.rotate_keys = rotate_keys
+        self.cookie_flags = f"path={path}; Max-Age={max_age}; httponly; samesite={same_site}" + ("; secure" if https_only else "")
+
+    def _session_id(self, scope) -> str | None:
+        for name, value in scope.get("headers", ()):
+            if name == b"cookie":
+                morsel = SimpleCookie(value.decode("latin-1")).get(self.session_cookie)
+                if morsel:
+                    return morsel.value
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        session_id = self._session_id(scope)
+        loaded = await self.store.load(session_id) if session_id else None
+        scope["session"] = dict(loaded) if loaded else {}
+        original = json.dumps(loaded or {}, sort_keys=True)
+
+        async def send_wrapper(message):
+            nonlocal session_id
+            if message["type"] == "http.response.start":
+                session = scope["session"]
+                cookie = None
+                if session and (loaded is None or json.dumps(session, sort_keys=True) != original):
+                    if loaded is None:
+                        # Never adopt an unknown id from the client
+                        session_id = secrets.token_urlsafe(32)
+                    elif any(session.get(key) != loaded.get(key) for key in self.rotate_keys):
+                        await self.store.delete(session_id)
+                        session_id = secrets.token_urlsafe(32)
+                    await self.store.save(session_id, session)
+                    cookie = f"{self.session_cookie}={session_id}; {self.cookie_flags}"
+                elif not session and loaded is not None:
+                    await self.store.delete(session_id)
+                    cookie = f"{self.session_cookie}=null; path=/; expires=Thu, 01 Jan 1970 00:00:00 GMT; httponly"
+                if cookie:
+                    message["headers"] = [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]
+            await send(message)
+
+        await self.app(scope, receive, send_wrapper)
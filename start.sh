@@ -1,8 +1,14 @@
 #!/bin/sh
+# Serves the app from requirements.txt; the tests and bench.py also need requirements-dev.txt
 set -e  # Exit immediately if a command exits with a non-zero status
 
 # Run Alembic migrations
 alembic upgrade head
 
-# final two flags are to allow SqlAdmin to work properly
-uvicorn main:app --host 0.0.0.0 --port 8010 --forwarded-allow-ips="*" --proxy-headers
+# Fingerprint and precompress static assets
+python cli.py build-assets
+
+# final two flags are to allow SqlAdmin to work properly. X-Forwarded-For is only trusted from
+# the reverse proxy addresses in FORWARDED_ALLOW_IPS (comma separated), since the login
+# throttle goes by the client address
+uvicorn main:create_app --factory --host 0.0.0.0 --port 8010 --forwarded-allow-ips="${FORWARDED_ALLOW_IPS:-127.0.0.1}" --proxy-headers
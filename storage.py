@@ -0,0 +1,98 @@
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from sqlalchemy import event
+
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """
+    How SQLite connections are set up. WAL lets readers carry on while a write is in
+    progress, and with synchronous=NORMAL a commit no longer waits on an fsync.
+    """
+    journal_mode: str = "wal"
+    synchronous: str = "normal"
+    mmap_size: int = 256 * 1024 * 1024
+    # Negative sizes are in KiB rather than pages
+    cache_size: int = -64 * 1024
+    busy_timeout_ms: int = 5000
+    read_pool_size: int = 5
+
+    @classmethod
+    def from_env(cls) -> "StorageProfile":
+        return cls(
+            journal_mode=os.environ.get("SQLITE_JOURNAL_MODE", cls.journal_mode),
+            synchronous=os.environ.get("SQLITE_SYNCHRONOUS", cls.synchronous),
+            mmap_size=int(os.environ.get("SQLITE_MMAP_SIZE", cls.mmap_size)),
+            cache_size=int(os.environ.get("SQLITE_CACHE_SIZE", cls.cache_size)),
+            busy_timeout_ms=int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", cls.busy_timeout_ms)),
+            read_pool_size=int(os.environ.get("SQLITE_READ_POOL_SIZE", cls.read_pool_size)),
+        )
+
+    def pragmas(self, read_only: bool) -> list[str]:
+        pragmas = [
+            f"PRAGMA busy_timeout = {self.busy_timeout_ms}",
+            f"PRAGMA synchronous = {self.synchronous}",
+            f"PRAGMA mmap_size = {self.mmap_size}",
+            f"PRAGMA cache_size = {self.cache_size}",
+        ]
+        if read_only:
+            pragmas.append("PRAGMA query_only = ON")
+        else:
+            # The journal mode is stored in the database file, so only the writer sets it
+            pragmas.insert(0, f"PRAGMA journal_mode = {self.journal_mode}")
+        return pragmas
+
+
+def configure_sqlite(engine, profile: StorageProfile, read_only: bool = False) -> None:
+    """
+    Apply the profile's pragmas to every new connection of a (sync) engine. Reader
+    connections refuse writes. Writer transactions start with BEGIN IMMEDIATE, so they
+    queue for the write lock up front instead of failing with "database is locked"
+    when a read transaction tries to upgrade.
+    """
+    if engine.dialect.name != "sqlite":
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_pragmas(dbapi_connection, connection_record):
+        # Let SQLAlchemy rather than the driver decide when transactions begin
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in profile.pragmas(read_only):
+            cursor.execute(pragma)
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def begin(connection):
+        connection.exec_driver_sql("BEGIN" if read_only else "BEGIN IMMEDIATE")
+
+
+class SerialWriter:
+    """
+    Runs database writes one at a time on a single thread. `run(function, *args)` calls
+    `function(session, *args)` in a new session, commits, and returns its result.
+    """
+
+    def __init__(self, sessionmaker):
+        self.sessionmaker = sessionmaker
+        self._pending = 0
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+
+    def _write(self, function, args):
+        with self.sessionmaker() as session:
+            result = function(session, *args)
+            session.commit()
+            return result
+
+    async def run(self, function, *args):
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, self._write, function, args)
+        finally:
+            self._pending -= 1
+
+    def pending(self) -> int:
+        return self._pending
@@ -0,0 +1,29 @@
+class FlushSignal:
+    """
+    Raised by a row source whenever it has loaded a batch, so the page rendered up to
+    that point is sent instead of waiting for the buffer to fill.
+    """
+
+    def __init__(self):
+        self.pending = False
+
+    def set(self) -> None:
+        self.pending = True
+
+
+async def stream_template(template, context: dict, signal: FlushSignal | None = None, flush_size: int = 64 * 1024):
+    """
+    Render an async template piece by piece with `generate_async`, yielding the output
+    in chunks of about `flush_size` characters, or earlier when `signal` is raised.
+    """
+    buffer, size = [], 0
+    async for piece in template.generate_async(context):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= flush_size or (signal is not None and signal.pending):
+            if signal is not None:
+                signal.pending = False
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
@@ -0,0 +1,74 @@
+import itertools
+import os
+import tempfile
+
+import pytest
+
+# The app binds its engines when main is imported, so point it at a scratch database first
+_database_directory = tempfile.TemporaryDirectory()
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_database_directory.name, 'test.db')}"
+os.environ.setdefault("SECRET_KEY", "test")
+# Templates and static files are found relative to the repository root
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_numbers = itertools.count(1)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def tables():
+    from db import create_tables
+
+    create_tables()
+
+
+@pytest.fixture(scope="session")
+def app():
+    import main
+
+    return main.create_app()
+
+
+@pytest.fixture
+def client(app):
+    """
+    An httpx.AsyncClient calling the app in-process.
+    """
+    import httpx
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+@pytest.fixture
+def add_restaurants():
+    """
+    Add `count` restaurants through the ORM, so the app's caches see the change, each in
+    `per_restaurant` of `categories` new categories. Returns their ids.
+    """
+    import main
+
+    def add(count: int, categories: int = 3, per_restaurant: int = 2, city: str = "Chattanooga") -> list[int]:
+        number = next(_numbers)
+        with main.SessionLocal() as db:
+            category_rows = [main.Category(name=f"Category {number}-{i}") for i in range(categories)]
+            restaurants = [
+                main.Restaurant(
+                    name=f"Restaurant {number}-{i}",
+                    location=f"{100 + i} Main St",
+                    city=city,
+                    website=f"https://example.com/{number}/{i}",
+                    latitude=35.0456,
+                    longitude=-85.3097,
+                    categories=[category_rows[(i + j) % categories] for j in range(min(per_restaurant, categories))],
+                )
+                for i in range(count)
+            ]
+            db.add_all(restaurants)
+            db.commit()
+            return [restaurant.id for restaurant in restaurants]
+
+    return add
@@ -0,0 +1,118 @@
+import datetime
+import re
+
+import pytest
+from sqlalchemy import create_engine, event, func, select
+
+import main
+from models import Base, Click
+from rollups import CLICK_RETENTION, compact_click_history
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def admin(monkeypatch):
+    async def authenticate(self, request):
+        return True
+
+    monkeypatch.setattr(main.AdminAuth, "authenticate", authenticate)
+
+
+async def test_restaurant_form_leaves_out_counters(client, admin, add_restaurants):
+    restaurant_id = add_restaurants(1)[0]
+
+    response = await client.get(f"/admin/restaurant/edit/{restaurant_id}")
+
+    assert response.status_code == 200
+    assert 'name="click_count"' not in response.text
+    assert 'name="score"' not in response.text
+    source_id = re.search(r"<input[^>]*name=\"source_id\"[^>]*>", response.text).group(0)
+    assert "readonly" in source_id
+
+
+@pytest.fixture
+def writer_statements():
+    sent = []
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    event.listen(main.engine, "before_cursor_execute", count)
+    yield sent
+    event.remove(main.engine, "before_cursor_execute", count)
+
+
+async def test_admin_reads_do_not_use_the_writer(client, admin, add_restaurants, writer_statements):
+    restaurant_id = add_restaurants(2)[0]
+    writer_statements.clear()
+
+    assert (await client.get("/admin/restaurant/list")).status_code == 200
+    assert (await client.get(f"/admin/restaurant/details/{restaurant_id}")).status_code == 200
+    assert (await client.get("/admin/category/list")).status_code == 200
+
+    assert writer_statements == []
+
+
+async def test_admin_edits_go_through_the_writer(client, admin, writer_statements):
+    with main.SessionLocal() as db:
+        suggestion = main.SuggestedChanges(suggestion="More tacos", handled=False)
+        db.add(suggestion)
+        db.commit()
+        suggestion_id = suggestion.id
+
+    response = await client.post(f"/admin/suggested-changes/edit/{suggestion_id}", data={"suggestion": "More tacos", "handled": "y"})
+
+    assert response.status_code == 302
+    assert any(statement.startswith("UPDATE suggested_changes") for statement in writer_statements)
+    with main.SessionLocal() as db:
+        assert db.get(main.SuggestedChanges, suggestion_id).handled
+
+
+def test_click_count_matches_after_pruning():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    now = datetime.datetime(2026, 6, 1)
+    cutoff = now - CLICK_RETENTION
+    # Flushed by different workers, so a few timestamps are out of id order around the cutoff
+    offsets = [-3, -2, 1, -1, 2, -4, 3, 4]
+    with engine.begin() as connection:
+        connection.execute(Click.__table__.insert(), [
+            {"restaurant_id": 1, "timestamp": cutoff + datetime.timedelta(hours=offset)} for offset in offsets
+        ])
+        pruned = compact_click_history(connection, now)["clicks_pruned"]
+        count = connection.scalar(main.ClickAdmin.count_query(None, None))
+        remaining = connection.scalar(select(func.count()).select_from(Click))
+
+    # Up to the first click still inside the retention window
+    assert pruned == 2
+    assert count == remaining == len(offsets) - 2
+
+
+async def test_clicks_cannot_be_deleted_from_the_admin(client, admin):
+    response = await client.get("/admin/click/list")
+
+    assert response.status_code == 200
+    assert "/admin/click/delete" not in response.text
+    assert (await client.delete("/admin/click/delete?pks=1")).status_code in (403, 405)
+
+
+async def test_duplicates_are_matched_once_per_catalog_version(client, admin, add_restaurants, monkeypatch):
+    matched = []
+    group_duplicates = main.group_duplicates
+
+    def counting(places):
+        matched.append(len(places))
+        return group_duplicates(places)
+
+    monkeypatch.setattr(main, "group_duplicates", counting)
+    add_restaurants(2)
+
+    assert (await client.get("/admin/duplicates")).status_code == 200
+    assert (await client.get("/admin/duplicates")).status_code == 200
+    assert len(matched) == 1
+
+    add_restaurants(2)
+    assert (await client.get("/admin/duplicates")).status_code == 200
+    assert len(matched) == 2
+    assert matched[1] == matched[0] + 2
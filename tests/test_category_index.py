@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from category_index import CategoryIndex
+
+pytestmark = pytest.mark.anyio
+
+CATEGORIES = ["Tacos", "Pizza", "Sushi", "Vegan", "Bakery"]
+
+
+def catalog(restaurants: int, density: float, seed: int = 1):
+    """
+    Shuffled restaurant ids as the ranking, with random category memberships and prices.
+    """
+    rng = random.Random(seed)
+    order = list(range(1, restaurants + 1))
+    rng.shuffle(order)
+    memberships = [(restaurant_id, name) for restaurant_id in order for name in CATEGORIES if rng.random() < density]
+    prices = [(restaurant_id, rng.randint(1, 4)) for restaurant_id in order if rng.random() < 0.8]
+    return order, memberships, prices
+
+
+def brute_force(order, memberships, prices, categories, match_all=False, levels=None):
+    in_category = {}
+    for restaurant_id, name in memberships:
+        in_category.setdefault(restaurant_id, set()).add(name)
+    price = dict(prices)
+    matches = []
+    for restaurant_id in order:
+        names = in_category.get(restaurant_id, set())
+        if categories and not (set(categories) <= names if match_all else set(categories) & names):
+            continue
+        if levels is not None and price.get(restaurant_id) not in levels:
+            continue
+        matches.append(restaurant_id)
+    return matches
+
+
+@pytest.mark.parametrize("density", [0.01, 0.5], ids=["sparse", "dense"])
+@pytest.mark.parametrize("categories", [[], ["Tacos"], ["Tacos", "Sushi"], ["Pizza", "Vegan", "Bakery"], ["Nowhere"]])
+@pytest.mark.parametrize("match_all", [False, True], ids=["any", "all"])
+@pytest.mark.parametrize("levels", [None, (1,), (2, 3)], ids=["any_price", "cheap", "middle"])
+def test_filter_matches_brute_force_in_ranking_order(density, categories, match_all, levels):
+    order, memberships, prices = catalog(2_000, density)
+    index = CategoryIndex(load=None)
+    index.rebuild(order, memberships, prices)
+
+    assert index.filter(categories, match_all, levels) == brute_force(order, memberships, prices, categories, match_all, levels)
+
+
+def test_restaurants_missing_from_the_ranking_are_ignored():
+    index = CategoryIndex(load=None)
+    index.rebuild([3, 1], [(1, "Tacos"), (2, "Tacos"), (3, "Tacos")], [(2, 1)])
+
+    assert index.filter(["Tacos"]) == [3, 1]
+    assert index.filter([], prices=(1,)) == []
+
+
+async def test_rebuilds_on_catalog_change_and_throttles_popularity(monkeypatch):
+    loads = []
+
+    async def load():
+        loads.append(len(loads))
+        return [1, 2], [(1, "Tacos")], []
+
+    index = CategoryIndex(load, popularity_refresh=60)
+    await index.refresh()
+    await index.refresh()
+    assert loads == [0]
+
+    index.mark_catalog_changed()
+    await index.refresh()
+    assert loads == [0, 1]
+
+    # Clicks only re-rank once the refresh interval has passed
+    index.mark_popularity_changed()
+    await index.refresh()
+    assert loads == [0, 1]
+    monkeypatch.setattr(index, "_built_at", index._built_at - 61)
+    await index.refresh()
+    assert loads == [0, 1, 2]
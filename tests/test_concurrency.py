@@ -0,0 +1,70 @@
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import event, text
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def held_open():
+    """
+    A held_open() SQL function on every new read connection, which blocks in SQLite until
+    `blocking` returns, so a test can keep a query running as long as it needs.
+    """
+    state = {"blocking": lambda: None}
+
+    def register(dbapi_connection, connection_record):
+        dbapi_connection.create_function("held_open", 0, lambda: state["blocking"]())
+
+    # Connections already in the pool don't have the function
+    await main.async_engine.dispose()
+    event.listen(main.async_engine.sync_engine, "connect", register)
+    yield state
+    event.remove(main.async_engine.sync_engine, "connect", register)
+    await main.async_engine.dispose()
+
+
+async def test_requests_are_served_while_a_slow_query_runs(client, add_restaurants, held_open):
+    restaurant_id = add_restaurants(5)[0]
+    release = threading.Event()
+    held_open["blocking"] = lambda: release.wait(10)
+
+    async with main.async_engine.connect() as connection:
+        slow = asyncio.create_task(connection.execute(text("SELECT held_open()")))
+        try:
+            responses = await asyncio.wait_for(asyncio.gather(
+                client.get("/api/restaurants?limit=5"),
+                client.get("/api/search?q=restaurant"),
+                client.get(f"/restaurants/{restaurant_id}/menu"),
+                client.post("/suggestion", data={"suggestion": "More tacos"}),
+            ), timeout=5)
+            # Every request finished while the slow query was still running
+            assert not slow.done()
+        finally:
+            release.set()
+        await slow
+
+    assert [response.status_code for response in responses] == [200, 200, 307, 303]
+
+
+async def test_slow_queries_from_concurrent_requests_overlap(client, held_open, monkeypatch):
+    concurrent = 3
+    assert concurrent <= main.storage_profile.read_pool_size
+    # Each query only gets past the barrier once all of them are in SQLite at the same time,
+    # requests that ran one after another would time out on it instead
+    barrier = threading.Barrier(concurrent)
+    held_open["blocking"] = lambda: barrier.wait(5)
+
+    async def slow_search(db, query, **options):
+        await db.execute(text("SELECT held_open()"))
+        return []
+
+    monkeypatch.setattr(main, "search_restaurant_ids", slow_search)
+    responses = await asyncio.gather(*(client.get("/api/search?q=slow") for _ in range(concurrent)))
+
+    assert [response.status_code for response in responses] == [200] * concurrent
+    assert not barrier.broken
@@ -0,0 +1,85 @@
+import math
+import random
+
+import pytest
+
+from geo import EARTH_RADIUS_KM, GeoIndex
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def locations(count: int, seed: int = 7):
+    """
+    Restaurants scattered around Chattanooga, a few across the antimeridian and near a pole,
+    and one without coordinates.
+    """
+    rng = random.Random(seed)
+    rows = [(i, 35.0 + rng.uniform(-0.5, 0.5), -85.3 + rng.uniform(-0.5, 0.5)) for i in range(count)]
+    rows += [(count, 0.0, 179.99), (count + 1, 0.0, -179.99), (count + 2, 89.9, 10.0), (count + 3, None, None)]
+    return rows
+
+
+def brute_force(rows, latitude, longitude):
+    distances = [
+        (haversine_km(latitude, longitude, lat, lon), restaurant_id)
+        for restaurant_id, lat, lon in rows
+        if lat is not None
+    ]
+    return [(restaurant_id, distance) for distance, restaurant_id in sorted(distances)]
+
+
+@pytest.fixture(scope="module")
+def rows():
+    return locations(3_000)
+
+
+@pytest.fixture(scope="module")
+def index(rows):
+    index = GeoIndex(load=None)
+    index.rebuild(rows)
+    return index
+
+
+def assert_same(found, expected):
+    assert [restaurant_id for restaurant_id, _ in found] == [restaurant_id for restaurant_id, _ in expected]
+    for (_, distance), (_, expected_distance) in zip(found, expected):
+        assert distance == pytest.approx(expected_distance, rel=1e-6, abs=1e-6)
+
+
+@pytest.mark.parametrize("point", [(35.04, -85.31), (35.6, -84.7), (0.0, 179.999), (90.0, 0.0), (-35.0, 94.7)])
+@pytest.mark.parametrize("k", [1, 10, 100])
+def test_nearest_matches_brute_force(index, rows, point, k):
+    assert_same(index.nearest(*point, k=k), brute_force(rows, *point)[:k])
+
+
+@pytest.mark.parametrize("radius_km", [0.5, 5, 40, 20_000])
+def test_within_matches_brute_force(index, rows, radius_km):
+    expected = [(restaurant_id, distance) for restaurant_id, distance in brute_force(rows, 35.04, -85.31) if distance <= radius_km]
+    assert_same(index.within(35.04, -85.31, radius_km), expected)
+
+
+def test_nearest_within_a_radius(index, rows):
+    expected = [(restaurant_id, distance) for restaurant_id, distance in brute_force(rows, 35.04, -85.31) if distance <= 10]
+    assert_same(index.nearest(35.04, -85.31, k=5, radius_km=10), expected[:5])
+
+
+def test_neighbours_across_the_antimeridian(index, rows):
+    count = len(rows) - 4
+    assert [restaurant_id for restaurant_id, _ in index.nearest(0.0, 179.999, k=2)] == [count, count + 1]
+
+
+def test_sort_by_distance_skips_restaurants_without_a_location(index, rows):
+    ids = [0, 5, 10, len(rows) - 1]
+    expected = [(restaurant_id, distance) for restaurant_id, distance in brute_force(rows, 35.04, -85.31) if restaurant_id in ids]
+    assert_same(index.sort_by_distance(35.04, -85.31, ids), expected)
+
+
+def test_empty_index():
+    index = GeoIndex(load=None)
+    index.rebuild([])
+    assert index.nearest(35.0, -85.0) == []
+    assert index.within(35.0, -85.0, 100) == []
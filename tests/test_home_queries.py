@@ -0,0 +1,45 @@
+import pytest
+from sqlalchemy import event
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def statements():
+    """
+    SQL statements sent by either engine while the test runs.
+    """
+    sent = []
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+
+    engines = (main.engine, main.async_engine.sync_engine)
+    for engine in engines:
+        event.listen(engine, "before_cursor_execute", count)
+    yield sent
+    for engine in engines:
+        event.remove(engine, "before_cursor_execute", count)
+
+
+@pytest.mark.parametrize("cached", [True, False], ids=["page_cache", "no_page_cache"])
+async def test_home_page_statement_count_does_not_grow_with_rows(client, add_restaurants, statements, monkeypatch, cached):
+    monkeypatch.setattr(main, "STREAM_RESTAURANT_LIST", False)
+    # Check the catalog version on every request, not just once a second
+    monkeypatch.setattr(main.catalog_watcher, "interval", 0)
+    if not cached:
+        monkeypatch.setattr(main.page_cache, "max_bytes", 0)
+
+    counts = []
+    for restaurants, categories in ((5, 2), (50, 10), (200, 40)):
+        # Each addition invalidates the cached page and indexes, so every count is a full render
+        add_restaurants(restaurants, categories=categories)
+        statements.clear()
+        response = await client.get("/")
+        assert response.status_code == 200
+        assert "Restaurant" in response.text
+        counts.append(len(statements))
+
+    assert 0 < counts[0] == counts[1] == counts[2], statements
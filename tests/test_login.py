@@ -0,0 +1,56 @@
+import httpx
+import pytest
+from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
+
+import main
+from passwords import LoginThrottle
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def throttles(monkeypatch):
+    monkeypatch.setattr(main, "login_throttle", LoginThrottle(max_attempts=3, window=60))
+    monkeypatch.setattr(main, "client_login_throttle", LoginThrottle(max_attempts=5, window=60))
+
+
+def client_from(app, address: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app, client=(address, 1234)), base_url="http://test")
+
+
+async def attempt(client, username: str) -> int:
+    response = await client.post("/login", data={"username": username, "password": "wrong"})
+    return response.status_code
+
+
+async def test_account_is_only_locked_for_the_client_guessing(app, throttles):
+    async with client_from(app, "203.0.113.1") as attacker, client_from(app, "198.51.100.7") as owner:
+        assert [await attempt(attacker, "nobody-admin") for _ in range(4)][-1] == 429
+        # The same username from somewhere else isn't locked out
+        assert await attempt(owner, "nobody-admin") != 429
+
+
+async def test_client_is_limited_across_usernames(app, throttles):
+    async with client_from(app, "203.0.113.2") as attacker:
+        statuses = [await attempt(attacker, f"nobody-{i}") for i in range(6)]
+
+    assert 429 not in statuses[:5]
+    assert statuses[5] == 429
+
+
+async def test_forwarded_for_is_only_trusted_from_the_proxy(app, throttles):
+    # As uvicorn runs the app in start.sh, with the default FORWARDED_ALLOW_IPS
+    proxied = ProxyHeadersMiddleware(app, trusted_hosts="127.0.0.1")
+
+    # A client can't dodge its limit by making up a new address for every attempt
+    async with client_from(proxied, "203.0.113.3") as attacker:
+        for i in range(5):
+            await attacker.post("/login", data={"username": f"other-{i}", "password": "wrong"}, headers={"x-forwarded-for": f"10.0.0.{i}"})
+        assert await attempt(attacker, "other-5") == 429
+
+    # Clients behind the proxy are told apart by the address it forwards
+    async with client_from(proxied, "127.0.0.1") as proxy:
+        for i in range(5):
+            await proxy.post("/login", data={"username": f"proxied-{i}", "password": "wrong"}, headers={"x-forwarded-for": "192.0.2.1"})
+        response = await proxy.post("/login", data={"username": "proxied-5", "password": "wrong"}, headers={"x-forwarded-for": "192.0.2.2"})
+        assert response.status_code != 429
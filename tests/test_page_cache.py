@@ -0,0 +1,79 @@
+import asyncio
+import gzip
+import threading
+
+import pytest
+
+from page_cache import CachedPage, PageCache
+
+pytestmark = pytest.mark.anyio
+
+
+def page_of(size: int) -> str:
+    # Random-looking text, so compression doesn't shrink it to nothing
+    return "".join(chr(33 + (i * 7919) % 90) for i in range(size))
+
+
+async def test_pages_are_evicted_by_total_bytes():
+    page_size = CachedPage.build(page_of(10_000)).size
+    cache = PageCache(max_bytes=int(page_size * 2.5), max_page_bytes=page_size * 2)
+    renders = []
+
+    async def render(key):
+        renders.append(key)
+        return page_of(10_000)
+
+    for key in ("a", "b", "c"):
+        await cache.get((key,), lambda: render(key))
+
+    assert cache.size <= cache.max_bytes
+    assert renders == ["a", "b", "c"]
+    # "a" was least recently used and made room for "c"
+    await cache.get(("b",), lambda: render("b"))
+    await cache.get(("a",), lambda: render("a"))
+    assert renders == ["a", "b", "c", "a"]
+
+
+async def test_oversize_pages_are_not_kept():
+    cache = PageCache(max_bytes=1 << 20, max_page_bytes=1_000)
+    html = page_of(5_000)
+
+    async def render():
+        return html
+
+    page = await cache.get(("big",), render)
+
+    assert gzip.decompress(page.gzip).decode() == html
+    assert cache.size == 0
+    assert not cache.cacheable(("big",))
+    assert cache.cacheable(("small",))
+    # A catalog edit may have shrunk it
+    cache.clear()
+    assert cache.cacheable(("big",))
+
+
+async def test_clear_from_another_thread_keeps_the_size_right():
+    html = page_of(2_000)
+    page_size = CachedPage.build(html).size
+    cache = PageCache(max_bytes=page_size * 8, max_page_bytes=page_size * 2)
+    stopping = threading.Event()
+
+    async def render():
+        return html
+
+    # Commits on the writer thread clear the cache while requests fill it
+    def commits():
+        while not stopping.is_set():
+            cache.clear()
+
+    writer = threading.Thread(target=commits)
+    writer.start()
+    try:
+        for batch in range(50):
+            await asyncio.gather(*(cache.get((batch, key), render) for key in range(16)))
+    finally:
+        stopping.set()
+        writer.join()
+
+    assert cache.size == sum(page.size for page in cache._pages.values())
+    assert cache.size <= cache.max_bytes
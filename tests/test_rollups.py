@@ -0,0 +1,98 @@
+import datetime
+
+import pytest
+from sqlalchemy import create_engine, select
+
+import main
+from models import Base, ClickRollup
+from rollups import HOURLY_RETENTION, TrendingRanking, compact_click_history, decayed_scores
+
+pytestmark = pytest.mark.anyio
+
+NOW = datetime.datetime(2026, 6, 1, 12, 0)
+
+
+def rollups(connection, restaurant_ids, period):
+    rows = connection.execute(
+        select(ClickRollup.restaurant_id, ClickRollup.bucket, ClickRollup.clicks)
+        .where(ClickRollup.restaurant_id.in_(restaurant_ids), ClickRollup.period == period)
+        .order_by(ClickRollup.restaurant_id, ClickRollup.bucket)
+    )
+    return [tuple(row) for row in rows]
+
+
+def test_written_clicks_are_rolled_up_per_hour(add_restaurants):
+    first, second = add_restaurants(2)
+    at = datetime.datetime(2026, 5, 1, 9)
+    batch = [
+        (first, at.replace(minute=5)),
+        (first, at.replace(minute=55)),
+        (first, at.replace(hour=10, minute=1)),
+        (second, at.replace(minute=30)),
+    ]
+    with main.SessionLocal() as db:
+        main.write_clicks(db, batch)
+        db.commit()
+    # A later batch adds to the same hour
+    with main.SessionLocal() as db:
+        main.write_clicks(db, [(first, at.replace(minute=40))])
+        db.commit()
+
+    with main.SessionLocal() as db:
+        assert rollups(db, [first, second], "hour") == [
+            (first, at, 3),
+            (first, at.replace(hour=10), 1),
+            (second, at, 1),
+        ]
+        assert db.get(main.Restaurant, first).click_count == 4
+        assert db.get(main.Restaurant, second).click_count == 1
+
+
+def test_old_hours_are_folded_into_days():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    old_day = (NOW - HOURLY_RETENTION - datetime.timedelta(days=2)).replace(hour=0)
+    recent = NOW - datetime.timedelta(hours=3)
+    with engine.begin() as connection:
+        connection.execute(ClickRollup.__table__.insert(), [
+            {"restaurant_id": 1, "period": "hour", "bucket": old_day.replace(hour=8), "clicks": 2},
+            {"restaurant_id": 1, "period": "hour", "bucket": old_day.replace(hour=20), "clicks": 3},
+            # Already folded by an earlier run, the new hours add to it
+            {"restaurant_id": 1, "period": "day", "bucket": old_day, "clicks": 10},
+            {"restaurant_id": 1, "period": "hour", "bucket": recent.replace(minute=0), "clicks": 4},
+            {"restaurant_id": 2, "period": "day", "bucket": NOW - datetime.timedelta(days=800), "clicks": 7},
+        ])
+        counts = compact_click_history(connection, NOW)
+
+        assert counts["days_pruned"] == 1
+        assert rollups(connection, [1, 2], "day") == [(1, old_day, 15)]
+        assert rollups(connection, [1, 2], "hour") == [(1, recent.replace(minute=0), 4)]
+
+
+def test_clicks_lose_half_their_weight_every_half_life():
+    scores = decayed_scores([
+        (1, NOW, 4),
+        (1, NOW - datetime.timedelta(hours=24), 4),
+        (2, NOW - datetime.timedelta(hours=48), 8),
+    ], NOW, half_life_hours=24)
+
+    assert scores == {1: pytest.approx(6.0), 2: pytest.approx(2.0)}
+
+
+async def test_trending_ranks_recent_clicks_first_and_keeps_popularity_for_ties():
+    windows = []
+
+    async def load(since):
+        windows.append(since)
+        now = datetime.datetime.utcnow()
+        return [(3, now - datetime.timedelta(hours=1), 5), (4, now - datetime.timedelta(days=3), 20)]
+
+    trending = TrendingRanking(load, window=datetime.timedelta(days=7), half_life_hours=24, refresh=300)
+    await trending.update()
+    await trending.update()
+
+    # Loaded once per refresh, for the last week
+    assert len(windows) == 1
+    assert datetime.datetime.utcnow() - windows[0] == pytest.approx(datetime.timedelta(days=7), abs=datetime.timedelta(seconds=5))
+    # 5 clicks an hour ago beat 20 three days ago, the rest keep their popularity order
+    assert trending.rank([1, 2, 3, 4, 5]) == [3, 4, 1, 2, 5]
@@ -0,0 +1,85 @@
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_admin_is_not_taken_for_a_city(client):
+    response = await client.get("/admin/")
+    # Sent to the admin login rather than a 404 from the city list
+    assert response.status_code == 302
+    assert "/admin/login" in response.headers["location"]
+
+
+async def test_city_page(client, add_restaurants):
+    add_restaurants(2, city="Routeville")
+    assert (await client.get("/routeville/")).status_code == 200
+    assert (await client.get("/nowhere/")).status_code == 404
+
+
+@pytest.mark.parametrize("path", ["/login/", "/suggestion/", "/logout/"])
+async def test_other_pages_with_a_trailing_slash_are_redirected(client, path):
+    response = await client.get(path)
+    assert response.status_code == 307
+    assert response.headers["location"] == f"http://test{path.rstrip('/')}"
+
+
+async def test_admin_views_for_an_admin(client, monkeypatch):
+    async def authenticate(self, request):
+        return True
+
+    monkeypatch.setattr(main.AdminAuth, "authenticate", authenticate)
+    response = await client.get("/admin/")
+    assert response.status_code == 200
+
+
+async def test_city_seeded_by_another_process_is_found(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(main.catalog_watcher, "interval", 0)
+    assert (await client.get("/knoxtown/")).status_code == 404
+    assert "Market Square Deli" not in (await client.get("/")).text
+
+    # seed_database writes with plain statements, so only the catalog version tells the app
+    from seed_db import seed_database
+
+    path = tmp_path / "knoxtown.jsonl"
+    path.write_text('{"recid": 1, "title": "Market Square Deli", "address1": "1 Market Sq", "latitude": 35.96, "longitude": -83.92}\n')
+    seed_database(str(path), city="Knoxtown")
+
+    assert (await client.get("/knoxtown/")).status_code == 200
+    assert "Market Square Deli" in (await client.get("/")).text
+
+
+async def test_anonymous_city_page_is_shared_and_brotli_compressed(client, add_restaurants):
+    pytest.importorskip("brotli")
+    add_restaurants(3, city="Brotliville")
+
+    response = await client.get("/brotliville/", headers={"accept-encoding": "br"})
+
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "br"
+    assert response.headers["cache-control"] == "public, no-cache"
+    assert "Restaurant" in response.text
+
+
+async def test_visitor_with_a_message_gets_a_private_page(client, add_restaurants):
+    add_restaurants(3, city="Brotliville")
+
+    response = await client.get("/brotliville/?message=Thanks", headers={"accept-encoding": "gzip, br"})
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["cache-control"] == "private, no-cache"
+    assert "Thanks" in response.text
+
+
+async def test_unknown_cities_do_not_take_index_slots(client, add_restaurants):
+    add_restaurants(2, city="Nearville")
+    assert (await client.get("/api/restaurants/near?lat=35&lon=-85&city=Nearville")).status_code == 200
+    loaded = len(main.city_indexes)
+
+    for number in range(main.city_indexes.max_cities + 8):
+        response = await client.get(f"/api/restaurants/near?lat=35&lon=-85&city=bogus{number}")
+        assert response.status_code == 404
+
+    assert len(main.city_indexes) == loaded
+    assert main.city_indexes.loaded("Nearville") is not None
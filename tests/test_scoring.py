@@ -0,0 +1,76 @@
+import math
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+import main
+from scoring import CLICK_WEIGHT, PRIOR_RATING, QUALITY_WEIGHT, register_score_function, rescore, restaurant_score
+
+pytestmark = pytest.mark.anyio
+
+
+def test_few_reviews_are_pulled_towards_the_prior():
+    assert restaurant_score(0, 5.0, 3, None) < restaurant_score(0, 4.6, 400, None)
+    assert restaurant_score(0, None, None, None) == PRIOR_RATING
+    # Reviews without a rating count for nothing
+    assert restaurant_score(0, None, 50, None) == PRIOR_RATING
+
+
+def test_clicks_and_quality_add_to_the_rating():
+    base = restaurant_score(0, 4.0, 100, None)
+    assert restaurant_score(99, 4.0, 100, None) == pytest.approx(base + CLICK_WEIGHT * math.log(100))
+    assert restaurant_score(0, 4.0, 100, 50) == pytest.approx(base + QUALITY_WEIGHT * 50)
+
+
+def test_rescore_in_sql_matches_python():
+    engine = create_engine("sqlite://")
+    event.listen(engine, "connect", register_score_function)
+    rows = [(1, 0, 4.5, 120, 10.0), (2, 1000, None, None, None), (3, 7, 3.0, 2, 80.0)]
+    with engine.begin() as connection:
+        connection.exec_driver_sql(
+            "CREATE TABLE restaurants (id INTEGER PRIMARY KEY, click_count INTEGER, yelp_rating FLOAT,"
+            " yelp_review_count INTEGER, quality_score FLOAT, score FLOAT)"
+        )
+        connection.execute(
+            text("INSERT INTO restaurants VALUES (:id, :clicks, :rating, :reviews, :quality, 0)"),
+            [dict(zip(("id", "clicks", "rating", "reviews", "quality"), row)) for row in rows],
+        )
+        assert rescore(connection, [1, 3]) == 2
+        scores = dict(connection.execute(text("SELECT id, score FROM restaurants")).all())
+        assert scores[2] == 0
+        assert rescore(connection) == 3
+        scores = dict(connection.execute(text("SELECT id, score FROM restaurants")).all())
+
+    assert scores == {restaurant_id: pytest.approx(restaurant_score(*row)) for restaurant_id, *row in rows}
+
+
+def test_orm_edits_and_clicks_keep_the_stored_score(add_restaurants):
+    restaurant_id = add_restaurants(1)[0]
+    with main.SessionLocal() as db:
+        restaurant = db.get(main.Restaurant, restaurant_id)
+        restaurant.yelp_rating, restaurant.yelp_review_count = 4.8, 300
+        db.commit()
+        assert restaurant.score == pytest.approx(restaurant_score(0, 4.8, 300, None))
+
+    with main.SessionLocal() as db:
+        main.write_clicks(db, [(restaurant_id, main.datetime.utcnow())] * 3)
+        db.commit()
+        restaurant = db.get(main.Restaurant, restaurant_id)
+        assert restaurant.score == pytest.approx(restaurant_score(3, 4.8, 300, None))
+
+
+async def test_score_sort_with_a_price_range(client):
+    with main.SessionLocal() as db:
+        db.add_all([
+            main.Restaurant(name="Scored Okay", city="Scoreville", yelp_rating=4.0, yelp_review_count=200, price=1),
+            main.Restaurant(name="Scored Best", city="Scoreville", yelp_rating=4.9, yelp_review_count=500, price=1),
+            main.Restaurant(name="Scored Pricey", city="Scoreville", yelp_rating=5.0, yelp_review_count=900, price=4),
+            main.Restaurant(name="Scored Lucky", city="Scoreville", yelp_rating=5.0, yelp_review_count=2, price=1),
+        ])
+        db.commit()
+
+    page = (await client.get("/scoreville/", params={"sort": "score", "price_max": 2})).text
+
+    names = ["Scored Best", "Scored Okay", "Scored Lucky"]
+    assert "Scored Pricey" not in page
+    assert sorted(names, key=page.index) == names
@@ -0,0 +1,90 @@
+import pytest
+from sqlalchemy import delete, update
+
+import main
+from search import match_expression, search_restaurant_ids
+
+pytestmark = pytest.mark.anyio
+
+
+def add(name: str, city: str = "Searchville", categories=(), click_count: int = 0) -> int:
+    with main.SessionLocal() as db:
+        restaurant = main.Restaurant(
+            name=name,
+            location="1 Fts Way",
+            city=city,
+            click_count=click_count,
+            categories=[main.Category(name=category) for category in categories],
+        )
+        db.add(restaurant)
+        db.commit()
+        return restaurant.id
+
+
+async def search(query: str, **options) -> list[int]:
+    async with main.AsyncSessionLocal() as db:
+        return await search_restaurant_ids(db, query, **options)
+
+
+def test_match_expression_makes_every_word_a_prefix():
+    assert match_expression("Taco  BELL!") == '"taco"* "bell"*'
+    assert match_expression("  -- ") is None
+
+
+async def test_partial_words_and_accents_match():
+    restaurant_id = add("Café Quokkabar")
+
+    assert restaurant_id in await search("quokk")
+    assert restaurant_id in await search("cafe quokkabar")
+    assert restaurant_id not in await search("quokka teahouse")
+
+
+async def test_categories_are_searched_and_follow_renames():
+    restaurant_id = add("Plain Name Diner", categories=["Xylophone Noodles"])
+    assert await search("xylophone") == [restaurant_id]
+
+    with main.SessionLocal() as db:
+        db.execute(update(main.Category).where(main.Category.name == "Xylophone Noodles").values(name="Zither Noodles"))
+        db.commit()
+
+    assert await search("xylophone") == []
+    assert await search("zither") == [restaurant_id]
+
+
+async def test_edits_and_deletes_are_reindexed():
+    restaurant_id = add("Old Wombatry")
+    with main.SessionLocal() as db:
+        db.get(main.Restaurant, restaurant_id).name = "New Wombatry"
+        db.commit()
+    assert await search("new wombatry") == [restaurant_id]
+    assert await search("old wombatry") == []
+
+    with main.SessionLocal() as db:
+        db.execute(delete(main.Restaurant).where(main.Restaurant.id == restaurant_id))
+        db.commit()
+    assert await search("wombatry") == []
+
+
+async def test_city_filter():
+    here = add("Narwhal Noshery", city="Searchville")
+    there = add("Narwhal Noshery", city="Elsewhere")
+
+    assert set(await search("narwhal")) == {here, there}
+    assert await search("narwhal", city="Elsewhere") == [there]
+
+
+async def test_popularity_breaks_close_calls():
+    quiet = add("Pangolin Pantry")
+    popular = add("Pangolin Pantry", click_count=500)
+
+    assert await search("pangolin", popularity_weight=1.0) == [popular, quiet]
+    assert (await search("pangolin", limit=1)) == [popular]
+
+
+async def test_search_endpoint(client):
+    restaurant_id = add("Axolotl Arepas")
+
+    response = await client.get("/api/search", params={"q": "axolot"})
+
+    assert response.status_code == 200
+    assert [row["id"] for row in response.json()] == [restaurant_id]
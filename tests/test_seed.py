@@ -0,0 +1,60 @@
+import json
+
+import pytest
+from sqlalchemy import text
+
+from db import engine
+from search import FTS_TRIGGERS
+from seed_db import seed_database
+
+
+def feed(path, records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records))
+    return str(path)
+
+
+def record(recid, title, category="Tacos"):
+    return {
+        "recid": recid, "title": title, "address1": f"{recid} Seed St", "weburl": f"https://example.com/seed/{recid}",
+        "latitude": 36.0 + recid / 100, "longitude": -84.0, "primary_category": {"subcatname": category},
+    }
+
+
+def search(words: str) -> set[str]:
+    with engine.connect() as connection:
+        return set(connection.execute(text("""
+            SELECT restaurants.name FROM restaurants_fts JOIN restaurants ON restaurants.id = restaurants_fts.rowid
+            WHERE restaurants_fts MATCH :match
+        """), {"match": words}).scalars())
+
+
+def triggers() -> set[str]:
+    with engine.connect() as connection:
+        return set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'trigger'")).scalars())
+
+
+def test_seed_rebuilds_the_search_index(tmp_path):
+    path = feed(tmp_path / "feed.jsonl", [record(i, f"Seedling Cantina {i}", "Sprouts") for i in range(1, 6)])
+    seed_database(path, city="Seedville", chunk_size=2)
+
+    assert search("seedling") == {f"Seedling Cantina {i}" for i in range(1, 6)}
+    assert search("sprouts") == search("seedling")
+    assert triggers() >= set(FTS_TRIGGERS)
+
+    # Updates through the import are reindexed too
+    path = feed(tmp_path / "feed.jsonl", [record(1, "Sapling Cantina 1", "Sprouts")])
+    seed_database(path, city="Seedville")
+    assert "Sapling Cantina 1" in search("sapling")
+    assert "Seedling Cantina 1" not in search("seedling")
+
+
+def test_failed_seed_restores_the_search_triggers(tmp_path):
+    records = [record(100 + i, f"Halfway Grill {i}") for i in range(4)]
+    path = tmp_path / "feed.jsonl"
+    # The third record is missing its recid, so the second chunk fails
+    del records[2]["recid"]
+    with pytest.raises(KeyError):
+        seed_database(feed(path, records), city="Seedville", chunk_size=2)
+
+    assert triggers() >= set(FTS_TRIGGERS)
+    assert search("halfway") == {"Halfway Grill 0", "Halfway Grill 1"}
@@ -0,0 +1,84 @@
+import asyncio
+
+import httpx
+import pytest
+from fakeredis import aioredis as fakeredis
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+
+from sessions import MemorySessionStore, RedisSessionStore, ServerSessionMiddleware
+
+pytestmark = pytest.mark.anyio
+
+
+async def visit(request):
+    request.session["visits"] = request.session.get("visits", 0) + 1
+    return PlainTextResponse("ok")
+
+
+async def login(request):
+    request.session["user_id"] = 1
+    request.session["is_admin"] = True
+    return PlainTextResponse("ok")
+
+
+# Redis expiries are whole seconds
+TTL = 1
+
+
+@pytest.fixture(params=["memory", "redis"])
+def store(request):
+    if request.param == "redis":
+        return RedisSessionStore(fakeredis.FakeRedis(), ttl=TTL)
+    return MemorySessionStore(ttl=TTL)
+
+
+@pytest.fixture
+def session_client(store):
+    app = Starlette(routes=[Route("/visit", visit), Route("/login", login)])
+    app.add_middleware(ServerSessionMiddleware, store=store)
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def test_store_round_trip(store):
+    await store.save("abc", {"user_id": 1, "flash": ["saved"]})
+    assert await store.load("abc") == {"user_id": 1, "flash": ["saved"]}
+    assert await store.load("other") is None
+
+    await store.delete("abc")
+    assert await store.load("abc") is None
+
+
+async def test_session_expires(store):
+    await store.save("abc", {"visits": 1})
+    assert await store.load("abc") == {"visits": 1}
+
+    await asyncio.sleep(TTL * 1.5)
+    assert await store.load("abc") is None
+
+
+async def test_session_keeps_its_id_until_login(session_client, store):
+    async with session_client as client:
+        await client.get("/visit")
+        session_id = client.cookies["session"]
+        await client.get("/visit")
+        assert client.cookies["session"] == session_id
+
+        await client.get("/login")
+        assert client.cookies["session"] != session_id
+
+    assert await store.load(session_id) is None
+    assert await store.load(client.cookies["session"]) == {"visits": 2, "user_id": 1, "is_admin": True}
+
+
+async def test_planted_session_id_is_not_logged_in(session_client, store):
+    async with session_client as client:
+        await client.get("/visit")
+        planted = client.cookies["session"]
+        # The victim's browser carries the attacker's id when they log in
+        client.cookies.clear()
+        response = await client.get("/login", headers={"cookie": f"session={planted}"})
+
+    assert response.cookies["session"] != planted
+    assert await store.load(planted) is None
@@ -0,0 +1,91 @@
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+from sqlalchemy import func, select
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+EXTERNAL_WRITE_INTERVAL = 0.002
+
+
+class ExternalWriter(threading.Thread):
+    """
+    Another process writing to the database, like an import or a category merge: its own
+    connection with default settings, committing a small write every few milliseconds.
+    """
+
+    def __init__(self, path: str):
+        super().__init__(daemon=True)
+        self.path = path
+        self.writes = 0
+        self.errors: list[str] = []
+        self._stopping = threading.Event()
+
+    def run(self):
+        connection = sqlite3.connect(self.path)
+        while not self._stopping.wait(EXTERNAL_WRITE_INTERVAL):
+            try:
+                with connection:
+                    connection.execute("INSERT INTO suggested_changes (suggestion, handled) VALUES ('storage test: external', 0)")
+                self.writes += 1
+            except sqlite3.OperationalError as error:
+                self.errors.append(str(error))
+        connection.close()
+
+    def stop(self):
+        self._stopping.set()
+        self.join()
+
+
+def count(query) -> int:
+    with main.SessionLocal() as db:
+        return db.scalar(query)
+
+
+async def test_concurrent_reads_and_writes_lose_nothing(app, client, add_restaurants, monkeypatch):
+    monkeypatch.setattr(main.click_buffer, "max_batch", 20)
+    restaurant_ids = add_restaurants(10)
+    clicks_before = count(select(func.count()).select_from(main.Click).where(main.Click.restaurant_id.in_(restaurant_ids)))
+    external = ExternalWriter(main.DATABASE_URL.removeprefix("sqlite:///"))
+    rounds = 40
+
+    async def reader():
+        for _ in range(rounds):
+            assert (await client.get("/api/restaurants?limit=20")).status_code == 200
+            assert (await client.get("/admin/")).status_code in (200, 302)
+
+    async def clicker(restaurant_id):
+        for _ in range(rounds):
+            assert (await client.get(f"/restaurants/{restaurant_id}/menu")).status_code == 307
+
+    async def suggester(number):
+        for i in range(rounds // 4):
+            response = await client.post("/suggestion", data={"suggestion": f"storage test: {number}-{i}"})
+            assert response.status_code == 303
+
+    # The lifespan starts the click buffer, and flushes what is left when it ends
+    async with app.router.lifespan_context(app):
+        external.start()
+        try:
+            await asyncio.gather(
+                *(reader() for _ in range(3)),
+                *(clicker(restaurant_id) for restaurant_id in restaurant_ids[:5]),
+                *(suggester(number) for number in range(4)),
+            )
+        finally:
+            external.stop()
+
+    assert external.errors == []
+    assert external.writes > 0
+    assert main.click_buffer.dropped == 0
+    clicks = count(select(func.count()).select_from(main.Click).where(main.Click.restaurant_id.in_(restaurant_ids)))
+    assert clicks - clicks_before == 5 * rounds
+    assert count(select(func.sum(main.Restaurant.click_count)).where(main.Restaurant.id.in_(restaurant_ids[:5]))) >= 5 * rounds
+    suggestions = count(select(func.count()).select_from(main.SuggestedChanges).where(main.SuggestedChanges.suggestion.like("storage test: %-%")))
+    assert suggestions == 4 * (rounds // 4)
+    external_rows = count(select(func.count()).select_from(main.SuggestedChanges).where(main.SuggestedChanges.suggestion == "storage test: external"))
+    assert external_rows == external.writes
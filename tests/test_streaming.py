@@ -0,0 +1,59 @@
+import pytest
+
+import main
+
+pytestmark = pytest.mark.anyio
+
+
+def template_renders(name: str) -> int:
+    series = main.metrics.template_seconds.series.get((("template", name),))
+    return series[1] if series else 0
+
+
+async def test_streamed_list_page_is_timed(client, add_restaurants, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_RESTAURANT_LIST", True)
+    monkeypatch.setattr(main.page_cache, "max_bytes", 0)
+    add_restaurants(5)
+    renders = template_renders("restaurants.html")
+
+    response = await client.get("/")
+
+    assert response.status_code == 200
+    assert "Restaurant" in response.text
+    assert template_renders("restaurants.html") == renders + 1
+
+
+async def test_list_page_too_big_for_the_cache_is_streamed(client, add_restaurants, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_RESTAURANT_LIST", True)
+    monkeypatch.setattr(main.page_cache, "max_page_bytes", 1_000)
+    add_restaurants(5)
+
+    first = await client.get("/")
+    second = await client.get("/")
+
+    # Rendered for the cache once, then streamed
+    assert "etag" in first.headers
+    assert "etag" not in second.headers
+    # The same page, give or take the whitespace around the personal part
+    assert first.text.split() == second.text.split()
+    assert main.page_cache.size == 0
+
+
+async def test_streamed_list_page_holds_no_read_connection(client, add_restaurants, monkeypatch):
+    monkeypatch.setattr(main, "STREAM_RESTAURANT_LIST", True)
+    monkeypatch.setattr(main.page_cache, "max_bytes", 0)
+    add_restaurants(5)
+    checked_out = []
+    paced_rows = main.paced_rows
+
+    def recording_rows(rows, signal):
+        for row in paced_rows(rows, signal):
+            checked_out.append(main.async_engine.pool.checkedout())
+            yield row
+
+    monkeypatch.setattr(main, "paced_rows", recording_rows)
+    response = await client.get("/")
+
+    assert response.status_code == 200
+    # Every row was rendered after the request's session gave its connection back
+    assert checked_out and set(checked_out) == {0}
@@ -0,0 +1,179 @@
+import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from sqlalchemy import update
+
+import verify_urls
+from db import SessionLocal
+from models import Restaurant
+
+# Longer than the read timeout the tests use
+SLOW_SECONDS = 1.0
+HOLD_SECONDS = 0.2
+
+
+class StandInServer(ThreadingHTTPServer):
+    """
+    Stands in for restaurant websites, logging every request and how many were in
+    flight at once.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.requests: list[tuple[str, str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    def do_HEAD(self):
+        self.respond(send_body=False)
+
+    def do_GET(self):
+        self.respond(send_body=True)
+
+    def respond(self, send_body: bool):
+        server = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            status, headers = self.route()
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            body = b"<html>menu</html>"
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if send_body:
+                self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def route(self):
+        if self.path.startswith("/ok"):
+            return 200, {}
+        if self.path == "/slow":
+            time.sleep(SLOW_SECONDS)
+            return 200, {}
+        if self.path == "/redirect":
+            return 302, {"Location": "/moved"}
+        if self.path == "/moved":
+            return 200, {}
+        if self.path == "/no-head":
+            return (405 if self.command == "HEAD" else 200), {}
+        if self.path.startswith("/hold"):
+            time.sleep(HOLD_SECONDS)
+            return 200, {}
+        return 500, {}
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(verify_urls, "TIMEOUT", (1, 0.3))
+    server = StandInServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def unlimited():
+    return verify_urls.HostLimiter(concurrency=16, interval=0)
+
+
+def test_reachable_url_is_checked_with_head_only(server):
+    assert verify_urls.check_url(server.url("/ok"), unlimited())
+    assert server.requests == [("HEAD", "/ok")]
+
+
+def test_redirects_are_followed(server):
+    assert verify_urls.check_url(server.url("/redirect"), unlimited())
+    assert server.requests == [("HEAD", "/redirect"), ("HEAD", "/moved")]
+
+
+def test_falls_back_to_get_when_head_is_refused(server):
+    assert verify_urls.check_url(server.url("/no-head"), unlimited())
+    assert server.requests == [("HEAD", "/no-head"), ("GET", "/no-head")]
+
+
+def test_failing_host_is_unreachable(server):
+    assert not verify_urls.check_url(server.url("/error"), unlimited())
+    assert server.requests == [("HEAD", "/error"), ("GET", "/error")]
+
+
+def test_slow_host_times_out(server):
+    start = time.monotonic()
+    assert not verify_urls.check_url(server.url("/slow"), unlimited())
+    # Cut off by the read timeout rather than waiting for the response
+    assert time.monotonic() - start < SLOW_SECONDS * 2
+
+
+def test_closed_port_is_unreachable(server):
+    url = server.url("/ok")
+    server.server_close()
+    assert not verify_urls.check_url(url, unlimited())
+
+
+def test_requests_to_one_host_are_limited(server):
+    limiter = verify_urls.HostLimiter(concurrency=2, interval=0)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda i: verify_urls.check_url(server.url(f"/hold/{i}"), limiter), range(8)))
+
+    assert all(results)
+    assert server.max_in_flight == 2
+
+
+def test_requests_to_one_host_are_spaced(server):
+    limiter = verify_urls.HostLimiter(concurrency=4, interval=0.1)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        assert all(pool.map(lambda i: verify_urls.check_url(server.url(f"/ok/{i}"), limiter), range(4)))
+
+    # Four requests, each at least 0.1s after the one before
+    assert time.monotonic() - start >= 0.3
+
+
+def test_only_stale_websites_are_verified(server, monkeypatch):
+    monkeypatch.setattr(verify_urls, "PER_HOST_INTERVAL", 0)
+    now = datetime.datetime.utcnow()
+    with SessionLocal() as db:
+        # Restaurants from other tests have websites that can't be reached from here
+        db.execute(update(Restaurant).values(url_verified_at=now))
+        restaurants = {
+            path: Restaurant(name=f"Verify {path}", website=server.url(path), url_verified_at=verified_at)
+            for path, verified_at in (
+                ("/ok/new", None),
+                ("/redirect", now - datetime.timedelta(days=30)),
+                ("/error", now - datetime.timedelta(days=30)),
+                ("/ok/fresh", now - datetime.timedelta(days=1)),
+            )
+        }
+        db.add_all(restaurants.values())
+        db.commit()
+        ids = {path: restaurant.id for path, restaurant in restaurants.items()}
+
+    verify_urls.verify_restaurant_websites(stale_after=datetime.timedelta(days=7))
+
+    assert "/ok/fresh" not in {path for _, path in server.requests}
+    with SessionLocal() as db:
+        verified_at = {path: db.get(Restaurant, restaurant_id).url_verified_at for path, restaurant_id in ids.items()}
+    assert verified_at["/ok/new"] >= now
+    assert verified_at["/redirect"] >= now
+    assert verified_at["/error"] is None
+    assert verified_at["/ok/fresh"] < now
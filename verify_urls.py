@@ -1,69 +1,154 @@
 import os
 import datetime
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
 from sqlalchemy.orm import Session
-from sqlalchemy import create_engine
-from main import Base, Restaurant 
+from sqlalchemy import select, update, or_
+from models import Restaurant
+from db import engine
 
-# Database setup
-DATABASE_URL = os.environ["DATABASE_URL"]
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-Base.metadata.create_all(bind=engine)
+MAX_WORKERS = int(os.environ.get("VERIFY_MAX_WORKERS", 16))
+# Politeness limits: concurrent requests to one host, and the minimum gap between them
+PER_HOST_CONCURRENCY = int(os.environ.get("VERIFY_PER_HOST_CONCURRENCY", 2))
+PER_HOST_INTERVAL = float(os.environ.get("VERIFY_PER_HOST_INTERVAL", 0.5))
+# Only re-check websites that were last verified longer ago than this
+STALE_AFTER = datetime.timedelta(days=int(os.environ.get("VERIFY_STALE_DAYS", 7)))
+BATCH_SIZE = 100
+TIMEOUT = (5, 10)  # connect, read
 
 
-def check_url(url: str) -> bool:
+class HostLimiter:
     """
-    Checks if a URL is reachable by attempting both http and https versions.
-    Follows redirects and returns True if status code is 200.
+    Caps concurrent requests per host and spaces them at least `interval` seconds apart.
+    """
+
+    def __init__(self, concurrency: int, interval: float):
+        self.concurrency = concurrency
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._slots: dict[str, threading.Semaphore] = {}
+        self._next_request: dict[str, float] = {}
+
+    def acquire(self, host: str) -> None:
+        with self._lock:
+            slot = self._slots.setdefault(host, threading.Semaphore(self.concurrency))
+        slot.acquire()
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_request.get(host, now))
+            self._next_request[host] = start + self.interval
+        time.sleep(start - now)
+
+    def release(self, host: str) -> None:
+        self._slots[host].release()
+
+
+_local = threading.local()
+
+
+def http_session() -> requests.Session:
+    """
+    One session per worker thread, so connections to a host are pooled and reused.
+    """
+    if not hasattr(_local, "session"):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=PER_HOST_CONCURRENCY)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return _local.session
+
+
+def fetch_status(url: str, limiter: HostLimiter) -> int:
+    """
+    Status code for a URL after redirects. Tries a cheap HEAD first and falls back
+    to GET, without downloading the body, for servers that don't answer HEAD properly.
     """
+    host = urlsplit(url).hostname or url
+    session = http_session()
+    limiter.acquire(host)
     try:
-        # First try the given URL
-        response = requests.get(url, timeout=10, allow_redirects=True)
+        response = session.head(url, timeout=TIMEOUT, allow_redirects=True)
         if response.status_code == 200:
-            return True
-        print(f"Status {response.status_code} for {url}")
-    except Exception as e:
-        print(f"Error with {url}: {e}")
+            return 200
+        with session.get(url, timeout=TIMEOUT, allow_redirects=True, stream=True) as response:
+            return response.status_code
+    finally:
+        limiter.release(host)
 
-    # If the URL doesn't include a scheme, try both http and https
-    if not url.startswith("http://") and not url.startswith("https://"):
+
+def check_url(url: str, limiter: HostLimiter) -> bool:
+    """
+    Checks if a URL is reachable. URLs without a scheme are tried as https, then http.
+    Follows redirects and returns True if status code is 200.
+    """
+    if url.startswith("http://") or url.startswith("https://"):
+        candidates = [url]
+    else:
+        candidates = [f"https://{url}", f"http://{url}"]
+
+    for candidate in candidates:
         try:
-            # Try https version first
-            response = requests.get(f"https://{url}", timeout=10, allow_redirects=True)
-            if response.status_code == 200:
+            status = fetch_status(candidate, limiter)
+            if status == 200:
                 return True
-            # Fallback to http
-            response = requests.get(f"http://{url}", timeout=10, allow_redirects=True)
-            return response.status_code == 200
+            print(f"Status {status} for {candidate}")
         except Exception as e:
-            print(f"Both http and https failed for {url}: {e}")
-
+            print(f"Error with {candidate}: {e}")
     return False
 
 
-def verify_restaurant_websites():
+def write_results(session: Session, results: list[dict]):
+    session.execute(update(Restaurant), results)
+    session.commit()
+
+
+def verify_restaurant_websites(stale_after: datetime.timedelta = STALE_AFTER, max_workers: int = MAX_WORKERS):
+    """
+    Check every website not verified within `stale_after`, concurrently.
+
+    Reachable websites get url_verified_at stamped with the check time, unreachable ones
+    have it cleared so they are retried on the next run. Results are written in batches.
+    """
     total_urls = 0
     unsuccessful_urls = 0
+    now = datetime.datetime.utcnow()
+    limiter = HostLimiter(PER_HOST_CONCURRENCY, PER_HOST_INTERVAL)
 
     with Session(engine) as session:
-        # Query all restaurants with a website
-        restaurants = session.query(Restaurant).filter(Restaurant.website.isnot(None)).all()
-
-        for restaurant in restaurants:
-            total_urls += 1
-            url = restaurant.website.strip()
-            print(f"Checking URL: {url}")
-
-            # Check the URL
-            if not check_url(url):
-                unsuccessful_urls += 1
-                print(f"Restaurant '{restaurant.name}' has an invalid or unreachable URL: {url}")
-                # Update url_verified_at to now
-                restaurant.url_verified_at = datetime.datetime.utcnow()
-                session.add(restaurant)  # Mark for update
-
-        # Commit updates
-        session.commit()
+        # Query restaurants with a website that hasn't been verified recently
+        restaurants = session.execute(
+            select(Restaurant.id, Restaurant.name, Restaurant.website)
+            .where(Restaurant.website.isnot(None), Restaurant.website != "")
+            .where(or_(Restaurant.url_verified_at.is_(None), Restaurant.url_verified_at < now - stale_after))
+        ).all()
+        # End the read transaction, it would otherwise hold the write lock while the checks run
+        session.rollback()
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            checks = {pool.submit(check_url, restaurant.website.strip(), limiter): restaurant for restaurant in restaurants}
+            for check in as_completed(checks):
+                restaurant = checks[check]
+                total_urls += 1
+                if check.result():
+                    results.append({"id": restaurant.id, "url_verified_at": datetime.datetime.utcnow()})
+                else:
+                    unsuccessful_urls += 1
+                    print(f"Restaurant '{restaurant.name}' has an invalid or unreachable URL: {restaurant.website}")
+                    results.append({"id": restaurant.id, "url_verified_at": None})
+
+                if len(results) >= BATCH_SIZE:
+                    write_results(session, results)
+                    results = []
+
+        if results:
+            write_results(session, results)
         print("URL verification completed and updates applied.")
 
     # Print stats
@@ -74,4 +159,6 @@ def verify_restaurant_websites():
 
 
 if __name__ == "__main__":
-    verify_restaurant_websites()
+    from cli import main
+
+    main(["verify-urls"])